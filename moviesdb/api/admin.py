@@ -1,5 +1,5 @@
 from django.contrib import admin
 
-from .models import Movie, Rating, Comment
+from .models import Movie, Rating, Comment, ImportJob, Genre, Person
 
-admin.site.register([Movie, Rating, Comment])
+admin.site.register([Movie, Rating, Comment, ImportJob, Genre, Person])
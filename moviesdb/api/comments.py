@@ -0,0 +1,102 @@
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Comment, Movie
+from .rollups import update_comment_counters, update_comment_rollup
+from .trending import record_comments
+from .versions import bump_versions, comments_version_keys
+
+# Number of comments accepted by a single bulk request
+BULK_COMMENTS_MAX_ITEMS = 20000
+
+# Number of comments inserted in a single query
+# (SQLite allows at most 999 parameters per query)
+BULK_COMMENTS_BATCH_SIZE = 300
+
+
+def comments_created(comments):
+    """
+    Keep daily counts of comments, counters of comments of movies
+    and versions of comments in sync with created comments,
+    in the transaction of their insert, and count them as trending
+    """
+    update_comment_rollup(comments, sign=1)
+    update_comment_counters(comments, sign=1)
+    bump_versions(comments_version_keys(comments))
+    record_comments(comments, sign=1)
+
+
+def comments_deleted(comments):
+    """Keep derived comment data in sync with deleted comments"""
+    update_comment_rollup(comments, sign=-1)
+    update_comment_counters(comments, sign=-1)
+    bump_versions(comments_version_keys(comments))
+    record_comments(comments, sign=-1)
+
+
+def parse_comment_item(item):
+    """
+    Comment built from an item of bulk request - dict with movie_id,
+    comment_body and optional added time in ISO format (UTC if no offset).
+    Raises ValueError if the item is not valid.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("The item should be an object with movie_id and comment_body.")
+    movie_id, comment_body, added = item.get('movie_id'), item.get('comment_body'), item.get('added')
+    if not isinstance(movie_id, int) or isinstance(movie_id, bool) or not isinstance(comment_body, str):
+        raise ValueError("The item should contain the movie_id and comment_body.")
+    comment = Comment(movie_id=movie_id, comment_body=comment_body)
+    if added is not None:
+        try:
+            comment.added = parse_datetime(added) if isinstance(added, str) else None
+        except ValueError:
+            comment.added = None
+        if comment.added is None:
+            raise ValueError("The added time should be in ISO format (ie. 2019-12-31T12:00:00Z).")
+        if timezone.is_naive(comment.added):
+            comment.added = timezone.make_aware(comment.added, timezone.utc)
+    return comment
+
+
+def bulk_create_comments(items):
+    """
+    Create comments for a list of items of bulk request with bulk inserts
+    in a single transaction. Movies of all items are looked up in a single query.
+    Returns report - list of dicts with the status of each item
+    (201 with comment_id of created comment or 400 with error).
+    """
+    report = [{} for _ in items]
+    comments = []
+    for entry, item in zip(report, items):
+        try:
+            comments.append((entry, parse_comment_item(item)))
+        except ValueError as e:
+            entry.update({'status': 400, 'error': str(e)})
+
+    movie_ids = set(Movie.objects.filter(pk__in={c.movie_id for _, c in comments}).values_list('pk', flat=True))
+    for entry, comment in comments:
+        if comment.movie_id not in movie_ids:
+            entry.update({'status': 400, 'error': "The movie with this movie_id was not found."})
+    comments = [(entry, comment) for entry, comment in comments if comment.movie_id in movie_ids]
+    if not comments:
+        return report
+
+    with transaction.atomic():
+        Comment.objects.bulk_create([c for _, c in comments], batch_size=BULK_COMMENTS_BATCH_SIZE)
+
+        # Bulk inserts do not set primary keys on SQLite. The transaction holds
+        # the write lock since the first insert and autoincremented IDs grow,
+        # so the comments got consecutive IDs up to the highest one.
+        if comments[0][1].pk is None:
+            last_id = Comment.objects.aggregate(last_id=Max('pk'))['last_id']
+            for pk, (_, comment) in enumerate(comments, start=last_id - len(comments) + 1):
+                comment.pk = pk
+
+        # Bulk inserts do not send signals
+        comments_created([c for _, c in comments])
+
+    for entry, comment in comments:
+        entry.update({'status': 201, 'comment_id': comment.pk})
+    return report
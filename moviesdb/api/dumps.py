@@ -0,0 +1,166 @@
+import gzip
+import json
+
+from django.db import router, transaction
+
+from .models import COMMENT_COUNTER_FIELDS, Movie, Rating
+from .names import link_movie_names
+from .payloads import materialize_payloads
+from .search import index_movies
+from .versions import MOVIES, bump_versions
+from .serializers import model_field_names
+
+# Number of dump records written in a single transaction
+DUMP_BATCH_SIZE = 1000
+
+# Number of rows inserted or updated in a single query
+DUMP_QUERY_BATCH_SIZE = 100
+
+# Errors raised by Movie.create_from_omdb_dict on malformed values
+DECODE_ERRORS = (AttributeError, IndexError, TypeError, ValueError)
+
+
+def open_dump(path):
+    """Binary stream of the dump file, decompressed if the file is gzipped"""
+    with open(path, 'rb') as dump_file:
+        gzipped = dump_file.read(2) == b'\x1f\x8b'
+    return gzip.open(path, 'rb') if gzipped else open(path, 'rb')
+
+
+def read_dump(stream, offset=0):
+    """
+    Generator of (OMDB dict, offset) pairs read line by line from the stream
+    starting at the offset (in bytes of the uncompressed stream).
+    Offset is the position right after the line, the dict is None
+    if the line is not a valid json object.
+    """
+    stream.seek(offset)
+    for line in iter(stream.readline, b''):
+        offset += len(line)
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            omdb_dict = json.loads(line.decode('utf-8'))
+        except ValueError:
+            omdb_dict = None
+        yield (omdb_dict if isinstance(omdb_dict, dict) else None), offset
+
+
+def decode_record(omdb_dict):
+    """
+    Unsaved movie and list of ratings' dicts decoded from the OMDB dict
+    with the same rules as the responses of OMDB API,
+    or None if the record can not be loaded
+    """
+    if omdb_dict is None or omdb_dict.get('Response', "True") != "True":
+        return None
+    if not omdb_dict.get('imdbID') or not omdb_dict.get('Title'):
+        return None
+    try:
+        movie = Movie.create_from_omdb_dict(omdb_dict)
+    except DECODE_ERRORS:
+        return None
+    ratings = omdb_dict.get('Ratings')
+    if not isinstance(ratings, list):
+        ratings = []
+    # Ratings without a source or value can not be saved, so they are skipped
+    ratings = [r for r in ratings if isinstance(r, dict)
+               and isinstance(r.get('Source'), str) and isinstance(r.get('Value'), str)]
+    return movie, ratings
+
+
+def load_omdb_dump(stream, offset=0, batch_size=None, on_batch=None):
+    """
+    Load OMDB records from the stream of a JSONL dump into the database,
+    creating new movies and updating the ones with the same IMDb ID.
+    Records are written in batches, each in a single transaction,
+    so that memory use does not depend on the size of the dump.
+    on_batch is called with the stats after each committed batch,
+    their offset is where loading can be resumed from.
+    Returns the stats - counts of records read, created, updated,
+    invalid and conflicting (title taken by another movie).
+    """
+    batch_size = batch_size or DUMP_BATCH_SIZE
+    stats = {'offset': offset, 'records': 0, 'created': 0, 'updated': 0, 'invalid': 0, 'conflicts': 0}
+    batch = []
+    for omdb_dict, offset in read_dump(stream, offset):
+        stats['records'] += 1
+        decoded = decode_record(omdb_dict)
+        if decoded is None:
+            stats['invalid'] += 1
+        else:
+            batch.append(decoded)
+        if len(batch) >= batch_size:
+            save_dump_batch(batch, stats)
+            batch = []
+            stats['offset'] = offset
+            if on_batch is not None:
+                on_batch(stats)
+    if batch:
+        save_dump_batch(batch, stats)
+    if stats['offset'] != offset:
+        stats['offset'] = offset
+        if on_batch is not None:
+            on_batch(stats)
+    return stats
+
+
+def save_dump_batch(batch, stats):
+    """
+    Upsert a batch of (movie, ratings) pairs on IMDb ID in a single transaction.
+    Ratings of updated movies are replaced with the ones from the dump.
+    """
+    # Later records of the same movie replace earlier ones
+    records = {}
+    for movie, ratings in batch:
+        records.pop(movie.imdb_id, None)
+        records[movie.imdb_id] = (movie, ratings)
+
+    with transaction.atomic():
+        existing = dict(Movie.objects.filter(imdb_id__in=list(records)).values_list('imdb_id', 'pk'))
+        title_owners = dict(Movie.objects.filter(title__in=[m.title for m, _ in records.values()])
+                                         .values_list('title', 'imdb_id'))
+
+        # Titles are unique, so a movie can not take the title
+        # of another movie, either saved or earlier in the batch
+        new_movies, updated_movies, ratings_by_imdb_id = [], [], {}
+        for imdb_id, (movie, ratings) in records.items():
+            owner = title_owners.setdefault(movie.title, imdb_id)
+            if owner != imdb_id:
+                stats['conflicts'] += 1
+                continue
+            if imdb_id in existing:
+                movie.pk = existing[imdb_id]
+                updated_movies.append(movie)
+            else:
+                new_movies.append(movie)
+            ratings_by_imdb_id[imdb_id] = ratings
+
+        Movie.objects.bulk_create(new_movies, batch_size=DUMP_QUERY_BATCH_SIZE)
+        Movie.objects.bulk_update(updated_movies,
+                                  [f for f in model_field_names(Movie) if f not in COMMENT_COUNTER_FIELDS],
+                                  batch_size=DUMP_QUERY_BATCH_SIZE)
+        # Ratings are deleted without signals, which would render the payload
+        # and bump the version of movies once per deleted rating
+        Rating.objects.filter(movie__in=[m.pk for m in updated_movies])._raw_delete(router.db_for_write(Rating))
+
+        # Bulk inserts do not set primary keys on all databases
+        # so IDs of the new movies are fetched by their IMDb IDs
+        if new_movies:
+            existing.update(Movie.objects.filter(imdb_id__in=[m.imdb_id for m in new_movies])
+                                         .values_list('imdb_id', 'pk'))
+        Rating.objects.bulk_create(
+            (Rating.create_from_rating_dict(Movie(pk=existing[imdb_id]), rating_dict)
+             for imdb_id, ratings in ratings_by_imdb_id.items() for rating_dict in ratings),
+            batch_size=DUMP_QUERY_BATCH_SIZE)
+        for movie in new_movies:
+            movie.pk = existing[movie.imdb_id]
+
+        # Bulk writes do not send signals
+        link_movie_names(new_movies + updated_movies, replace=bool(updated_movies))
+        materialize_payloads(m.pk for m in new_movies + updated_movies)
+        index_movies(new_movies + updated_movies)
+        bump_versions([MOVIES])
+    stats['created'] += len(new_movies)
+    stats['updated'] += len(updated_movies)
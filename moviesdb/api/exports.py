@@ -0,0 +1,130 @@
+import csv
+import io
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.db.models.functions import Cast
+
+from .models import Comment, Movie, Rating
+from .serializers import model_field_names
+
+# Exported tables: model and the name of the ID column
+EXPORTS = {
+    'movies': (Movie, 'movie_id'),
+    'comments': (Comment, 'comment_id'),
+    'ratings': (Rating, 'rating_id'),
+}
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+# Number of rows read in a single query (and encoded at once)
+EXPORT_CHUNK_SIZE = 5000
+
+
+def export_columns(name):
+    """Names of the exported columns, as in payloads of the API (IDs first)"""
+    model, id_column = EXPORTS[name]
+    return [id_column] + model_field_names(model)
+
+
+def format_time(value, default=DjangoJSONEncoder().default):
+    """
+    Time read from the database formatted as in json payloads.
+    Times are read from SQLite as the text they are stored as (in UTC,
+    with microseconds if they are not zero) and reformatted without parsing.
+    """
+    if isinstance(value, str):
+        return value[:10] + 'T' + value[11:23] + 'Z'
+    return default(value) if value is not None else None
+
+
+def format_date(value, default=DjangoJSONEncoder().default):
+    """Date read from the database formatted as in json payloads"""
+    return value if value is None or isinstance(value, str) else default(value)
+
+
+def export_chunks(name, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Generator of lists of rows (lists of values of the columns)
+    of the whole table, read in chunks following primary keys,
+    with dates and times formatted as in json payloads.
+    All chunks are read in a single transaction, so they are
+    a consistent snapshot of the table, while memory use
+    does not depend on the size of the table.
+    Rows are read with the cursor, skipping conversion of values
+    to python objects, which would take most of the time.
+    """
+    model, _ = EXPORTS[name]
+
+    # Columns are selected as expressions, which are selected in the order
+    # they are listed (after fields, which would be selected first)
+    columns, formatters = [], []
+    for index, field in enumerate(model_field_names(model), start=1):
+        field = model._meta.get_field(field)
+        column = F(field.name)
+        if isinstance(field, models.DateField):
+            formatters.append((index, format_time if isinstance(field, models.DateTimeField) else format_date))
+
+            # Columns of dates and times are converted to python objects
+            # by their declared types, which expressions do not have
+            if connection.vendor == 'sqlite':
+                column = Cast(field.name, models.TextField())
+        columns.append(column)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        last_id = 0
+        while True:
+            query = model.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', *columns)[:chunk_size]
+            cursor.execute(*query.query.sql_with_params())
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            if formatters:
+                rows = [list(row) for row in rows]
+                for row in rows:
+                    for index, formatter in formatters:
+                        row[index] = formatter(row[index])
+            yield rows
+
+
+def encode_ndjson(columns, chunks):
+    """Generator of pieces of json lines, an object per row"""
+    encode = json.JSONEncoder().encode
+    for rows in chunks:
+        yield ''.join(encode(dict(zip(columns, row))) + '\n' for row in rows)
+
+
+def encode_csv(columns, chunks):
+    """Generator of pieces of csv with a header row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_stream(name, export_format, chunks=None):
+    """Generator of pieces of the export of the table encoded in the format"""
+    encode = encode_csv if export_format == 'csv' else encode_ndjson
+    return encode(export_columns(name), chunks if chunks is not None else export_chunks(name))
+
+
+def gzip_stream(pieces):
+    """Generator compressing the pieces of text to gzip as they are read"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for piece in pieces:
+        compressed = compressor.compress(piece.encode('utf-8'))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
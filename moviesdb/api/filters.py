@@ -0,0 +1,63 @@
+from .models import name_key
+
+# Values of the order_by parameter of movies listing
+# mapped to the fields movies are sorted by
+MOVIE_ORDERINGS = {'imdb_rating': 'imdb_rating',
+                   'year': 'release_year',
+                   'runtime': 'runtime_minutes',
+                   'title': 'title',
+                   'comment_count': 'comment_count'}
+
+
+class FilterError(ValueError):
+    pass
+
+
+def get_fields(params, allowed):
+    """
+    Set of names of fields listed by the comma separated fields parameter,
+    None if the parameter was not provided (all fields are listed)
+    """
+    if 'fields' not in params:
+        return None
+    fields = {f.strip() for f in params['fields'].split(',') if f.strip()}
+    unknown = fields - set(allowed)
+    if not fields or unknown:
+        raise FilterError("The fields parameter should be a comma separated list of: {0}.".format(', '.join(allowed)))
+    return fields
+
+
+def filter_movies(queryset, params):
+    """
+    Query set of movies narrowed with the genre, actor, director,
+    year_min and year_max query parameters, if provided
+    """
+    for param, relation in (('genre', 'genres'), ('actor', 'cast'), ('director', 'directors')):
+        if params.get(param):
+            queryset = queryset.filter(**{relation + '__key': name_key(params[param])})
+    try:
+        year_min = int(params['year_min']) if params.get('year_min') else None
+        year_max = int(params['year_max']) if params.get('year_max') else None
+    except ValueError:
+        raise FilterError("The year_min and year_max parameters should be integers.")
+    if year_min is not None:
+        queryset = queryset.filter(release_year__gte=year_min)
+    if year_max is not None:
+        queryset = queryset.filter(release_year__lte=year_max)
+    return queryset
+
+
+def get_ordering(params, orderings):
+    """
+    Parse the order_by parameter (prefixed with - for descending order).
+    Returns (field, descending) pair or None if the parameter was not provided.
+    """
+    order_by = params.get('order_by')
+    if not order_by:
+        return None
+    descending = order_by.startswith('-')
+    field = orderings.get(order_by.lstrip('-'))
+    if field is None:
+        raise FilterError("The order_by parameter should be one of: {0} "
+                          "(prefixed with - for descending order).".format(', '.join(orderings)))
+    return field, descending
@@ -0,0 +1,225 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .instrumentation import bind_metrics
+from .models import Movie, Rating
+from .names import link_movie_names
+from .payloads import materialize_payloads
+from .search import index_movies
+from .versions import MOVIES, bump_versions
+from .omdb import OMDBError, RateLimiter, fetch_by_title, normalize_title
+from .serializers import serialize_movie
+
+# Number of fetched movies saved in a single transaction by bulk import
+BULK_CHUNK_SIZE = 200
+
+# Number of rows inserted in a single query by bulk import
+BULK_BATCH_SIZE = 100
+
+# Number of titles accepted by a single bulk import request
+BULK_IMPORT_MAX_TITLES = 1000
+
+
+class SingleFlight:
+    """
+    Coalescing of concurrent calls with the same key:
+    only the first call runs the function, the calls made
+    while it is running wait for it and share its result
+    """
+
+    class Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func):
+        """
+        Result of the function called with the key
+        and whether it was shared with the call already in flight
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            shared = call is not None
+            if not shared:
+                call = self.calls[key] = self.Call()
+        if shared:
+            call.done.wait()
+        else:
+            try:
+                call.result = func()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+        if call.error is not None:
+            raise call.error
+        return call.result, shared
+
+
+# Imports of movies currently in flight, by normalized title
+movie_imports = SingleFlight()
+
+
+def import_movie(title):
+    """
+    Create movie record and related rating records in the database
+    with data of the movie with provided title fetched from OMDB.
+    Concurrent imports of the same title share one fetch and insert.
+    Returns response dict with the content and status of the outcome.
+    """
+    response, shared = movie_imports.do(normalize_title(title), lambda: fetch_and_create_movie(title))
+
+    # Movie created by the import in flight already exists
+    # for the requests which have joined it
+    if shared and response['status'] == 201:
+        return {'content': {'error': "The movie with this title is in the database."},
+                'status': 409}
+    return response
+
+
+def fetch_and_create_movie(title):
+    """Fetch the movie with the title from OMDB and save it with its ratings"""
+    try:
+        omdb_response_dict = fetch_by_title(title)
+    except OMDBError as e:
+        return {'content': {'error': str(e)},
+                'status': 400}
+
+    if omdb_response_dict.get('Response') != "True":
+        return {'content': {'error': "The movie with this title was not found."},
+                'status': 404}
+    return create_movie(omdb_response_dict)
+
+
+def create_movie(omdb_response_dict):
+    """Save the movie from OMDB response dict with its ratings, unless it exists"""
+    if Movie.objects.filter(title=omdb_response_dict.get('Title')).exists():
+        return {'content': {'error': "The movie with this title is in the database."},
+                'status': 409}
+    try:
+        # Movie is saved along with its ratings, unless
+        # a movie with the same title was saved concurrently
+        with transaction.atomic():
+            new_movie = Movie.create_from_omdb_dict(omdb_response_dict)
+            new_movie.save()
+
+            # Along with the movie record create related rating records,
+            # inserted at once and without signals, so the payload of the movie
+            # is rendered again once rather than after each rating (version
+            # of movies has been bumped by saving the movie)
+            Rating.objects.bulk_create(Rating.create_from_rating_dict(new_movie, rating_dict)
+                                       for rating_dict in omdb_response_dict.get('Ratings', []))
+            materialize_payloads([new_movie.pk])
+    except IntegrityError:
+        return {'content': {'error': "The movie with this title is in the database."},
+                'status': 409}
+    return {'content': serialize_movie(movie=new_movie),
+            'status': 201}
+
+
+def bulk_import_movies(titles, parallelism=None, rate_limit=None, chunk_size=None):
+    """
+    Import movies with provided titles fetching them from OMDB concurrently
+    and saving them in chunks, each in a single transaction.
+    Returns report - list of dicts with the title, status of its import
+    (as the status of single import) and movie_id or error.
+    """
+    parallelism = parallelism or settings.OMDB_BULK_PARALLELISM
+    rate_limit = rate_limit if rate_limit is not None else settings.OMDB_RATE_LIMIT
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+
+    # Each title is fetched once, repeated titles are reported as existing
+    report = [{'title': title} for title in titles]
+    first_by_key = {}
+    for entry in report:
+        first_by_key.setdefault(normalize_title(entry['title']), entry)
+    unique = list(first_by_key.values())
+
+    def fetch(entry):
+        try:
+            return entry, fetch_by_title(entry['title'], rate_limiter=rate_limiter)
+        except OMDBError as e:
+            return entry, e
+
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='omdb-fetch') as executor:
+        chunk = []
+        for entry, omdb_dict in executor.map(bind_metrics(fetch), unique):
+            if isinstance(omdb_dict, OMDBError):
+                entry.update({'status': 400, 'error': str(omdb_dict)})
+            elif omdb_dict.get('Response') != "True":
+                entry.update({'status': 404, 'error': "The movie with this title was not found."})
+            else:
+                chunk.append((entry, omdb_dict))
+            if len(chunk) >= chunk_size:
+                save_movies_chunk(chunk)
+                chunk = []
+        if chunk:
+            save_movies_chunk(chunk)
+
+    for entry in report:
+        first = first_by_key[normalize_title(entry['title'])]
+        if first is not entry:
+            entry.update({k: v for k, v in first.items() if k != 'title'})
+            if entry['status'] == 201:
+                entry.update({'status': 409, 'error': "The movie with this title is in the database."})
+    return report
+
+
+def save_movies_chunk(chunk):
+    """
+    Save movies and their ratings for a chunk of (report entry, OMDB dict) pairs
+    with bulk inserts in a single transaction, updating the report entries
+    """
+    try:
+        with transaction.atomic():
+            # Movies already in the database or repeated in the chunk are skipped
+            existing = set(Movie.objects.filter(title__in=[d.get('Title') for _, d in chunk])
+                                        .values_list('title', flat=True))
+            new_movies = {}
+            for entry, omdb_dict in chunk:
+                title = omdb_dict.get('Title')
+                if title in existing or title in new_movies:
+                    entry.update({'status': 409, 'error': "The movie with this title is in the database."})
+                else:
+                    new_movies[title] = (entry, omdb_dict, Movie.create_from_omdb_dict(omdb_dict))
+            Movie.objects.bulk_create([movie for _, _, movie in new_movies.values()],
+                                      batch_size=BULK_BATCH_SIZE)
+
+            # Bulk inserts do not set primary keys on all databases
+            # so IDs of the new movies are fetched by their unique titles
+            movie_ids = dict(Movie.objects.filter(title__in=list(new_movies)).values_list('title', 'pk'))
+            ratings = []
+            for title, (entry, omdb_dict, movie) in new_movies.items():
+                movie.pk = movie_ids[title]
+                ratings += [Rating.create_from_rating_dict(movie, r) for r in omdb_dict.get('Ratings', [])]
+                entry.update({'status': 201, 'movie_id': movie.pk})
+            Rating.objects.bulk_create(ratings, batch_size=BULK_BATCH_SIZE)
+
+            # Bulk inserts do not send signals
+            link_movie_names([movie for _, _, movie in new_movies.values()])
+            materialize_payloads(movie.pk for _, _, movie in new_movies.values())
+            index_movies([movie for _, _, movie in new_movies.values()])
+            bump_versions([MOVIES])
+    except IntegrityError:
+        # A movie of the chunk was saved concurrently,
+        # so the chunk is saved movie by movie instead
+        for entry, omdb_dict in chunk:
+            response = create_movie(omdb_dict)
+            entry.update({'status': response['status']})
+            entry.pop('error', None)
+            entry.pop('movie_id', None)
+            if response['status'] == 201:
+                entry['movie_id'] = response['content']['movie_id']
+            else:
+                entry['error'] = response['content']['error']
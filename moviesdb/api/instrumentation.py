@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from functools import wraps
+
+# Number of the latest latencies of each endpoint the percentiles are computed from
+LATENCY_SAMPLES = 1000
+
+LATENCY_PERCENTILES = (50, 95, 99)
+
+_metrics = ContextVar('api_request_metrics', default=None)
+_section = ContextVar('api_timed_section', default=None)
+
+
+class RequestMetrics:
+    """
+    Numbers and times of SQL queries and times of timed sections
+    (e.g. serialization, OMDB requests) of a single request.
+    Sections timed by several threads at once add up their times.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.sections = {}
+
+    def add_section(self, name, duration):
+        with self.lock:
+            self.sections[name] = self.sections.get(name, 0.0) + duration
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper counting queries and their time"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            with self.lock:
+                self.queries += 1
+                self.db_time += duration
+
+
+def get_metrics():
+    """Metrics of the request handled in the current context (None outside of requests)"""
+    return _metrics.get()
+
+
+def set_metrics(metrics):
+    """Make the metrics current, returns the token to reset them with"""
+    return _metrics.set(metrics)
+
+
+def reset_metrics(token):
+    _metrics.reset(token)
+
+
+def timed_section(name):
+    """
+    Decorator adding the time of the function calls to the section
+    of metrics of the current request, excluding the time of SQL queries
+    run by the function. Calls nested in the same section are timed once.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            metrics = _metrics.get()
+            if metrics is None or _section.get() == name:
+                return func(*args, **kwargs)
+            token = _section.set(name)
+            started, db_time = time.perf_counter(), metrics.db_time
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _section.reset(token)
+                metrics.add_section(name, time.perf_counter() - started - (metrics.db_time - db_time))
+        return wrapper
+    return decorator
+
+
+def bind_metrics(func):
+    """
+    Function calling func with metrics of the current request,
+    to be run by other threads (e.g. of a thread pool)
+    """
+    metrics = _metrics.get()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _metrics.set(metrics)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _metrics.reset(token)
+    return wrapper
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank p-th percentile of a non-empty sorted list"""
+    return sorted_values[max(0, -(-p * len(sorted_values) // 100) - 1)]
+
+
+class LatencyStats:
+    """
+    Rolling latencies of the latest requests of each endpoint
+    handled by this process, with their percentiles
+    """
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.samples = samples
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.latencies = {}
+            self.counts = {}
+
+    def record(self, endpoint, duration):
+        with self.lock:
+            latencies = self.latencies.get(endpoint)
+            if latencies is None:
+                latencies = self.latencies[endpoint] = deque(maxlen=self.samples)
+                self.counts[endpoint] = 0
+            latencies.append(duration)
+            self.counts[endpoint] += 1
+
+    def as_dict(self):
+        """Map of endpoints to numbers of requests and percentiles of latencies in milliseconds"""
+        with self.lock:
+            snapshot = {endpoint: (self.counts[endpoint], sorted(latencies))
+                        for endpoint, latencies in self.latencies.items()}
+        stats = {}
+        for endpoint, (count, latencies) in snapshot.items():
+            stats[endpoint] = {'count': count, 'samples': len(latencies)}
+            for p in LATENCY_PERCENTILES:
+                stats[endpoint]['p{0}_ms'.format(p)] = round(percentile(latencies, p) * 1000, 3)
+        return stats
+
+
+latency_stats = LatencyStats()
@@ -0,0 +1,125 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from .imports import import_movie
+from .models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Shared pool of threads running movie imports"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.MOVIE_IMPORT_WORKERS,
+                                           thread_name_prefix='movie-import')
+        return _executor
+
+
+def enqueue_import(title):
+    """Create pending import job of the movie with the title and schedule it"""
+    job = ImportJob.objects.create(title=title)
+
+    # Job is only picked up by a worker once it is committed
+    transaction.on_commit(lambda: get_executor().submit(run_next_job))
+    return job
+
+
+def resume_import_jobs():
+    """
+    Schedule pending jobs and jobs left running for too long
+    (e.g. by a process that has been restarted).
+    Returns the number of scheduled jobs.
+    """
+    stale_before = now() - timedelta(seconds=settings.MOVIE_IMPORT_STALE_AFTER)
+    stale = ImportJob.objects.filter(status=ImportJob.RUNNING, updated__lt=stale_before)
+    if stale.exists():
+        stale.update(status=ImportJob.PENDING, updated=now())
+    pending = ImportJob.objects.filter(status=ImportJob.PENDING).count()
+    for _ in range(pending):
+        get_executor().submit(run_next_job)
+    return pending
+
+
+def claim_next_job():
+    """Mark the oldest pending job as running and return it (None if there are no pending jobs)"""
+    while True:
+        job = ImportJob.objects.filter(status=ImportJob.PENDING).order_by('pk').first()
+        if job is None:
+            return None
+
+        # Job could have been claimed by another worker in the meantime
+        claimed = ImportJob.objects.filter(pk=job.pk, status=ImportJob.PENDING).update(
+            status=ImportJob.RUNNING, updated=now())
+        if claimed:
+            return job
+
+
+def run_next_job():
+    """Worker task importing the movie of the oldest pending job"""
+    try:
+        job = claim_next_job()
+        if job is not None:
+            run_job(job)
+    except Exception:
+        logger.exception("Movie import job failed")
+    finally:
+        # Worker threads do not take part in request cycle
+        # so their database connections are closed explicitly
+        connection.close()
+
+
+def run_job(job):
+    """Import the movie of the job and store the outcome in the job"""
+    try:
+        response = import_movie(job.title)
+    except Exception as e:
+        logger.exception("Import of %s failed", job.title)
+        response = {'content': {'error': "Unexpected error: {0}".format(e)},
+                    'status': 500}
+    job.result_status = response['status']
+    if response['status'] == 201:
+        job.status = ImportJob.SUCCEEDED
+        job.movie_id = response['content']['movie_id']
+    else:
+        job.status = ImportJob.FAILED
+        job.error = response['content'].get('error')
+    job.updated = now()
+    job.save(update_fields=['status', 'movie', 'result_status', 'error', 'updated'])
+
+
+def resume_import_jobs_task():
+    """Worker task resuming jobs left by a previous run of the server"""
+    try:
+        resumed = resume_import_jobs()
+        if resumed:
+            logger.info("Resumed %d movie import jobs", resumed)
+    except Exception:
+        logger.exception("Resuming movie import jobs failed")
+    finally:
+        connection.close()
+
+
+def serialize_job(job):
+    """Custom function to create json response payload for an import job"""
+    job_dict = {'job_id': job.pk,
+                'title': job.title,
+                'status': job.status,
+                'movie_id': job.movie_id,
+                'result_status': job.result_status,
+                'error': job.error,
+                'created': job.created,
+                'updated': job.updated}
+
+    # Remove null values
+    return {k: v for (k, v) in job_dict.items() if v is not None}
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.rollups import find_comment_rollup_mismatches
+
+
+class Command(BaseCommand):
+    help = "Check if daily counts of comments are consistent with the comments table"
+
+    def handle(self, *args, **options):
+        mismatches = find_comment_rollup_mismatches()
+        for movie_id, day, expected, actual in mismatches:
+            self.stdout.write("Movie {0} on {1}: {2} comments, {3} in daily counts.".format(
+                movie_id, day, expected, actual))
+        if mismatches:
+            raise CommandError("Found {0} inconsistent daily counts of comments. "
+                               "Run rebuild_comment_rollup command to fix them.".format(len(mismatches)))
+        self.stdout.write(self.style.SUCCESS("Daily counts of comments are consistent."))
@@ -0,0 +1,47 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.exports import EXPORT_FORMATS, EXPORTS, export_chunks, export_stream, gzip_stream
+
+
+class Command(BaseCommand):
+    help = ("Export the whole table of movies, comments or ratings as json lines or csv "
+            "(the same way as api/export/), read in a single transaction")
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(EXPORTS))
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', help="File the export is written to (standard output by default)")
+        parser.add_argument('--gzip', action='store_true', help="Compress the export with gzip")
+
+    def handle(self, *args, **options):
+        name = options['name']
+        rows = 0
+
+        def counted(chunks):
+            nonlocal rows
+            for chunk in chunks:
+                rows += len(chunk)
+                yield chunk
+
+        pieces = export_stream(name, options['format'], counted(export_chunks(name)))
+        if options['gzip']:
+            pieces = gzip_stream(pieces)
+        started = time.perf_counter()
+        try:
+            output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        except OSError as e:
+            raise CommandError("Could not open the output file: {0}".format(e))
+        try:
+            for piece in pieces:
+                output.write(piece if isinstance(piece, bytes) else piece.encode('utf-8'))
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
+        elapsed = time.perf_counter() - started
+        self.stderr.write(self.style.SUCCESS("Exported {0} {1} in {2:.1f} s ({3:.0f} rows/s).".format(
+            rows, name, elapsed, rows / elapsed if elapsed else 0)))
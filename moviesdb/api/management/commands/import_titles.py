@@ -0,0 +1,42 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.imports import bulk_import_movies
+
+STATUS_NAMES = {201: 'created', 400: 'failed', 404: 'not found', 409: 'exists'}
+
+
+class Command(BaseCommand):
+    help = "Import movies from OMDB for titles listed in a file, one title per line"
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="Path of the file with titles")
+        parser.add_argument('--parallelism', type=int, help="Number of concurrent OMDB requests")
+        parser.add_argument('--rate-limit', type=float, help="Limit of OMDB requests per second (0 for no limit)")
+        parser.add_argument('--chunk-size', type=int, help="Number of movies saved in a single transaction")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['file'], encoding='utf-8') as titles_file:
+                titles = [line.strip() for line in titles_file if line.strip()]
+        except OSError as e:
+            raise CommandError("Could not read the titles file: {0}".format(e))
+
+        started = time.perf_counter()
+        report = bulk_import_movies(titles,
+                                    parallelism=options['parallelism'],
+                                    rate_limit=options['rate_limit'],
+                                    chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+
+        for entry in report:
+            self.stdout.write("{0}\t{1}\t{2}".format(STATUS_NAMES.get(entry['status'], entry['status']),
+                                                     entry['title'],
+                                                     entry.get('movie_id', entry.get('error', ''))))
+        counts = Counter(STATUS_NAMES.get(entry['status'], entry['status']) for entry in report)
+        self.stdout.write(self.style.SUCCESS(
+            "Imported {0} titles in {1:.1f} s ({2:.0f} titles/min): {3}.".format(
+                len(report), elapsed, len(report) / elapsed * 60 if elapsed else 0,
+                ', '.join('{0} {1}'.format(n, name) for name, n in sorted(counts.items())))))
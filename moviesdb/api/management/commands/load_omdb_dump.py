@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.dumps import load_omdb_dump, open_dump
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+def peak_rss():
+    """Peak resident set size of the process in bytes (None if unknown)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def read_checkpoint(path):
+    try:
+        with open(path, encoding='utf-8') as checkpoint_file:
+            return int(checkpoint_file.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError) as e:
+        raise CommandError("Could not read the checkpoint file: {0}".format(e))
+
+
+def write_checkpoint(path, offset):
+    # Checkpoint is replaced atomically, so it is never left half written
+    with open(path + '.tmp', 'w', encoding='utf-8') as checkpoint_file:
+        checkpoint_file.write(str(offset))
+    os.replace(path + '.tmp', path)
+
+
+class Command(BaseCommand):
+    help = ("Load movies from a dump of OMDB records, one json object per line "
+            "(optionally gzip-compressed), creating or updating them by IMDb ID")
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="Path of the dump file")
+        parser.add_argument('--batch-size', type=int, help="Number of records written in a single transaction")
+        parser.add_argument('--offset', type=int,
+                            help="Byte offset (in the uncompressed dump) to start loading from")
+        parser.add_argument('--checkpoint',
+                            help="Path of the file storing the offset of the last written batch; "
+                                 "loading resumes from it if the file exists")
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        offset = options['offset']
+        if offset is None:
+            offset = read_checkpoint(checkpoint) if checkpoint else 0
+
+        def on_batch(stats):
+            if checkpoint:
+                write_checkpoint(checkpoint, stats['offset'])
+            if options['verbosity'] > 1:
+                self.stdout.write("{records} records read, offset {offset}".format(**stats))
+
+        started = time.perf_counter()
+        try:
+            with open_dump(options['file']) as stream:
+                stats = load_omdb_dump(stream, offset=offset, batch_size=options['batch_size'],
+                                       on_batch=on_batch)
+        except OSError as e:
+            raise CommandError("Could not read the dump file: {0}".format(e))
+        elapsed = time.perf_counter() - started
+
+        rss = peak_rss()
+        self.stdout.write(self.style.SUCCESS(
+            "Loaded {records} records in {0:.1f} s ({1:.0f} records/s, {2:.1f} MB/s): "
+            "{created} created, {updated} updated, {invalid} invalid, {conflicts} conflicts. "
+            "Peak RSS: {3}. Offset: {offset}.".format(
+                elapsed,
+                stats['records'] / elapsed if elapsed else 0,
+                (stats['offset'] - offset) / elapsed / 2 ** 20 if elapsed else 0,
+                '{0:.1f} MB'.format(rss / 2 ** 20) if rss is not None else 'unknown',
+                **stats)))
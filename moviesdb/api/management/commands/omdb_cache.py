@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.omdb import get_cache
+
+
+class Command(BaseCommand):
+    help = "Show statistics of the OMDB responses cache or clear it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help="Remove all cached responses")
+
+    def handle(self, *args, **options):
+        cache = get_cache()
+        if cache is None:
+            raise CommandError("OMDB cache is disabled.")
+        if options['clear']:
+            cache.clear()
+            self.stdout.write(self.style.SUCCESS("OMDB cache cleared."))
+        for name, value in cache.stats().items():
+            self.stdout.write("{0}: {1}".format(name, value))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.rollups import find_comment_counter_mismatches, rebuild_comment_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute counters of comments of movies (comment_count and last_comment_at) from the comments table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only check if the counters are consistent with the comments table")
+
+    def handle(self, *args, **options):
+        if options['check']:
+            mismatches = find_comment_counter_mismatches()
+            if mismatches:
+                for movie_id, expected, actual, expected_last, actual_last in mismatches:
+                    self.stderr.write("Movie {0}: {1} comments (last at {2}) counted as {3} (last at {4})".format(
+                        movie_id, expected, expected_last, actual, actual_last))
+                raise CommandError("{0} movies have inconsistent counters of comments.".format(len(mismatches)))
+            self.stdout.write(self.style.SUCCESS("Counters of comments are consistent with the comments table."))
+            return
+        repaired = rebuild_comment_counters()
+        self.stdout.write(self.style.SUCCESS("Recomputed counters of comments, {0} movies repaired.".format(repaired)))
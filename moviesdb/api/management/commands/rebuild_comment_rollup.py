@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.rollups import rebuild_comment_rollup
+
+
+class Command(BaseCommand):
+    help = "Rebuild daily counts of comments from scratch from the comments table"
+
+    def handle(self, *args, **options):
+        rows = rebuild_comment_rollup()
+        self.stdout.write(self.style.SUCCESS("Rebuilt {0} daily counts of comments.".format(rows)))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from api.models import Movie
+from api.search import check_search_index, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of movies (used by api/search/) from the movies table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only check if the index is consistent with the movies table")
+
+    def handle(self, *args, **options):
+        if options['check']:
+            try:
+                missing, stale = check_search_index()
+            except DatabaseError as e:
+                raise CommandError("Search index is corrupt: {0}".format(e))
+            if missing or stale:
+                raise CommandError("Search index is not consistent with the movies table: "
+                                   "{0} movies missing, {1} deleted movies indexed.".format(missing, stale))
+            self.stdout.write(self.style.SUCCESS("Search index is consistent with the movies table."))
+            return
+        rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt for {0} movies.".format(Movie.objects.count())))
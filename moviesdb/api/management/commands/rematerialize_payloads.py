@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.payloads import rematerialize_payloads
+
+
+class Command(BaseCommand):
+    help = "Render stored json payloads of all movies (listed by api/movies/) again, e.g. after their format changed"
+
+    def handle(self, *args, **options):
+        rendered = rematerialize_payloads()
+        self.stdout.write(self.style.SUCCESS("Rendered payloads of {0} movies.".format(rendered)))
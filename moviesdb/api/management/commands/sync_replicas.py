@@ -0,0 +1,33 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.utils import ConnectionDoesNotExist
+
+from api.routers import sync_replica
+
+
+class Command(BaseCommand):
+    help = ("Copy the primary sqlite database to its replicas listed in DATABASE_REPLICAS "
+            "(a stand-in for replication, e.g. for running with replicas locally)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help="Keep copying the database every this number of seconds")
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas are listed in DATABASE_REPLICAS.")
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                started = time.perf_counter()
+                try:
+                    sync_replica(alias)
+                except (ConnectionDoesNotExist, ValueError, sqlite3.Error) as e:
+                    raise CommandError("Could not copy the database to {0}: {1}".format(alias, e))
+                self.stdout.write("Copied the database to {0} in {1:.3f} s.".format(
+                    alias, time.perf_counter() - started))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
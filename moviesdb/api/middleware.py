@@ -0,0 +1,123 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from .instrumentation import RequestMetrics, latency_stats, reset_metrics, set_metrics
+from .routers import (PRIMARY_COOKIE, SAFE_METHODS, RoutingState, read_your_writes_seconds, reset_routing,
+                      set_routing)
+
+logger = logging.getLogger('api.performance')
+
+# Sections timed by instrumentation.timed_section listed in Server-Timing header
+TIMED_SECTIONS = ('serialization', 'omdb')
+
+
+class PerformanceMiddleware:
+    """
+    Middleware recording the number and time of SQL queries, times of
+    serialization and OMDB requests and the size of each response.
+    They are sent in Server-Timing header and logged as a json line
+    by api.performance logger (at INFO level), and latencies are added
+    to the per-endpoint percentiles of api/_stats/. Queries are counted
+    with execute wrappers of database connections, so DEBUG is not needed.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        with self.instrumented(metrics):
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        endpoint = match.view_name if match is not None else None
+        if response.streaming:
+            # Streamed content is read from the database as it is sent,
+            # the request is recorded when the stream is exhausted
+            response.streaming_content = self.counted_stream(response.streaming_content, metrics,
+                                                             request, endpoint, response.status_code)
+            response['Server-Timing'] = self.server_timing(metrics, time.perf_counter() - metrics.started)
+        else:
+            duration = time.perf_counter() - metrics.started
+            response['Server-Timing'] = self.server_timing(metrics, duration)
+            self.record(metrics, request, endpoint, response.status_code, len(response.content), duration)
+        return response
+
+    @staticmethod
+    def instrumented(metrics):
+        """Context of the current metrics wrapping queries of all database connections"""
+        stack = ExitStack()
+        token = set_metrics(metrics)
+        stack.callback(reset_metrics, token)
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics))
+        return stack
+
+    def counted_stream(self, content, metrics, request, endpoint, status):
+        size = 0
+        with self.instrumented(metrics):
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        self.record(metrics, request, endpoint, status, size, time.perf_counter() - metrics.started)
+
+    @staticmethod
+    def server_timing(metrics, duration):
+        timings = ['db;dur={0:.2f};desc="{1} {2}"'.format(metrics.db_time * 1000, metrics.queries,
+                                                          'query' if metrics.queries == 1 else 'queries')]
+        timings.extend('{0};dur={1:.2f}'.format(name, metrics.sections.get(name, 0.0) * 1000)
+                       for name in TIMED_SECTIONS)
+        timings.append('total;dur={0:.2f}'.format(duration * 1000))
+        return ', '.join(timings)
+
+    @staticmethod
+    def record(metrics, request, endpoint, status, size, duration):
+        if endpoint is not None:
+            latency_stats.record(endpoint, duration)
+        if logger.isEnabledFor(logging.INFO):
+            line = {'method': request.method, 'path': request.path, 'view': endpoint, 'status': status,
+                    'queries': metrics.queries, 'db_ms': round(metrics.db_time * 1000, 3),
+                    'response_bytes': size, 'total_ms': round(duration * 1000, 3)}
+            line.update(('{0}_ms'.format(name), round(metrics.sections.get(name, 0.0) * 1000, 3))
+                        for name in TIMED_SECTIONS)
+            logger.info(json.dumps(line))
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Middleware keeping the database routing of each request (see api.routers).
+    Reads of requests which write, and of clients which have written
+    recently (marked by a cookie set with the response of the write,
+    expiring only after every replica missing the write has been found
+    lagging, see routers.read_your_writes_seconds), are sent
+    to the primary database, so clients always see their own writes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState(pinned=request.method not in SAFE_METHODS or PRIMARY_COOKIE in request.COOKIES)
+        token = set_routing(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_routing(token)
+
+        if response.streaming:
+            response.streaming_content = self.routed_stream(response.streaming_content, state)
+        if state.wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(PRIMARY_COOKIE, '1', max_age=read_your_writes_seconds(), httponly=True)
+        return response
+
+    @staticmethod
+    def routed_stream(content, state):
+        token = set_routing(state)
+        try:
+            yield from content
+        finally:
+            reset_routing(token)
@@ -0,0 +1,63 @@
+# Generated by Django 2.2.13 on 2026-10-17 07:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Movie',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('year', models.CharField(blank=True, max_length=200, null=True)),
+                ('rated', models.CharField(blank=True, max_length=200, null=True)),
+                ('released', models.DateField(blank=True, null=True)),
+                ('runtime', models.CharField(blank=True, max_length=200, null=True)),
+                ('genre', models.CharField(blank=True, max_length=200, null=True)),
+                ('director', models.CharField(blank=True, max_length=200, null=True)),
+                ('writer', models.CharField(blank=True, max_length=200, null=True)),
+                ('actors', models.CharField(blank=True, max_length=200, null=True)),
+                ('plot', models.TextField(blank=True, null=True)),
+                ('language', models.CharField(blank=True, max_length=200, null=True)),
+                ('country', models.CharField(blank=True, max_length=200, null=True)),
+                ('awards', models.CharField(blank=True, max_length=200, null=True)),
+                ('poster', models.URLField(blank=True, null=True)),
+                ('metascore', models.SmallIntegerField(blank=True, null=True)),
+                ('imdb_rating', models.FloatField(blank=True, null=True)),
+                ('imdb_votes', models.IntegerField(blank=True, null=True)),
+                ('imdb_id', models.CharField(blank=True, max_length=200, null=True)),
+                ('item_type', models.CharField(blank=True, max_length=200, null=True)),
+                ('dvd', models.DateField(blank=True, null=True)),
+                ('box_office', models.IntegerField(blank=True, null=True)),
+                ('production', models.CharField(blank=True, max_length=200, null=True)),
+                ('website', models.URLField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Rating',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=200)),
+                ('value', models.CharField(max_length=200)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Movie')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Comment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comment_body', models.TextField()),
+                ('added', models.DateTimeField(default=django.utils.timezone.now)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Movie')),
+            ],
+        ),
+    ]
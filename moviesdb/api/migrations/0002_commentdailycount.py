@@ -0,0 +1,49 @@
+# Generated by Django 2.2.13 on 2026-10-17 07:08
+
+from collections import Counter
+from datetime import timedelta
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils.timezone import get_fixed_timezone
+
+# Timezone of days comments are counted in as of this migration (api.models.RANKING_TIMEZONE),
+# copied so that later changes to it do not change what the migration does
+RANKING_TIMEZONE = get_fixed_timezone(timedelta(hours=2))
+
+
+def count_comments_by_day(comment_rows):
+    return Counter((movie_id, added.astimezone(RANKING_TIMEZONE).date()) for movie_id, added in comment_rows)
+
+
+def populate_comment_rollup(apps, schema_editor):
+    Comment = apps.get_model('api', 'Comment')
+    CommentDailyCount = apps.get_model('api', 'CommentDailyCount')
+    counts = count_comments_by_day(Comment.objects.values_list('movie_id', 'added').iterator())
+    CommentDailyCount.objects.bulk_create(
+        [CommentDailyCount(movie_id=movie_id, day=day, count=count)
+         for (movie_id, day), count in counts.items()],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentDailyCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Movie')),
+            ],
+            options={
+                'unique_together': {('movie', 'day')},
+            },
+        ),
+        migrations.RunPython(populate_comment_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,133 @@
+# Generated by Django 2.2.13 on 2026-10-17 07:24
+
+import re
+
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 500
+
+
+# Parsers of api.models as of this migration, copied so that
+# later changes to them do not change what the migration does
+
+def parse_year(year):
+    match = re.match(r'\s*(\d{4})', str(year)) if year is not None else None
+    return int(match.group(1)) if match else None
+
+
+def parse_runtime(runtime):
+    match = re.match(r'\s*(\d+)\s*min', str(runtime)) if runtime is not None else None
+    return int(match.group(1)) if match else None
+
+
+def parse_score(value):
+    if value is None:
+        return None
+    match = re.match(r'\s*(\d+(?:\.\d+)?)\s*(?:/\s*(\d+(?:\.\d+)?)|(%))\s*$', str(value))
+    if not match or (match.group(2) is not None and not float(match.group(2))):
+        return None
+    score = float(match.group(1))
+    return score * 100 / float(match.group(2)) if match.group(2) is not None else score
+
+
+def split_names(names):
+    return [n.strip() for n in (names or '').split(',') if n.strip() and n.strip() != 'N/A']
+
+
+def name_key(name):
+    return ' '.join(name.casefold().split())
+
+
+def backfill_normalized_fields(apps, schema_editor):
+    Movie = apps.get_model('api', 'Movie')
+    Rating = apps.get_model('api', 'Rating')
+    Genre = apps.get_model('api', 'Genre')
+    Person = apps.get_model('api', 'Person')
+    relations = [(Movie.genres.through, 'genre_id', Genre, 'genre'),
+                 (Movie.cast.through, 'person_id', Person, 'actors'),
+                 (Movie.directors.through, 'person_id', Person, 'director')]
+
+    movies = list(Movie.objects.only('year', 'runtime', 'genre', 'actors', 'director').iterator())
+    for movie in movies:
+        movie.release_year = parse_year(movie.year)
+        movie.runtime_minutes = parse_runtime(movie.runtime)
+    Movie.objects.bulk_update(movies, ['release_year', 'runtime_minutes'], batch_size=BACKFILL_BATCH_SIZE)
+
+    ids = {Genre: {}, Person: {}}
+    for through, column, model, field in relations:
+        links = set()
+        for movie in movies:
+            for name in split_names(getattr(movie, field)):
+                key = name_key(name)
+                if key not in ids[model]:
+                    ids[model][key] = model.objects.create(name=name, key=key).pk
+                links.add((movie.pk, ids[model][key]))
+        through.objects.bulk_create([through(**{'movie_id': movie_id, column: target_id})
+                                     for movie_id, target_id in links],
+                                    batch_size=BACKFILL_BATCH_SIZE)
+
+    ratings = list(Rating.objects.only('value').iterator())
+    for rating in ratings:
+        rating.score = parse_score(rating.value)
+    Rating.objects.bulk_update(ratings, ['score'], batch_size=BACKFILL_BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Genre',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('key', models.CharField(max_length=200, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Person',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('key', models.CharField(max_length=200, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='release_year',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='runtime_minutes',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rating',
+            name='score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['imdb_rating'], name='api_movie_imdb_rating_idx'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='cast',
+            field=models.ManyToManyField(blank=True, related_name='acted_in', to='api.Person'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='directors',
+            field=models.ManyToManyField(blank=True, related_name='directed', to='api.Person'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='genres',
+            field=models.ManyToManyField(blank=True, related_name='movies', to='api.Genre'),
+        ),
+        migrations.RunPython(backfill_normalized_fields, migrations.RunPython.noop),
+    ]
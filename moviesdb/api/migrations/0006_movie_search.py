@@ -0,0 +1,47 @@
+# Generated by Django 2.2.13 on 2026-10-17 07:26
+
+from django.db import migrations
+
+# Full-text index of movies, kept in sync with the movies table
+# by the api.search module. The index keeps its own copy of the text
+# (rather than reading it from the movies table) so that entries of updated
+# and deleted movies can be removed by ID alone. Prefixes of 2 and 3
+# characters are indexed for fast prefix queries.
+CREATE_SEARCH_INDEX = [
+    '''CREATE VIRTUAL TABLE api_movie_search USING fts5(
+        title, plot, actors, director, writer,
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')''',
+
+    # Title matches weigh the most, then credits and plot
+    '''INSERT INTO api_movie_search (api_movie_search, rank)
+        VALUES ('rank', 'bm25(10.0, 1.0, 3.0, 3.0, 2.0)')''',
+
+    # Index movies saved before
+    '''INSERT INTO api_movie_search (rowid, title, plot, actors, director, writer)
+        SELECT id, title, plot, actors, director, writer FROM api_movie''',
+]
+
+DROP_SEARCH_INDEX = [
+    'DROP TABLE IF EXISTS api_movie_search',
+]
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        # FTS5 is specific to SQLite
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_normalized_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_statements(CREATE_SEARCH_INDEX), run_statements(DROP_SEARCH_INDEX)),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.13 on 2026-10-17 07:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_resourceversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoviePayload',
+            fields=[
+                ('movie', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='payload', serialize=False, to='api.Movie')),
+                ('content', models.TextField()),
+            ],
+        ),
+    ]
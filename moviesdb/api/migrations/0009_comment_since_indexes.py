@@ -0,0 +1,25 @@
+# Generated by Django 2.2.13 on 2026-10-17 07:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_moviepayload'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='api_comment_movie_added_idx',
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['movie', 'added', 'id'], name='api_comment_movie_added_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['added', 'id'], name='api_comment_added_id_idx'),
+        ),
+    ]
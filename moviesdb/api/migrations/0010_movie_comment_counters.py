@@ -0,0 +1,35 @@
+# Generated by Django 2.2.13 on 2026-10-17 08:03
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_comment_counters(apps, schema_editor):
+    Movie = apps.get_model('api', 'Movie')
+    Comment = apps.get_model('api', 'Comment')
+    comments = Comment.objects.filter(movie=OuterRef('pk'))
+    comment_count = comments.values('movie').annotate(count=Count('pk')).values('count')
+    Movie.objects.update(comment_count=Coalesce(Subquery(comment_count), 0),
+                         last_comment_at=Subquery(comments.order_by('-added').values('added')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_comment_since_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='comment_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='last_comment_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_comment_counters, migrations.RunPython.noop),
+    ]
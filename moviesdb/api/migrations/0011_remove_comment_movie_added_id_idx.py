@@ -0,0 +1,17 @@
+# Generated by Django 2.2.13 on 2026-10-17 09:11
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_movie_comment_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='api_comment_movie_added_id_idx',
+        ),
+    ]
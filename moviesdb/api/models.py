@@ -1,7 +1,8 @@
-from datetime import date
+import re
+from datetime import date, timedelta
 
 from django.db import models
-from django.utils.timezone import now
+from django.utils.timezone import get_fixed_timezone, now
 
 # English abbreviations for months' names
 # used in from_en_date parser function
@@ -11,9 +12,32 @@ MONTHS_ABBRV = ['',
                 'Jul', 'Aug', 'Sep',
                 'Oct', 'Nov', 'Dec']
 
+# Time zone of the days comments are counted in
+# when movies are ranked by number of comments
+RANKING_TIMEZONE = get_fixed_timezone(timedelta(hours=2))
+
+# Fields of movies written along with comments rather than with movies
+COMMENT_COUNTER_FIELDS = ['comment_count', 'last_comment_at']
+
+
+class Genre(models.Model):
+    name = models.CharField(max_length=200)
+    key = models.CharField(max_length=200, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Person(models.Model):
+    name = models.CharField(max_length=200)
+    key = models.CharField(max_length=200, unique=True)
+
+    def __str__(self):
+        return self.name
+
 
 class Movie(models.Model):
-    title = models.CharField(max_length=200)
+    title = models.CharField(max_length=200, unique=True)
     year = models.CharField(max_length=200, blank=True, null=True)
     rated = models.CharField(max_length=200, blank=True, null=True)
     released = models.DateField(blank=True, null=True)
@@ -30,13 +54,29 @@ class Movie(models.Model):
     metascore = models.SmallIntegerField(blank=True, null=True)
     imdb_rating = models.FloatField(blank=True, null=True)
     imdb_votes = models.IntegerField(blank=True, null=True)
-    imdb_id = models.CharField(max_length=200, blank=True, null=True)
+    imdb_id = models.CharField(max_length=200, blank=True, null=True, db_index=True)
     item_type = models.CharField(max_length=200, blank=True, null=True)
     dvd = models.DateField(blank=True, null=True)
     box_office = models.IntegerField(blank=True, null=True)
     production = models.CharField(max_length=200, blank=True, null=True)
     website = models.URLField(blank=True, null=True)
 
+    # Typed and normalized copies of the fields above
+    # used for filtering and sorting of movies
+    release_year = models.PositiveSmallIntegerField(blank=True, null=True, db_index=True)
+    runtime_minutes = models.PositiveSmallIntegerField(blank=True, null=True, db_index=True)
+    genres = models.ManyToManyField(Genre, blank=True, related_name='movies')
+    cast = models.ManyToManyField(Person, blank=True, related_name='acted_in')
+    directors = models.ManyToManyField(Person, blank=True, related_name='directed')
+
+    # Counters of comments of the movie, updated in the transactions
+    # of writes of the comments by the api.rollups module
+    comment_count = models.PositiveIntegerField(default=0, db_index=True)
+    last_comment_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['imdb_rating'], name='api_movie_imdb_rating_idx')]
+
     @classmethod
     def create_from_omdb_dict(cls, omdb_dict):
         movie = cls()
@@ -51,12 +91,14 @@ class Movie(models.Model):
         # Setting instance attributes from the omdb_dict
         movie.title = omdb_dict.get('Title')
         movie.year = omdb_dict.get('Year')
+        movie.release_year = parse_year(movie.year)
         movie.rated = omdb_dict.get('Rated')
         try:
             movie.released = from_en_date(en_date=omdb_dict.get('Released'))
         except AttributeError:
             movie.released = None
         movie.runtime = omdb_dict.get('Runtime')
+        movie.runtime_minutes = parse_runtime(movie.runtime)
         movie.genre = omdb_dict.get('Genre')
         movie.director = omdb_dict.get('Director')
         movie.writer = omdb_dict.get('Writer')
@@ -101,6 +143,9 @@ class Rating(models.Model):
     source = models.CharField(max_length=200)
     value = models.CharField(max_length=200)
 
+    # Value normalized to 0-100 scale
+    score = models.FloatField(blank=True, null=True)
+
     @classmethod
     def create_from_rating_dict(cls, movie, rating_dict):
         rating = cls()
@@ -109,21 +154,133 @@ class Rating(models.Model):
         rating.movie = movie
         rating.source = rating_dict.get('Source')
         rating.value = rating_dict.get('Value')
+        rating.score = parse_score(rating.value)
         return rating
 
     def __str__(self):
         return "{0}: {1} rating".format(self.movie.title, self.source)
 
 
+class MoviePayload(models.Model):
+    """
+    Json payload of the movie with its ratings as listed by the movies
+    endpoint, rendered whenever the movie or its ratings change.
+    Payloads are removed along with their movies by the api.signals module
+    (rather than by a constraint, as ratings of a deleted movie re-render it).
+    """
+    movie = models.OneToOneField(Movie, on_delete=models.DO_NOTHING, db_constraint=False,
+                                 primary_key=True, related_name='payload')
+    content = models.TextField()
+
+    def __str__(self):
+        return "Payload of {0}".format(self.movie_id)
+
+
 class Comment(models.Model):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
     comment_body = models.TextField()
     added = models.DateTimeField(default=now)
 
+    class Meta:
+        indexes = [models.Index(fields=['added', 'id'], name='api_comment_added_id_idx')]
+
     def __str__(self):
         return "Comment to: {0}. Comment's id: {1}".format(self.movie.title, self.pk)
 
 
+class CommentDailyCount(models.Model):
+    """
+    Number of comments added to the movie on a day,
+    updated whenever a comment is created or deleted
+    """
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('movie', 'day')
+
+    def __str__(self):
+        return "{0}: {1} comments on {2}".format(self.movie.title, self.count, self.day)
+
+
+class ImportJob(models.Model):
+    """Asynchronous import of the movie with the title from OMDB"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'),
+                      (RUNNING, 'Running'),
+                      (SUCCEEDED, 'Succeeded'),
+                      (FAILED, 'Failed')]
+
+    title = models.CharField(max_length=200)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    movie = models.ForeignKey(Movie, on_delete=models.SET_NULL, blank=True, null=True)
+    result_status = models.SmallIntegerField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    created = models.DateTimeField(default=now)
+    updated = models.DateTimeField(default=now)
+
+    def __str__(self):
+        return "Import of {0}: {1}".format(self.title, self.status)
+
+
+class ResourceVersion(models.Model):
+    """
+    Counter of changes of a resource listed by the API (e.g. all comments
+    or comments of a movie), bumped whenever the resource is written to
+    """
+    key = models.CharField(max_length=200, unique=True)
+    version = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(default=now)
+
+    def __str__(self):
+        return "{0}: version {1}".format(self.key, self.version)
+
+
+def comment_day(added):
+    """Day the comment added at specified time is counted in"""
+    return added.astimezone(RANKING_TIMEZONE).date()
+
+
+def parse_year(year):
+    """First year of OMDB year (e.g. 2019 or 2010–2015) as a number"""
+    match = re.match(r'\s*(\d{4})', str(year)) if year is not None else None
+    return int(match.group(1)) if match else None
+
+
+def parse_runtime(runtime):
+    """Number of minutes of OMDB runtime (e.g. 90 min)"""
+    match = re.match(r'\s*(\d+)\s*min', str(runtime)) if runtime is not None else None
+    return int(match.group(1)) if match else None
+
+
+def parse_score(value):
+    """
+    Rating value (e.g. 7.5/10, 85/100 or 85%)
+    normalized to 0-100 scale
+    """
+    if value is None:
+        return None
+    match = re.match(r'\s*(\d+(?:\.\d+)?)\s*(?:/\s*(\d+(?:\.\d+)?)|(%))\s*$', str(value))
+    if not match or (match.group(2) is not None and not float(match.group(2))):
+        return None
+    score = float(match.group(1))
+    return score * 100 / float(match.group(2)) if match.group(2) is not None else score
+
+
+def split_names(names):
+    """List of names from comma separated OMDB field (e.g. genre or actors)"""
+    return [n.strip() for n in (names or '').split(',') if n.strip() and n.strip() != 'N/A']
+
+
+def name_key(name):
+    """Key of genre or person name used for case insensitive lookups"""
+    return ' '.join(name.casefold().split())
+
+
 def from_en_date(en_date):
     """
     Custom parser function converting localized
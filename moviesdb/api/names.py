@@ -0,0 +1,64 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import Genre, Movie, Person, name_key, split_names
+
+# Normalized relations of movies: (many-to-many field, model of the names,
+# movie field with comma separated names the relation is built from)
+NAME_RELATIONS = [('genres', Genre, 'genre'),
+                  ('cast', Person, 'actors'),
+                  ('directors', Person, 'director')]
+
+# Number of rows inserted in a single query
+NAMES_BATCH_SIZE = 500
+
+
+def link_movie_names(movies, replace=False):
+    """
+    Link saved movies to genres and people named in their
+    genre, actors and director fields, creating missing ones.
+    With replace, links made before are removed first.
+    Runs a fixed number of queries regardless of the number of movies.
+    """
+    movies = [m for m in movies if m.pk is not None]
+    names = {relation: {m.pk: split_names(getattr(m, field)) for m in movies}
+             for relation, _, field in NAME_RELATIONS}
+    if not replace and not any(n for by_movie in names.values() for n in by_movie.values()):
+        return
+
+    with transaction.atomic():
+        names_by_model = defaultdict(set)
+        for relation, model, _ in NAME_RELATIONS:
+            for movie_names in names[relation].values():
+                names_by_model[model].update(movie_names)
+        ids = {model: get_name_ids(model, model_names) for model, model_names in names_by_model.items()}
+
+        for relation, model, _ in NAME_RELATIONS:
+            field = getattr(Movie, relation).field
+            through = field.remote_field.through
+            if replace:
+                through.objects.filter(**{field.m2m_column_name() + '__in': [m.pk for m in movies]}).delete()
+            links = {(movie_id, ids[model][name_key(name)])
+                     for movie_id, movie_names in names[relation].items() for name in movie_names}
+            through.objects.bulk_create([through(**{field.m2m_column_name(): movie_id,
+                                                    field.m2m_reverse_name(): target_id})
+                                         for movie_id, target_id in links],
+                                        batch_size=NAMES_BATCH_SIZE, ignore_conflicts=True)
+
+
+def get_name_ids(model, names):
+    """Map of keys of the names to IDs of genres or people, created if missing"""
+    by_key = {}
+    for name in names:
+        by_key.setdefault(name_key(name), name)
+    if not by_key:
+        return {}
+    ids = dict(model.objects.filter(key__in=list(by_key)).values_list('key', 'pk'))
+    missing = [key for key in by_key if key not in ids]
+    if missing:
+        # Names created concurrently are skipped and fetched below
+        model.objects.bulk_create((model(name=by_key[key], key=key) for key in missing),
+                                  batch_size=NAMES_BATCH_SIZE, ignore_conflicts=True)
+        ids.update(model.objects.filter(key__in=missing).values_list('key', 'pk'))
+    return ids
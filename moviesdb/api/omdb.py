@@ -0,0 +1,284 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from moviesdb.secret_keys import OMDB_API_KEY
+
+from .instrumentation import timed_section
+
+
+# Seconds within which repeated hits of a cache entry do not update its
+# last access (entries accessed within them are equally recently used)
+ACCESS_UPDATE_INTERVAL = 600
+
+# Seconds between writes of the hit and miss counters of the cache
+COUNTERS_FLUSH_INTERVAL = 60
+
+
+class OMDBError(Exception):
+    """Raised when OMDB API could not be reached or its response is invalid"""
+    pass
+
+
+def normalize_title(title):
+    """Title used as the key of cached OMDB responses"""
+    return ' '.join(title.casefold().split())
+
+
+def is_not_found(omdb_dict):
+    """Whether the OMDB response means that the movie does not exist"""
+    return omdb_dict.get('Response') != "True" and 'not found' in omdb_dict.get('Error', '').lower()
+
+
+@timed_section('omdb')
+def request_omdb(**params):
+    """
+    Fetch the raw OMDB response dict for the query parameters
+    over a keep-alive connection of the current thread
+    """
+    params.update({'r': 'json', 'apikey': OMDB_API_KEY})
+    url = urlsplit(settings.OMDB_API_URL)
+    path = '{0}?{1}'.format(url.path or '/', urlencode(params))
+
+    # Connection kept alive since the previous request
+    # could have been closed by the server, so it is retried once
+    for attempt in range(2):
+        connection = get_connection(url)
+        try:
+            connection.request('GET', path, headers={'Accept': 'application/json'})
+            response = connection.getresponse()
+            body = response.read()
+        except (OSError, HTTPException) as e:
+            discard_connection()
+            if attempt:
+                raise OMDBError("Could not connect to OMDB API.") from e
+            continue
+        if response.status != 200:
+            # Server may close the connection after an error response
+            discard_connection()
+            raise OMDBError("Could not connect to OMDB API.")
+        try:
+            return json.loads(body.decode('utf-8'))
+        except ValueError as e:
+            raise OMDBError("Could not connect to OMDB API.") from e
+
+
+_connections = threading.local()
+
+
+def get_connection(url):
+    """HTTP connection to OMDB API reused by the current thread"""
+    key = (url.scheme, url.netloc, settings.OMDB_TIMEOUT)
+    connection = getattr(_connections, 'connection', None)
+    if connection is None or _connections.key != key:
+        if connection is not None:
+            connection.close()
+        connection_class = HTTPSConnection if url.scheme == 'https' else HTTPConnection
+        connection = connection_class(url.netloc, timeout=settings.OMDB_TIMEOUT)
+        _connections.connection, _connections.key = connection, key
+    return connection
+
+
+def discard_connection():
+    """Close the connection of the current thread, the next request opens a new one"""
+    connection = getattr(_connections, 'connection', None)
+    if connection is not None:
+        connection.close()
+        _connections.connection = None
+
+
+class RateLimiter:
+    """Token bucket limiting the rate of requests shared by threads"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a request can be made"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def fetch_by_title(title, rate_limiter=None):
+    """OMDB response dict of the movie with the title, cached if possible"""
+    return cached_fetch('title:' + normalize_title(title), rate_limiter, t=title)
+
+
+def fetch_by_imdb_id(imdb_id, rate_limiter=None):
+    """OMDB response dict of the movie with the IMDb ID, cached if possible"""
+    return cached_fetch('imdb:' + imdb_id, rate_limiter, i=imdb_id)
+
+
+def cached_fetch(key, rate_limiter=None, **params):
+    """
+    OMDB response dict stored in the cache under the key or fetched with the parameters.
+    Only requests actually sent to OMDB are subject to the rate limiter.
+    """
+    cache = get_cache()
+    omdb_dict = cache.get(key) if cache is not None else None
+    if omdb_dict is None:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        omdb_dict = request_omdb(**params)
+        if cache is not None:
+            cache.store(omdb_dict, keys=[key])
+    return omdb_dict
+
+
+class OMDBCache:
+    """
+    Disk-backed cache of raw OMDB responses kept in a sqlite file.
+    Found movies are stored under both normalized title and IMDb ID keys,
+    "not found" responses are stored with shorter time to live.
+    Least recently used entries are evicted above max_entries, last access
+    of entries is updated at most every access_update_interval seconds
+    and counters of hits and misses are kept in memory between writes,
+    so that cache hits do not write to the file.
+    """
+
+    def __init__(self, path, ttl, negative_ttl, max_entries, access_update_interval=ACCESS_UPDATE_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.access_update_interval = access_update_interval
+        self.lock = threading.Lock()
+        self.pending_counters = Counter()
+        self.counters_flushed = time.monotonic()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, value TEXT NOT NULL,
+                expires REAL NOT NULL, accessed REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+            CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        ''')
+
+    def get(self, key):
+        """Cached OMDB response dict or None if missing or expired"""
+        now = time.time()
+        with self.lock:
+            row = self.db.execute('SELECT value, accessed FROM entries WHERE key = ? AND expires > ?',
+                                  (key, now)).fetchone()
+            self.pending_counters['hits' if row is not None else 'misses'] += 1
+            touch = row is not None and row[1] <= now - self.access_update_interval
+            flush = time.monotonic() - self.counters_flushed >= COUNTERS_FLUSH_INTERVAL
+            if touch or flush:
+                with self.db:
+                    if touch:
+                        self.db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+                    if flush:
+                        self._flush_counters()
+        return json.loads(row[0]) if row is not None else None
+
+    def store(self, omdb_dict, keys):
+        """Store the OMDB response dict under the keys, if it is worth caching"""
+        if omdb_dict.get('Response') == "True":
+            ttl = self.ttl
+            if omdb_dict.get('imdbID'):
+                keys = keys + ['imdb:' + omdb_dict['imdbID']]
+        elif is_not_found(omdb_dict):
+            ttl = self.negative_ttl
+        else:
+            # Other errors (e.g. invalid API key) are not cached
+            return
+        now = time.time()
+        value = json.dumps(omdb_dict)
+        with self.lock, self.db:
+            self.db.executemany('INSERT OR REPLACE INTO entries (key, value, expires, accessed) '
+                                'VALUES (?, ?, ?, ?)', [(key, value, now + ttl, now) for key in keys])
+            self._evict()
+            self._flush_counters()
+
+    def _evict(self):
+        """Remove expired entries and least recently used ones above the size limit"""
+        count = self.db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        if count <= self.max_entries:
+            return
+        evicted = self.db.execute('DELETE FROM entries WHERE expires <= ?', (time.time(),)).rowcount
+        excess = count - evicted - self.max_entries
+        if excess > 0:
+            evicted += self.db.execute('DELETE FROM entries WHERE key IN '
+                                       '(SELECT key FROM entries ORDER BY accessed LIMIT ?)',
+                                       (excess,)).rowcount
+        self._count('evictions', evicted)
+
+    def _count(self, name, increment=1):
+        self.db.execute('INSERT INTO counters (name, value) VALUES (?, ?) '
+                        'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value', (name, increment))
+
+    def _flush_counters(self):
+        """Write counters kept in memory since the last flush"""
+        for name, increment in self.pending_counters.items():
+            self._count(name, increment)
+        self.pending_counters.clear()
+        self.counters_flushed = time.monotonic()
+
+    def stats(self):
+        """Counters of cache hits, misses and evictions and the number of entries"""
+        with self.lock:
+            if self.pending_counters:
+                with self.db:
+                    self._flush_counters()
+            stats = dict(self.db.execute('SELECT name, value FROM counters').fetchall())
+            entries = self.db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        hits, misses = stats.get('hits', 0), stats.get('misses', 0)
+        return {'hits': hits,
+                'misses': misses,
+                'evictions': stats.get('evictions', 0),
+                'hit_ratio': hits / (hits + misses) if hits + misses else None,
+                'entries': entries}
+
+    def clear(self):
+        """Remove all entries and reset the counters"""
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM entries')
+            self.db.execute('DELETE FROM counters')
+            self.pending_counters.clear()
+
+    def close(self):
+        with self.lock:
+            if self.pending_counters:
+                with self.db:
+                    self._flush_counters()
+            self.db.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Shared OMDB cache configured with OMDB_CACHE setting
+    (None if the cache is disabled)
+    """
+    global _cache
+    config = settings.OMDB_CACHE
+    if not config or not config.get('PATH'):
+        return None
+    params = {'path': config['PATH'],
+              'ttl': config.get('TTL', 7 * 24 * 3600),
+              'negative_ttl': config.get('NEGATIVE_TTL', 3600),
+              'max_entries': config.get('MAX_ENTRIES', 10000)}
+    with _cache_lock:
+        if _cache is None or any(getattr(_cache, k) != v for k, v in params.items()):
+            if _cache is not None:
+                _cache.close()
+            _cache = OMDBCache(**params)
+        return _cache
@@ -0,0 +1,202 @@
+import base64
+import binascii
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http.response import StreamingHttpResponse
+
+# Number of records returned in a single page
+# when the limit parameter is not provided
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+# Number of records fetched from the database at once
+# when the response is streamed
+STREAM_CHUNK_SIZE = 500
+
+# Approximate size of the pieces of streamed response
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def get_page_params(request, ordering=None):
+    """
+    Parse the after and limit parameters of keyset pagination.
+    Returns None if the request is not paginated,
+    limit is None if it was not provided.
+    With ordering, after is the (value, ID) cursor of the last record.
+    """
+    after = request.GET.get('after')
+    limit = request.GET.get('limit')
+    if after is None and limit is None:
+        return None
+    try:
+        limit = int(limit) if limit else None
+        if ordering is None:
+            after = int(after) if after else None
+        else:
+            after = decode_cursor(after) if after else None
+    except ValueError:
+        raise PaginationError("The after parameter should be the next_after value of the previous page "
+                              "and the limit parameter an integer.")
+    if limit is not None and not 0 < limit <= MAX_PAGE_LIMIT:
+        raise PaginationError("The limit parameter should be between 1 and {0}.".format(MAX_PAGE_LIMIT))
+    return after, limit
+
+
+def get_since_params(request):
+    """
+    Parse the since and limit parameters of incremental listing.
+    Returns None if the request is not incremental, since is None
+    for listing from the start (empty since parameter), otherwise
+    the ID of the last record listed before.
+    """
+    if 'since' not in request.GET:
+        return None
+    since = request.GET['since']
+    limit = request.GET.get('limit')
+    try:
+        limit = int(limit) if limit else None
+        since = int(since) if since else None
+    except ValueError:
+        raise PaginationError("The since parameter should be the next_since value of the previous response "
+                              "(or empty) and the limit parameter an integer.")
+    if limit is not None and not 0 < limit <= MAX_PAGE_LIMIT:
+        raise PaginationError("The limit parameter should be between 1 and {0}.".format(MAX_PAGE_LIMIT))
+    return since, limit
+
+
+def encode_cursor(value, pk):
+    """Opaque cursor of a record in a query set ordered by a field"""
+    return base64.urlsafe_b64encode(json.dumps([value, pk]).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """(value, ID) pair of the cursor, raises ValueError if it is not valid"""
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (binascii.Error, TypeError, UnicodeError):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(pk, int) or isinstance(value, (list, dict)):
+        raise ValueError("Invalid cursor.")
+    return value, pk
+
+
+def is_streamed(request):
+    """Streaming of the response is opt-in with the stream parameter"""
+    return request.GET.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def keyset_page(queryset, serialize_func, after, limit, id_key, ordering=None):
+    """
+    Page of serialized records following the cursor
+    and the cursor to be used for the next page (None on the last page)
+    """
+    queryset = keyset_filter(queryset, after, ordering)
+    limit = limit or DEFAULT_PAGE_LIMIT
+
+    # One record more than requested tells if there is a next page
+    results = serialize_func(queryset[:limit + 1])
+    next_after = None
+    if len(results) > limit:
+        results = results[:limit]
+        last = results[-1]
+        if ordering is None:
+            next_after = last[id_key]
+        else:
+            next_after = encode_cursor(last.get(ordering[0]), last[id_key])
+    return {'results': results, 'next_after': next_after}
+
+
+def keyset_filter(queryset, after, ordering=None):
+    """
+    Query set ordered by primary key, or by the (field, descending) ordering
+    with primary key breaking ties, and starting after the cursor
+    """
+    if ordering is None:
+        queryset = queryset.order_by('pk')
+        if after is not None:
+            queryset = queryset.filter(pk__gt=after)
+        return queryset
+
+    field, descending = ordering
+    prefix = '-' if descending else ''
+    queryset = queryset.order_by(prefix + field, prefix + 'pk')
+    if after is not None:
+        queryset = queryset.filter(after_condition(field, descending, *after))
+    return queryset
+
+
+def since_page(queryset, serialize_func, since, limit, id_key):
+    """
+    Records created after the record with the ID, in the order they were created,
+    and the cursor to be passed as since by the next request
+    (the same one if there are no new records)
+    """
+    limit = limit or DEFAULT_PAGE_LIMIT
+    results = serialize_func(since_filter(queryset, since)[:limit])
+    if results:
+        since = results[-1][id_key]
+    return {'results': results, 'next_since': since}
+
+
+def since_filter(queryset, since):
+    """
+    Query set ordered by primary key and starting after the ID.
+    SQLite serializes writers, so primary keys follow the order records
+    are committed in, unlike the time they were added (set before the
+    write waits for the lock, or provided by clients), and a record
+    committed after a poll is never behind the cursor of the poll.
+    """
+    queryset = queryset.order_by('pk')
+    if since is not None:
+        queryset = queryset.filter(pk__gt=since)
+    return queryset
+
+
+def after_condition(field, descending, value, pk):
+    """
+    Condition of records following the (value, ID) cursor in the ordering.
+    Null values are sorted as the lowest ones, as in SQLite.
+    """
+    if descending:
+        if value is None:
+            return Q(**{field + '__isnull': True, 'pk__lt': pk})
+        return (Q(**{field + '__lt': value}) | Q(**{field: value, 'pk__lt': pk})
+                | Q(**{field + '__isnull': True}))
+    if value is None:
+        return Q(**{field + '__isnull': True, 'pk__gt': pk}) | Q(**{field + '__isnull': False})
+    return Q(**{field + '__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+
+
+def stream_json_array(payloads, encoded=False):
+    """
+    Generator encoding the payloads as a json array one by one
+    (or joining payloads already encoded as json)
+    """
+    encode = DjangoJSONEncoder().encode if not encoded else str
+    buffer = ['[']
+    buffer_size = 1
+    separator = ''
+    for payload in payloads:
+        piece = separator + encode(payload)
+        separator = ','
+        buffer.append(piece)
+        buffer_size += len(piece)
+
+        # Encoded payloads are sent in pieces of limited size
+        if buffer_size >= STREAM_BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            buffer_size = 0
+    buffer.append(']')
+    yield ''.join(buffer)
+
+
+def streaming_json_response(payloads, status=200, encoded=False):
+    return StreamingHttpResponse(stream_json_array(payloads, encoded), status=status,
+                                 content_type='application/json')
@@ -0,0 +1,128 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .instrumentation import timed_section
+from .models import COMMENT_COUNTER_FIELDS, Movie, MoviePayload
+from .pagination import DEFAULT_PAGE_LIMIT, encode_cursor, keyset_filter
+from .serializers import serialize_movies
+
+# Number of movies rendered at once (two queries per batch)
+RENDER_BATCH_SIZE = 500
+
+
+@timed_section('serialization')
+def render_payloads(movie_ids):
+    """
+    Map of movie IDs to json payloads of the movies rendered from scratch.
+    Counters of comments change with every comment, so they are not
+    stored in the payloads but spliced into them when they are listed.
+    """
+    encoder = DjangoJSONEncoder()
+    return {m['movie_id']: encoder.encode({k: v for k, v in m.items() if k not in COMMENT_COUNTER_FIELDS})
+            for m in serialize_movies(Movie.objects.filter(pk__in=movie_ids))}
+
+
+def splice_counters(payload, counters):
+    """Payload of the movie with the values of its counters of comments added"""
+    encoder = DjangoJSONEncoder()
+    return payload[:-1] + ''.join(', "{0}": {1}'.format(field, encoder.encode(value))
+                                  for field, value in zip(COMMENT_COUNTER_FIELDS, counters)
+                                  if value is not None) + '}'
+
+
+def materialize_payloads(movie_ids):
+    """
+    Render and store payloads of the movies, to be called after
+    the movies or their ratings are written (including bulk writes).
+    Runs four queries per batch of movies.
+    """
+    movie_ids = list(movie_ids)
+    with transaction.atomic():
+        for start in range(0, len(movie_ids), RENDER_BATCH_SIZE):
+            batch = movie_ids[start:start + RENDER_BATCH_SIZE]
+            payloads = render_payloads(batch)
+            MoviePayload.objects.filter(movie_id__in=batch).delete()
+            MoviePayload.objects.bulk_create(MoviePayload(movie_id=movie_id, content=content)
+                                             for movie_id, content in payloads.items())
+
+
+def rematerialize_payloads():
+    """
+    Render payloads of all movies again (e.g. after the format of payloads
+    has changed), a batch of movies per transaction, and remove payloads
+    of movies which no longer exist. Returns the number of rendered payloads.
+    """
+    MoviePayload.objects.exclude(movie_id__in=Movie.objects.values('pk')).delete()
+    rendered = 0
+    last_id = 0
+    while True:
+        batch = list(Movie.objects.filter(pk__gt=last_id).order_by('pk')
+                                  .values_list('pk', flat=True)[:RENDER_BATCH_SIZE])
+        if not batch:
+            return rendered
+        materialize_payloads(batch)
+        rendered += len(batch)
+        last_id = batch[-1]
+
+
+def movie_payload_rows(movies_qs, *fields):
+    """
+    List of (values of the fields, payload) pairs of the movies in the order
+    of the query set. Stored payloads are read along with the movies
+    in a single query, payloads of movies rendered before the payloads
+    were introduced (if any) are rendered on the fly.
+    """
+    rows = list(movies_qs.values_list('pk', *fields, *COMMENT_COUNTER_FIELDS, 'payload__content'))
+    payloads = complete_payloads(rows)
+    return [(row[:len(fields) + 1], payload) for row, payload in zip(rows, payloads)]
+
+
+def iter_movie_payloads(movies_qs, chunk_size):
+    """Generator of payloads of the movies reading the query set in chunks"""
+    chunk = []
+    rows = movies_qs.values_list('pk', *COMMENT_COUNTER_FIELDS, 'payload__content').iterator(chunk_size=chunk_size)
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from complete_payloads(chunk)
+            chunk = []
+    if chunk:
+        yield from complete_payloads(chunk)
+
+
+@timed_section('serialization')
+def complete_payloads(rows):
+    """
+    Payloads of (movie ID, ..., counters of comments, stored payload) rows
+    with the counters spliced in, rendering missing payloads
+    """
+    missing = [row[0] for row in rows if row[-1] is None]
+    rendered = render_payloads(missing) if missing else {}
+    counters = len(COMMENT_COUNTER_FIELDS)
+    return [splice_counters(row[-1] if row[-1] is not None else rendered[row[0]], row[-1 - counters:-1])
+            for row in rows]
+
+
+def movie_payloads_array(movies_qs):
+    """Json array of payloads of the movies"""
+    return '[' + ', '.join(content for _, content in movie_payload_rows(movies_qs)) + ']'
+
+
+def movie_payloads_page(movies_qs, after, limit, ordering=None):
+    """
+    Json object with a page of payloads of the movies following the cursor
+    and the cursor of the next page, as built by pagination.keyset_page
+    """
+    movies_qs = keyset_filter(movies_qs, after, ordering)
+    limit = limit or DEFAULT_PAGE_LIMIT
+    fields = [ordering[0]] if ordering is not None else []
+
+    # One movie more than requested tells if there is a next page
+    rows = movie_payload_rows(movies_qs[:limit + 1], *fields)
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        values = rows[-1][0]
+        next_after = values[0] if ordering is None else encode_cursor(values[1], values[0])
+    return '{{"results": [{0}], "next_after": {1}}}'.format(
+        ', '.join(content for _, content in rows), DjangoJSONEncoder().encode(next_after))
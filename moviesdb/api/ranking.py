@@ -0,0 +1,67 @@
+from django.db import connections
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Window
+from django.db.models.functions import Coalesce, DenseRank
+
+from .models import Movie, CommentDailyCount
+
+
+def ranked_movies(day_start, day_end):
+    """
+    Query set of movies annotated with the number of comments
+    added between day_start and day_end (both inclusive)
+    and the dense rank of the movie by that number
+    """
+
+    # Prepare aggregation summing daily counts of comments
+    # of each movie within specified date range
+    day_counts = CommentDailyCount.objects.filter(movie=OuterRef('pk'),
+                                                  day__gte=day_start,
+                                                  day__lte=day_end)
+    day_counts = day_counts.values('movie').annotate(total=Sum('count')).values('total')
+    com_count = Coalesce(Subquery(day_counts, output_field=IntegerField()), 0)
+
+    # Movies with the most number of comments are rated highest
+    # Movies with the same number of comments have the same rank
+    rank = Window(expression=DenseRank(), order_by=F('com_count').desc())
+    return (Movie.objects.annotate(com_count=com_count)
+                         .annotate(rank=rank)
+                         .order_by('-com_count', 'pk'))
+
+
+def rank_movies(day_start, day_end, limit=None, offset=0, min_rank=None, max_rank=None):
+    """
+    List of dictionaries each containing movie ID, number of comments
+    and rank of the movie, narrowed to the requested ranks and slice
+    """
+    query = ranked_movies(day_start, day_end).values_list('pk', 'com_count', 'rank')
+    if min_rank is None and max_rank is None:
+        rows = query[offset:offset + limit] if limit is not None else query[offset:]
+    else:
+        rows = filter_ranks(query, min_rank, max_rank, limit, offset)
+    return [{"movie_id": movie_id, "total_comments": total, "rank": rank}
+            for movie_id, total, rank in rows]
+
+
+def filter_ranks(query, min_rank, max_rank, limit, offset):
+    """
+    Rows of ranked query restricted to ranks between min_rank and max_rank.
+    Window functions can not be filtered on in the same query,
+    so the ranked query is wrapped in an outer one.
+    """
+    connection = connections[query.db]
+    qn = connection.ops.quote_name
+    sql, params = query.query.sql_with_params()
+    conditions, condition_params = [], []
+    if min_rank is not None:
+        conditions.append('{0} >= %s'.format(qn('rank')))
+        condition_params.append(min_rank)
+    if max_rank is not None:
+        conditions.append('{0} <= %s'.format(qn('rank')))
+        condition_params.append(max_rank)
+    high_mark = offset + limit if limit is not None else None
+    outer_sql = 'SELECT * FROM ({0}) {1} WHERE {2} ORDER BY {3}, {4}{5}'.format(
+        sql, qn('ranked'), ' AND '.join(conditions), qn('rank'), qn('id'),
+        connection.ops.limit_offset_sql(offset, high_mark))
+    with connection.cursor() as cursor:
+        cursor.execute(outer_sql, params + tuple(condition_params))
+        return cursor.fetchall()
@@ -0,0 +1,102 @@
+import hashlib
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.http import HttpResponse
+
+from .versions import version_token
+
+
+class ResponseCacheStats:
+    """
+    Counters of the response cache kept by this process
+    (hits, misses and bytes of stored and served responses)
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = dict.fromkeys(('hits', 'misses', 'stores', 'oversized',
+                                           'bytes_stored', 'bytes_served'), 0)
+
+    def count(self, **increments):
+        with self.lock:
+            for name, increment in increments.items():
+                self.counters[name] += increment
+
+    def as_dict(self):
+        with self.lock:
+            stats = dict(self.counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else None
+        return stats
+
+
+stats = ResponseCacheStats()
+
+
+def get_response_cache():
+    """
+    Cache of responses configured with RESPONSE_CACHE setting
+    (one of CACHES, None if the cache is disabled)
+    """
+    config = settings.RESPONSE_CACHE
+    if not config or not config.get('ALIAS'):
+        return None
+    return caches[config['ALIAS']]
+
+
+def response_cache_key(request, keys):
+    """
+    Cache key of the response to the request: its path, query parameters
+    (in any order) and versions of the resources listed in the response.
+    Writes to the resources change their versions, so stale responses
+    are never looked up again and are left to expire or to be evicted.
+    """
+    params = sorted((name, value) for name, values in request.GET.lists() for value in values)
+    key = '\n'.join([request.path, repr(params), version_token(request, keys)])
+    return 'response:' + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def cached_response(keys_func, timeout_func=None):
+    """
+    Decorator of views caching successful responses to GET requests
+    under the versions of resources named by keys_func(request)
+    (None for requests not to be cached) for the timeout returned
+    by timeout_func(request) (None to keep them until evicted),
+    the timeout of the cache by default. Streamed responses
+    and responses larger than MAX_ITEM_SIZE are not cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            cache = get_response_cache()
+            keys = keys_func(request) if request.method in ('GET', 'HEAD') else None
+            if cache is None or keys is None:
+                return view(request, *args, **kwargs)
+
+            key = response_cache_key(request, keys)
+            cached = cache.get(key)
+            if cached is not None:
+                content_type, content = cached
+                stats.count(hits=1, bytes_served=len(content))
+                return HttpResponse(content, content_type=content_type)
+            stats.count(misses=1)
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                if len(response.content) <= settings.RESPONSE_CACHE.get('MAX_ITEM_SIZE', 1024 * 1024):
+                    timeout = timeout_func(request) if timeout_func is not None else DEFAULT_TIMEOUT
+                    cache.set(key, (response['Content-Type'], response.content), timeout)
+                    stats.count(stores=1, bytes_stored=len(response.content))
+                else:
+                    stats.count(oversized=1)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,160 @@
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, CommentDailyCount, Movie, comment_day
+from .versions import COMMENTS, PAST_COMMENTS, bump_versions
+
+# Number of rollup rows inserted in a single query on rebuild
+REBUILD_BATCH_SIZE = 500
+
+# Databases supporting INSERT ... ON CONFLICT DO UPDATE
+UPSERT_VENDORS = ('sqlite', 'postgresql')
+
+
+def count_comments_by_day(comment_rows):
+    """
+    Counter of comments per (movie ID, day) pairs
+    built from an iterable of (movie ID, added) pairs
+    """
+    return Counter((movie_id, comment_day(added)) for movie_id, added in comment_rows)
+
+
+def update_comment_rollup(comments, sign=1):
+    """
+    Add (sign=1) or subtract (sign=-1) the comments
+    to/from daily counts of comments of their movies
+    """
+    counts = count_comments_by_day((c.movie_id, c.added) for c in comments)
+    if sign > 0 and connection.vendor in UPSERT_VENDORS:
+        add_to_comment_rollup(counts)
+        return
+    with transaction.atomic():
+        for (movie_id, day), count in counts.items():
+            rollup = CommentDailyCount.objects.filter(movie_id=movie_id, day=day)
+            if rollup.update(count=F('count') + sign * count) or sign < 0:
+                continue
+
+            # The first comment of the movie on this day creates the daily count,
+            # unless a concurrent transaction has just created it
+            try:
+                with transaction.atomic():
+                    CommentDailyCount.objects.create(movie_id=movie_id, day=day, count=count)
+            except IntegrityError:
+                rollup.update(count=F('count') + count)
+
+        # Days without comments are not kept in the rollup
+        if sign < 0:
+            CommentDailyCount.objects.filter(movie_id__in={m for m, _ in counts}, count__lte=0).delete()
+
+
+def add_to_comment_rollup(counts):
+    """
+    Add counts of comments per (movie ID, day) pairs to daily counts of comments
+    with a single upsert statement run for all pairs, creating missing ones
+    """
+    table = CommentDailyCount._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.executemany('INSERT INTO {0} (movie_id, day, count) VALUES (%s, %s, %s) '
+                           'ON CONFLICT (movie_id, day) DO UPDATE SET count = {0}.count + excluded.count'
+                           .format(table),
+                           [(movie_id, connection.ops.adapt_datefield_value(day), count)
+                            for (movie_id, day), count in counts.items()])
+
+
+def update_comment_counters(comments, sign=1):
+    """
+    Add (sign=1) or subtract (sign=-1) the comments to/from counters
+    of comments of their movies and update the time of their last comment
+    """
+    added_by_movie = defaultdict(list)
+    for comment in comments:
+        added_by_movie[comment.movie_id].append(comment.added)
+
+    # Counters of all movies of created comments are incremented
+    # by a single statement run for each movie
+    if sign > 0:
+        greatest = 'MAX' if connection.vendor == 'sqlite' else 'GREATEST'
+        rows = []
+        for movie_id, added in added_by_movie.items():
+            last = connection.ops.adapt_datetimefield_value(max(added))
+            rows.append((len(added), last, last, movie_id))
+        with connection.cursor() as cursor:
+            cursor.executemany('UPDATE {0} SET comment_count = comment_count + %s, '
+                               'last_comment_at = {1}(COALESCE(last_comment_at, %s), %s) WHERE id = %s'
+                               .format(Movie._meta.db_table, greatest), rows)
+        return
+
+    # The last comment of the movie may have been deleted
+    with transaction.atomic():
+        for movie_id, added in added_by_movie.items():
+            Movie.objects.filter(pk=movie_id).update(comment_count=F('comment_count') - len(added),
+                                                     last_comment_at=last_comment_at_subquery())
+
+
+def last_comment_at_subquery():
+    """Subquery of the time the last comment of the movie was added at"""
+    comments = Comment.objects.filter(movie=OuterRef('pk')).order_by('-added')
+    return Subquery(comments.values('added')[:1])
+
+
+def rebuild_comment_counters():
+    """
+    Recompute counters of comments of all movies from the comments table.
+    Returns the number of movies whose counters were not consistent with it.
+    """
+    comment_count = Comment.objects.filter(movie=OuterRef('pk')).values('movie')
+    comment_count = Coalesce(Subquery(comment_count.annotate(count=Count('pk')).values('count')), 0)
+    with transaction.atomic():
+        mismatches = find_comment_counter_mismatches()
+        Movie.objects.update(comment_count=comment_count, last_comment_at=last_comment_at_subquery())
+    return len(mismatches)
+
+
+def find_comment_counter_mismatches():
+    """
+    Compare counters of comments of movies with the comments table.
+    Returns list of (movie ID, expected count, actual count,
+    expected last comment time, actual last comment time) tuples.
+    """
+    expected = {movie_id: (count, last) for movie_id, count, last
+                in Comment.objects.values('movie').annotate(count=Count('pk'), last=Max('added'))
+                                  .values_list('movie', 'count', 'last').order_by().iterator()}
+    return [(movie_id, expected.get(movie_id, (0, None))[0], count, expected.get(movie_id, (0, None))[1], last)
+            for movie_id, count, last in Movie.objects.order_by('pk')
+                                                      .values_list('pk', 'comment_count', 'last_comment_at')
+                                                      .iterator()
+            if (count, last) != expected.get(movie_id, (0, None))]
+
+
+def rebuild_comment_rollup():
+    """
+    Replace daily counts of comments with counts computed
+    from scratch from the comments table
+    """
+    counts = count_comments_by_day(Comment.objects.values_list('movie_id', 'added').iterator())
+    with transaction.atomic():
+        CommentDailyCount.objects.all().delete()
+        CommentDailyCount.objects.bulk_create(
+            (CommentDailyCount(movie_id=movie_id, day=day, count=count)
+             for (movie_id, day), count in counts.items()),
+            batch_size=REBUILD_BATCH_SIZE)
+        bump_versions([COMMENTS, PAST_COMMENTS])
+    return len(counts)
+
+
+def find_comment_rollup_mismatches():
+    """
+    Compare daily counts of comments with the comments table.
+    Returns list of (movie ID, day, expected count, actual count) tuples.
+    """
+    expected = count_comments_by_day(Comment.objects.values_list('movie_id', 'added').iterator())
+    actual = {(movie_id, day): count for movie_id, day, count
+              in CommentDailyCount.objects.values_list('movie_id', 'day', 'count').iterator()
+              if count}
+    mismatches = [(movie_id, day, expected.get((movie_id, day), 0), actual.get((movie_id, day), 0))
+                  for movie_id, day in set(expected) | set(actual)
+                  if expected.get((movie_id, day), 0) != actual.get((movie_id, day), 0)]
+    return sorted(mismatches)
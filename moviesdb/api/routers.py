@@ -0,0 +1,208 @@
+import math
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.models import Max, Min
+from django.utils.timezone import now
+
+# Cookie of clients which have written to the primary database
+# in the last read_your_writes_seconds(), whose reads are not routed to replicas
+PRIMARY_COOKIE = 'moviesdb_primary'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_routing = ContextVar('api_database_routing', default=None)
+
+
+class RoutingState:
+    """
+    Database routing of a single request: the replica its reads are sent to
+    (None for the primary database), whether it has to read from the primary
+    (the client has just written to it) and whether the request has written
+    """
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.read_alias = None
+        self.wrote = False
+
+
+def get_routing():
+    """Routing of the request handled in the current context (None outside of requests)"""
+    return _routing.get()
+
+
+def set_routing(state):
+    """Make the routing current, returns the token to reset it with"""
+    return _routing.set(state)
+
+
+def reset_routing(token):
+    _routing.reset(token)
+
+
+def read_your_writes_seconds():
+    """
+    Seconds after a write during which reads of the client are sent to the primary:
+    READ_YOUR_WRITES_SECONDS, but longer than a replica missing the write
+    can be considered healthy (it may lag by REPLICA_MAX_LAG when its health
+    is checked, which is not checked again for REPLICA_CHECK_INTERVAL)
+    """
+    return max(settings.READ_YOUR_WRITES_SECONDS,
+               math.floor(settings.REPLICA_MAX_LAG + settings.REPLICA_CHECK_INTERVAL) + 1)
+
+
+class ReplicaPool:
+    """
+    Replicas of the primary database listed in DATABASE_REPLICAS,
+    chosen round-robin among the healthy ones. A replica is healthy
+    if it can be queried and no write it is missing is older than
+    REPLICA_MAX_LAG seconds (versions of resources, updated by every
+    write of the API, are compared with the primary). Health of each
+    replica is checked at most every REPLICA_CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counter = 0
+            self.health = {}
+            self.checking = set()
+
+    @staticmethod
+    def aliases():
+        return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+    def check(self, alias):
+        """Seconds the replica lags behind the primary (None if it cannot be queried)"""
+        from .models import ResourceVersion
+
+        try:
+            replicated = ResourceVersion.objects.using(alias).aggregate(updated=Max('updated'))['updated']
+        except DatabaseError:
+            connections[alias].close()
+            return None
+        missing = ResourceVersion.objects.using(DEFAULT_DB_ALIAS)
+        if replicated is not None:
+            missing = missing.filter(updated__gt=replicated)
+        oldest_missing = missing.aggregate(updated=Min('updated'))['updated']
+        return max(now() - oldest_missing, timedelta(0)).total_seconds() if oldest_missing else 0.0
+
+    def healthy(self):
+        """
+        Aliases of the replicas which are healthy, checked again if their health
+        has expired. Checks run outside of the lock, so other requests are not
+        held up by a slow replica (e.g. locked by a copy of the primary), they
+        skip replicas being checked until their checks are done.
+        """
+        aliases = self.aliases()
+        with self.lock:
+            expired = time.monotonic() - settings.REPLICA_CHECK_INTERVAL
+            due = [alias for alias in aliases if alias not in self.checking
+                   and (alias not in self.health or self.health[alias]['checked'] < expired)]
+            self.checking.update(due)
+        for alias in due:
+            lag = None
+            try:
+                lag = self.check(alias)
+            finally:
+                with self.lock:
+                    self.health[alias] = {'checked': time.monotonic(), 'lag': lag,
+                                          'healthy': lag is not None and lag <= settings.REPLICA_MAX_LAG}
+                    self.checking.discard(alias)
+        with self.lock:
+            return [alias for alias in aliases
+                    if alias not in self.checking and alias in self.health and self.health[alias]['healthy']]
+
+    def choose(self):
+        """Alias of the next healthy replica (None if there is none)"""
+        healthy = self.healthy()
+        if not healthy:
+            return None
+        with self.lock:
+            self.counter += 1
+            return healthy[self.counter % len(healthy)]
+
+    def as_dict(self):
+        """Map of aliases of the replicas to their health and lag in seconds, as last checked"""
+        with self.lock:
+            return {alias: {'healthy': health['healthy'], 'lag_seconds': health['lag']}
+                    for alias, health in self.health.items() if alias in self.aliases()}
+
+
+replicas = ReplicaPool()
+
+
+def sync_replica(alias):
+    """
+    Copy the primary sqlite database to the replica, standing in
+    for replication of databases which support it. The copy is
+    a consistent snapshot of the primary, taken with the online
+    backup API while it is being written to.
+    """
+    primary, replica = connections[DEFAULT_DB_ALIAS], connections[alias]
+    if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+        raise ValueError("Only sqlite databases can be copied to replicas.")
+    source = sqlite3.connect(primary.settings_dict['NAME'])
+    try:
+        target = sqlite3.connect(replica.settings_dict['NAME'])
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+def replica_reads(view):
+    """
+    Decorator of views whose reads are sent to a healthy replica,
+    unless the request writes or the client has written recently
+    (see api.middleware.ReplicaRoutingMiddleware)
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        state = _routing.get()
+        if state is None or state.pinned or state.wrote or request.method not in SAFE_METHODS:
+            return view(request, *args, **kwargs)
+        # The replica stays chosen for the rest of the request,
+        # including the content of streamed responses
+        state.read_alias = replicas.choose()
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Router sending reads of views decorated with replica_reads to the replica
+    chosen for the request, all other queries and all writes to the primary
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        return state.read_alias if state is not None else None
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            # Reads following a write of the request see it
+            state.wrote = True
+            state.read_alias = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the migrated primary
+        return False if db in ReplicaPool.aliases() else None
@@ -0,0 +1,109 @@
+import re
+
+from django.db import connection, transaction
+
+from .models import Movie
+from .serializers import serialize_movies
+
+# FTS5 table indexing title, plot, actors, director and writer of movies
+# (created by migration 0006), row IDs of the index are movie IDs
+SEARCH_TABLE = 'api_movie_search'
+SEARCH_FIELDS = ['title', 'plot', 'actors', 'director', 'writer']
+
+# Terms of the search query, anything else (e.g. FTS5 operators) is ignored
+TERM_PATTERN = re.compile(r'\w+')
+
+# Words matching most of the movies, which make ranking slow
+# and hardly change it, are skipped unless the query has no other terms
+STOP_WORDS = {'a', 'an', 'and', 'at', 'by', 'for', 'from', 'in', 'is', 'of', 'on', 'or', 'the', 'to', 'with'}
+
+
+class SearchError(ValueError):
+    pass
+
+
+def match_expression(query):
+    """
+    FTS5 expression matching movies containing all terms of the query,
+    each one as a prefix (e.g. "robot"* "mon"*)
+    """
+    terms = TERM_PATTERN.findall(query)
+    if not terms:
+        raise SearchError("The q parameter should contain at least one word.")
+    terms = [t for t in terms if t.lower() not in STOP_WORDS] or terms
+    return ' '.join('"{0}"*'.format(term) for term in terms)
+
+
+def search_movie_ids(query, limit, offset=0):
+    """
+    IDs of movies matching the query, best matches (by BM25 ranking) first.
+    Runs a single query on the full-text index.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT rowid FROM {0} WHERE {0} MATCH %s ORDER BY rank LIMIT %s OFFSET %s'
+                       .format(SEARCH_TABLE), [match_expression(query), limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_movies(query, limit, offset=0):
+    """
+    Page of payloads of movies matching the query in the order of relevance
+    and the offset of the next page (None on the last page)
+    """
+    # One movie more than requested tells if there is a next page
+    movie_ids = search_movie_ids(query, limit + 1, offset)
+    next_offset = offset + limit if len(movie_ids) > limit else None
+    movie_ids = movie_ids[:limit]
+    payloads = {m['movie_id']: m for m in serialize_movies(Movie.objects.filter(pk__in=movie_ids))}
+    return {'results': [payloads[pk] for pk in movie_ids if pk in payloads],
+            'next_offset': next_offset}
+
+
+def index_movies(movies):
+    """
+    Add saved movies to the full-text index, replacing their previous entries.
+    Called after the movies are written, as writes to the index
+    in the same transaction as the movies do not start it.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany('DELETE FROM {0} WHERE rowid = %s'.format(SEARCH_TABLE), [(m.pk,) for m in movies])
+        cursor.executemany('INSERT INTO {0} (rowid, {1}) VALUES (%s, {2})'.format(
+                               SEARCH_TABLE, ', '.join(SEARCH_FIELDS), ', '.join(['%s'] * len(SEARCH_FIELDS))),
+                           [[m.pk] + [getattr(m, f) for f in SEARCH_FIELDS] for m in movies])
+
+
+def unindex_movies(movie_ids):
+    """Remove deleted movies from the full-text index"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany('DELETE FROM {0} WHERE rowid = %s'.format(SEARCH_TABLE), [(pk,) for pk in movie_ids])
+
+
+def rebuild_search_index():
+    """Rebuild the full-text index from the movies table and optimize it"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {0}'.format(SEARCH_TABLE))
+        cursor.execute('INSERT INTO {0} (rowid, {1}) SELECT id, {1} FROM {2}'.format(
+            SEARCH_TABLE, ', '.join(SEARCH_FIELDS), Movie._meta.db_table))
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO {0} ({0}) VALUES ('optimize')".format(SEARCH_TABLE))
+
+
+def check_search_index():
+    """
+    Check the integrity of the full-text index and whether it covers
+    exactly the movies of the movies table.
+    Returns the number of movies missing from the index and of entries
+    of movies which no longer exist. Raises DatabaseError if the index is corrupt.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO {0} ({0}) VALUES ('integrity-check')".format(SEARCH_TABLE))
+        cursor.execute('SELECT COUNT(*) FROM {0} WHERE id NOT IN (SELECT rowid FROM {1})'.format(
+            Movie._meta.db_table, SEARCH_TABLE))
+        missing = cursor.fetchone()[0]
+        cursor.execute('SELECT COUNT(*) FROM {0} WHERE rowid NOT IN (SELECT id FROM {1})'.format(
+            SEARCH_TABLE, Movie._meta.db_table))
+        return missing, cursor.fetchone()[0]
@@ -0,0 +1,135 @@
+from collections import defaultdict
+
+from .instrumentation import timed_section
+from .models import Movie, Rating, Comment
+
+
+def model_field_names(model, fields=None):
+    """
+    Names of the model's concrete, non primary key fields
+    in the order used by django's serializers
+    (only the ones in fields, if provided)
+    """
+    return [f.name for f in model._meta.concrete_fields
+            if not f.primary_key and (fields is None or f.name in fields)]
+
+
+def movie_field_names():
+    """Names of fields of movie payloads, which can be listed by the fields parameter"""
+    return ['movie_id'] + model_field_names(Movie) + ['ratings']
+
+
+def comment_field_names():
+    """Names of fields of comment payloads, which can be listed by the fields parameter"""
+    return ['comment_id'] + model_field_names(Comment)
+
+
+@timed_section('serialization')
+def serialize_movies(movies_qs, fields=None):
+    """
+    Custom function to create json response payloads
+    for a whole query set of movies with related ratings.
+    Runs two queries regardless of the number of movies.
+    With fields only the listed fields (and movie_id) are read
+    and ratings are fetched only if listed, in a single query.
+    """
+
+    # Movie dicts consist of movie's fields and movie_id
+    with_ratings = fields is None or 'ratings' in fields
+    fields = model_field_names(Movie, fields)
+    movie_dicts = []
+    for row in movies_qs.values('pk', *fields):
+        movie_dict = {f: row[f] for f in fields}
+        movie_dict.update({'movie_id': row['pk']})
+        movie_dicts.append(movie_dict)
+    if not movie_dicts or not with_ratings:
+        return [finalize_movie_dict(m, None) for m in movie_dicts]
+
+    # Ratings of all movies are fetched at once and grouped by movie
+    ratings = group_ratings(Rating.objects.filter(movie__in=movies_qs.values('pk')))
+    return [finalize_movie_dict(m, ratings.get(m['movie_id'])) for m in movie_dicts]
+
+
+def iter_serialized_movies(movies_qs, chunk_size, fields=None):
+    """
+    Generator of movie payloads reading the query set in chunks,
+    so that memory use does not depend on the number of movies.
+    Runs one ratings query per chunk (if ratings are listed).
+    """
+    with_ratings = fields is None or 'ratings' in fields
+    fields = model_field_names(Movie, fields)
+    chunk = []
+    for row in movies_qs.values('pk', *fields).iterator(chunk_size=chunk_size):
+        movie_dict = {f: row[f] for f in fields}
+        movie_dict.update({'movie_id': row['pk']})
+        chunk.append(movie_dict)
+        if len(chunk) >= chunk_size:
+            yield from finalize_movies_chunk(chunk, with_ratings)
+            chunk = []
+    if chunk:
+        yield from finalize_movies_chunk(chunk, with_ratings)
+
+
+def finalize_movies_chunk(movie_dicts, with_ratings=True):
+    """Attach ratings fetched for a chunk of movie dicts (if ratings are listed)"""
+    if not with_ratings:
+        return [finalize_movie_dict(m, None) for m in movie_dicts]
+    ratings = group_ratings(Rating.objects.filter(movie__in=[m['movie_id'] for m in movie_dicts]))
+    return [finalize_movie_dict(m, ratings.get(m['movie_id'])) for m in movie_dicts]
+
+
+def serialize_movie(movie):
+    """
+    Custom function to create json response payload
+    consisting of movie details and related ratings
+    """
+    return serialize_movies(Movie.objects.filter(pk=movie.pk))[0]
+
+
+def group_ratings(ratings_qs):
+    """Map of movie IDs to lists of the movie's ratings payloads"""
+    ratings = defaultdict(list)
+    for movie_id, source, value in ratings_qs.order_by('pk').values_list('movie_id', 'source', 'value'):
+        ratings[movie_id].append({'source': source, 'value': value})
+    return ratings
+
+
+def finalize_movie_dict(movie_dict, ratings_list):
+    """Attach ratings to the movie dict and remove null values"""
+
+    # Rating field does not appear if no ratings are related to the movie
+    if ratings_list:
+        movie_dict.update({'ratings': ratings_list})
+
+    # Remove null values
+    return {k: v for (k, v) in movie_dict.items() if v is not None}
+
+
+@timed_section('serialization')
+def serialize_comments(comments_qs, fields=None):
+    """
+    Custom function to create json response payloads
+    for a whole query set of comments in a single query
+    (only with the fields and comment_id, if fields are provided)
+    """
+    return [comment_payload(row) for row in comments_qs.values('pk', *model_field_names(Comment, fields))]
+
+
+def iter_serialized_comments(comments_qs, chunk_size, fields=None):
+    """Generator of comment payloads reading the query set in chunks"""
+    rows = comments_qs.values('pk', *model_field_names(Comment, fields)).iterator(chunk_size=chunk_size)
+    return (comment_payload(row) for row in rows)
+
+
+def comment_payload(row):
+    """Comment payload built from a values() row of the comment"""
+    comment_dict = {k: v for (k, v) in row.items() if k != 'pk'}
+    comment_dict.update({'comment_id': row['pk']})
+
+    # Remove null values
+    return {k: v for (k, v) in comment_dict.items() if v is not None}
+
+
+def serialize_comment(comment):
+    """Custom function to create json response payload for a comment"""
+    return serialize_comments(Comment.objects.filter(pk=comment.pk))[0]
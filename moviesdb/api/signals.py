@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .comments import comments_created, comments_deleted
+from .models import Comment, Movie, MoviePayload, Rating
+from .names import link_movie_names
+from .payloads import materialize_payloads
+from .search import index_movies, unindex_movies
+from .trending import get_trending_counter
+from .versions import MOVIES, bump_versions, comments_version_keys
+
+
+@receiver(post_save, sender=Movie, dispatch_uid='api_movie_saved')
+def movie_saved(sender, instance, created, raw, **kwargs):
+    """Keep genres, people, payload, search index and version of movies in sync with the movie"""
+    if not raw:
+        link_movie_names([instance], replace=not created)
+    materialize_payloads([instance.pk])
+    index_movies([instance])
+    bump_versions([MOVIES])
+
+
+@receiver(post_delete, sender=Movie, dispatch_uid='api_movie_deleted')
+def movie_deleted(sender, instance, **kwargs):
+    """Remove the payload of the deleted movie and the movie from the search index"""
+    MoviePayload.objects.filter(movie_id=instance.pk).delete()
+    unindex_movies([instance.pk])
+    bump_versions([MOVIES])
+
+
+@receiver(post_save, sender=Rating, dispatch_uid='api_rating_saved')
+@receiver(post_delete, sender=Rating, dispatch_uid='api_rating_deleted')
+def rating_changed(sender, instance, **kwargs):
+    """Ratings are listed along with movies"""
+    materialize_payloads([instance.movie_id])
+    bump_versions([MOVIES])
+
+
+@receiver(post_save, sender=Comment, dispatch_uid='api_comment_saved')
+def comment_saved(sender, instance, created, **kwargs):
+    """Keep derived comment data in sync with saved comment"""
+    if created:
+        comments_created([instance])
+    else:
+        bump_versions(comments_version_keys([instance]))
+
+
+@receiver(post_delete, sender=Comment, dispatch_uid='api_comment_deleted')
+def comment_deleted(sender, instance, **kwargs):
+    """Keep derived comment data in sync with deleted comment"""
+    comments_deleted([instance])
+
+
+@receiver(request_started, dispatch_uid='api_resume_import_jobs')
+def resume_import_jobs_on_first_request(sender, **kwargs):
+    """Pick up import jobs queued before the server was restarted"""
+    request_started.disconnect(dispatch_uid='api_resume_import_jobs')
+
+    from .jobs import get_executor, resume_import_jobs_task
+    get_executor().submit(resume_import_jobs_task)
+
+
+@receiver(request_started, dispatch_uid='api_warm_up_trending')
+def warm_up_trending_on_first_request(sender, **kwargs):
+    """Count comments of trending movies before they are first requested"""
+    request_started.disconnect(dispatch_uid='api_warm_up_trending')
+    get_trending_counter()
+
+
+@receiver(connection_created, dispatch_uid='api_sqlite_pragmas')
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Tune new sqlite connections with SQLITE_PRAGMAS setting"""
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {0} = {1}'.format(name, value))
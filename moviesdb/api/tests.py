@@ -1,6 +1,47 @@
-from django.test import Client, TestCase
+import csv
+import gzip
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import skipUnless
+from urllib.parse import parse_qsl, urlparse
 
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, router
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
+from .comments import BULK_COMMENTS_MAX_ITEMS
+from .exports import export_chunks, export_stream
+from .imports import bulk_import_movies, create_movie, import_movie, save_movies_chunk
+from .instrumentation import latency_stats
+from .jobs import resume_import_jobs
+from .models import Movie, MoviePayload, Rating, Comment, CommentDailyCount, ImportJob, RANKING_TIMEZONE
+from .pagination import since_filter
+from .payloads import render_payloads
+from .serializers import serialize_movies
+from .signals import apply_sqlite_pragmas, warm_up_trending_on_first_request
+from .omdb import OMDBCache, OMDBError, fetch_by_imdb_id, fetch_by_title, get_cache, request_omdb
+from .response_cache import get_response_cache, stats as response_cache_stats
+from .routers import PRIMARY_COOKIE, ReplicaPool, replicas
+from . import omdb, trending
+from .rollups import find_comment_counter_mismatches, find_comment_rollup_mismatches
+
+
+# Responses of OMDB API are not cached, so the developer's cache is not filled
+# by tests and results of tests do not depend on earlier runs
+@override_settings(OMDB_CACHE=dict(settings.OMDB_CACHE, PATH=None))
 class APIEndpointsTest(TestCase):
     """Basic tests of the API endpoints"""
 
@@ -116,3 +157,1488 @@ class APIEndpointsTest(TestCase):
             response = self.client.get(url)
             self.assertEqual(response.status_code, 400)
             self.assertTrue(response.json().get('error'))
+
+
+class SerializationTest(TestCase):
+    """Tests of the batched serialization of movies and comments"""
+
+    fixtures = ['movie.json', 'rating.json', 'comment.json']
+
+    def setUp(self):
+        self.client = Client()
+
+    def test_movies_payload_shape(self):
+        """Movie payload contains movie_id, nested ratings and no null values"""
+
+        response = self.client.get('/api/movies/')
+        movie = [m for m in response.json() if m['movie_id'] == 1][0]
+        self.assertEqual(movie['released'], '1964-02-10')
+        self.assertEqual(movie['ratings'], [{'source': 'Internet Movie Database', 'value': '2.3/10'},
+                                            {'source': 'Rotten Tomatoes', 'value': '20%'}])
+        self.assertNotIn('awards', movie)
+
+    def test_comments_payload_shape(self):
+        """Comment payload contains comment_id and movie's ID"""
+
+        response = self.client.get('/api/comments/?movie_id=1')
+        self.assertEqual(response.json(), [{'movie': 1,
+                                            'comment_body': 'Amazing!',
+                                            'added': '2019-07-16T16:00:00Z',
+                                            'comment_id': 1}])
+
+    def test_movies_get_query_count(self):
+        """Number of queries does not depend on the number of movies"""
+
+        # Version of movies and movies with their stored payloads
+        with self.assertNumQueries(2):
+            self.client.get('/api/movies/')
+        for i in range(50):
+            movie = Movie.objects.create(title='Movie {0}'.format(i))
+            Rating.objects.create(movie=movie, source='Source', value='1/10')
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/movies/')
+        self.assertEqual(len(response.json()), 54)
+
+    def test_comments_get_query_count(self):
+        """Comments are serialized in a single query (following the version of comments)"""
+
+        for i in range(50):
+            Comment.objects.create(movie_id=1, comment_body='Comment {0}'.format(i))
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/comments/')
+        self.assertEqual(len(response.json()), 55)
+
+    def test_sparse_fieldsets(self):
+        """Only the listed fields (and IDs) are read and listed, ratings only if listed"""
+
+        get_response_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/movies/?fields=title,imdb_rating')
+        self.assertEqual(len(queries.captured_queries), 2)
+        self.assertNotIn('"plot"', queries.captured_queries[-1]['sql'])
+        movie = [m for m in response.json() if m['movie_id'] == 1][0]
+        self.assertEqual(movie, {'movie_id': 1, 'imdb_rating': 2.3,
+                                 'title': 'The Incredibly Strange Creatures Who Stopped Living '
+                                          'and Became Mixed-Up Zombies!!?'})
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/movies/?fields=ratings&order_by=-imdb_rating&limit=1')
+        self.assertEqual(set(response.json()['results'][0]), {'movie_id', 'ratings', 'imdb_rating'})
+        self.assertIsNotNone(response.json()['next_after'])
+
+        response = self.client.get('/api/comments/?movie_id=1&fields=comment_body')
+        self.assertEqual(response.json(), [{'comment_body': 'Amazing!', 'comment_id': 1}])
+        for url in ['/api/movies/?fields=title,budget', '/api/comments/?fields=']:
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+
+
+class MoviePayloadTest(TestCase):
+    """Tests of the payloads of movies rendered when the movies are written"""
+
+    fixtures = ['movie.json', 'rating.json', 'comment.json']
+
+    def setUp(self):
+        self.client = Client()
+
+    def assertPayloadsFresh(self):
+        """Stored payloads are the same as payloads rendered from scratch"""
+        stored = dict(MoviePayload.objects.values_list('movie_id', 'content'))
+        self.assertEqual(stored, render_payloads(Movie.objects.values_list('pk', flat=True)))
+
+    def test_payloads_follow_writes(self):
+        self.assertPayloadsFresh()
+        movie = Movie.objects.get(pk=1)
+        movie.awards = 'Golden Turkey'
+        movie.save()
+        rating = Rating.objects.create(movie=movie, source='Metacritic', value='10/100')
+        self.assertPayloadsFresh()
+        rating.delete()
+        self.assertPayloadsFresh()
+        movie.delete()
+        self.assertPayloadsFresh()
+        save_movies_chunk([({'title': 'Bulk'}, omdb_movie('Bulk', 'tt0000001'))])
+        self.assertPayloadsFresh()
+
+    def test_ratings_of_imported_movie(self):
+        """Payload of an imported movie is not rendered again for each of its ratings"""
+        # The first import also creates genres, people and version of movies
+        queries = []
+        for i, count in enumerate([1, 1, 10]):
+            omdb_dict = dict(omdb_movie('Imported {0}'.format(i), 'tt{0:07d}'.format(i)),
+                             Ratings=[{'Source': 'Source {0}'.format(j), 'Value': '50%'} for j in range(count)])
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(create_movie(omdb_dict)['status'], 201)
+            queries.append(len(captured))
+        self.assertEqual(queries[1], queries[2])
+        self.assertPayloadsFresh()
+
+    def test_listing_of_payloads(self):
+        """Listed payloads are the same as rendered ones, missing payloads are rendered on the fly"""
+        for url in ['/api/movies/', '/api/movies/?stream=1', '/api/movies/?limit=2',
+                    '/api/movies/?limit=2&order_by=-year']:
+            MoviePayload.objects.filter(movie_id=2).delete()
+            response = self.client.get(url)
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+            movies = json.loads(content.decode('utf-8'))
+            movies = movies['results'] if isinstance(movies, dict) else movies
+            payloads = {m['movie_id']: m for m in serialize_movies(Movie.objects.all())}
+            self.assertEqual(movies, [json.loads(json.dumps(payloads[m['movie_id']], cls=DjangoJSONEncoder))
+                                      for m in movies], url)
+        page = self.client.get('/api/movies/?limit=2&order_by=-year').json()
+        page = self.client.get('/api/movies/', {'limit': 2, 'order_by': '-year', 'after': page['next_after']})
+        self.assertEqual([m['movie_id'] for m in page.json()['results']],
+                         list(Movie.objects.order_by('-release_year', '-pk').values_list('pk', flat=True)[2:4]))
+
+    def test_rematerialize_payloads_command(self):
+        MoviePayload.objects.update(content='{}')
+        MoviePayload.objects.create(movie_id=999, content='{}')
+        out = StringIO()
+        call_command('rematerialize_payloads', stdout=out)
+        self.assertIn("Rendered payloads of 4 movies.", out.getvalue())
+        self.assertPayloadsFresh()
+
+
+class PaginationTest(TestCase):
+    """Tests of keyset pagination and streaming of the list endpoints"""
+
+    fixtures = ['movie.json', 'rating.json', 'comment.json']
+
+    def setUp(self):
+        self.client = Client()
+
+    def test_movies_pages(self):
+        """Following next_after cursors returns every movie exactly once"""
+
+        movie_ids = []
+        url = '/api/movies/?limit=3'
+        while True:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertTrue(len(page['results']) <= 3)
+            movie_ids += [m['movie_id'] for m in page['results']]
+            if page['next_after'] is None:
+                break
+            url = '/api/movies/?limit=3&after={0}'.format(page['next_after'])
+        self.assertEqual(movie_ids, [1, 2, 3, 4])
+
+    def test_comments_pages(self):
+        """Comments are paginated in order of their IDs"""
+
+        response = self.client.get('/api/comments/?after=2&limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c['comment_id'] for c in response.json()['results']], [3, 4])
+        self.assertEqual(response.json()['next_after'], 4)
+
+    def test_comments_since(self):
+        """Polls with next_since cursors return only comments added since the previous poll, oldest first"""
+
+        added = timezone.now() - timedelta(days=1)
+        for body in ['First', 'Second', 'Third']:
+            Comment.objects.create(movie_id=1, comment_body=body, added=added)
+        page = self.client.get('/api/comments/?movie_id=1&since=&limit=2').json()
+        self.assertEqual([c['comment_body'] for c in page['results']], ['Amazing!', 'First'])
+        page = self.client.get('/api/comments/', {'movie_id': 1, 'since': page['next_since']}).json()
+        self.assertEqual([c['comment_body'] for c in page['results']], ['Second', 'Third'])
+
+        # Polls with no new comments run a single query (following the version of comments)
+        since = page['next_since']
+        with self.assertNumQueries(2):
+            page = self.client.get('/api/comments/', {'movie_id': 1, 'since': since}).json()
+        self.assertEqual(page, {'results': [], 'next_since': since})
+        self.client.post('/api/comments/', {'movie_id': 1, 'comment_body': 'New'})
+        self.client.post('/api/comments/', {'movie_id': 2, 'comment_body': 'Other movie'})
+        page = self.client.get('/api/comments/', {'movie_id': 1, 'since': since}).json()
+        self.assertEqual([c['comment_body'] for c in page['results']], ['New'])
+        page = self.client.get('/api/comments/', {'since': since}).json()
+        self.assertEqual([c['comment_body'] for c in page['results']], ['New', 'Other movie'])
+
+        # Comments are listed in the order they were created, so backdated ones are not missed
+        since = page['next_since']
+        self.client.post('/api/comments/bulk/', json.dumps([{'movie_id': 1, 'comment_body': 'Backdated',
+                                                             'added': '2019-07-01T12:00:00Z'}]),
+                         content_type='application/json')
+        page = self.client.get('/api/comments/', {'since': since}).json()
+        self.assertEqual([c['comment_body'] for c in page['results']], ['Backdated'])
+
+    def test_pagination_invalid(self):
+        """Invalid pagination parameters are rejected"""
+
+        for url in ['/api/movies/?limit=0', '/api/movies/?after=x', '/api/comments/?limit=100000',
+                    '/api/comments/?since=x', '/api/comments/?since=WyJ4IiwgMV0=', '/api/comments/?since=&limit=0']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400, url)
+            self.assertTrue(response.json().get('error'), url)
+
+    def test_movies_stream(self):
+        """Streamed movies list is the same as the buffered one"""
+
+        response = self.client.get('/api/movies/?stream=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        streamed = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(streamed, self.client.get('/api/movies/').json())
+
+    def test_comments_stream(self):
+        """Streamed comments list respects movie_id and after parameters"""
+
+        response = self.client.get('/api/comments/?stream=1&movie_id=2&after=2')
+        streamed = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([c['comment_id'] for c in streamed], [5])
+        response = self.client.get('/api/comments/?stream=1&movie_id=3')
+        self.assertEqual(response.status_code, 404)
+
+
+class CommentRollupTest(TestCase):
+    """Tests of the daily counts of comments"""
+
+    fixtures = ['movie.json', 'rating.json', 'comment.json']
+
+    def setUp(self):
+        self.client = Client()
+
+    def test_rollup_follows_comments(self):
+        """Daily counts change as comments are created and deleted"""
+
+        self.assertEqual(find_comment_rollup_mismatches(), [])
+        self.client.post('/api/comments/', {'movie_id': 3, 'comment_body': 'New comment'})
+        comment = Comment.objects.create(movie_id=1, comment_body='Late comment',
+                                         added=datetime(2019, 7, 16, 22, 30, tzinfo=timezone.utc))
+        self.assertEqual(CommentDailyCount.objects.get(movie_id=1, day=date(2019, 7, 17)).count, 1)
+        self.assertEqual(CommentDailyCount.objects.get(movie_id=1, day=date(2019, 7, 16)).count, 1)
+        comment.delete()
+        Comment.objects.filter(pk=2).get().delete()
+        self.assertFalse(CommentDailyCount.objects.filter(movie_id=1, day=date(2019, 7, 17)).exists())
+        self.assertFalse(CommentDailyCount.objects.filter(movie_id=2, day=date(2019, 7, 16)).exists())
+        self.assertEqual(find_comment_rollup_mismatches(), [])
+
+    def test_top_uses_rollup(self):
+        """Ranking counts comments within the date range"""
+
+        response = self.client.get('/api/top/?date_start=2019-07-16&date_end=2019-07-16')
+        counts = {m['movie_id']: m['total_comments'] for m in response.json()}
+        self.assertEqual(counts, {1: 1, 2: 1, 3: 0, 4: 2})
+        response = self.client.get('/api/top/?date_start=2019-07-10&date_end=2019-07-10')
+        counts = {m['movie_id']: m['total_comments'] for m in response.json()}
+        self.assertEqual(counts, {1: 0, 2: 1, 3: 0, 4: 0})
+
+    def test_rebuild_and_check_commands(self):
+        """Inconsistent rollup is detected by the checker and fixed by rebuild"""
+
+        CommentDailyCount.objects.filter(movie_id=4).update(count=7)
+        CommentDailyCount.objects.filter(movie_id=1).delete()
+        with self.assertRaises(CommandError):
+            call_command('check_comment_rollup', stdout=StringIO())
+        call_command('rebuild_comment_rollup', stdout=StringIO())
+        call_command('check_comment_rollup', stdout=StringIO())
+        self.assertEqual(find_comment_rollup_mismatches(), [])
+
+    def test_counters_follow_comments(self):
+        """Counters of comments of movies change as comments are created and deleted"""
+
+        self.assertEqual(find_comment_counter_mismatches(), [])
+        self.client.post('/api/comments/', {'movie_id': 3, 'comment_body': 'New comment'})
+        self.client.post('/api/comments/bulk/', json.dumps([
+            {'movie_id': 3, 'comment_body': 'Old comment', 'added': '2019-07-01T12:00:00Z'},
+            {'movie_id': 1, 'comment_body': 'Late comment', 'added': '2030-01-01T12:00:00Z'},
+            {'movie_id': 1, 'comment_body': 'Later comment', 'added': '2030-01-02T12:00:00Z'}]),
+            content_type='application/json')
+        movie = Movie.objects.get(pk=1)
+        self.assertEqual((movie.comment_count, movie.last_comment_at),
+                         (3, datetime(2030, 1, 2, 12, tzinfo=timezone.utc)))
+        self.assertEqual(Movie.objects.get(pk=3).comment_count, 2)
+        self.assertEqual(find_comment_counter_mismatches(), [])
+        Comment.objects.get(comment_body='Later comment').delete()
+        Comment.objects.filter(movie_id=3).get(comment_body='New comment').delete()
+        self.assertEqual(Movie.objects.get(pk=1).last_comment_at, datetime(2030, 1, 1, 12, tzinfo=timezone.utc))
+        self.assertEqual(find_comment_counter_mismatches(), [])
+
+        # Counters are listed and sorted on
+        movies = self.client.get('/api/movies/?order_by=-comment_count').json()
+        self.assertEqual([(m['movie_id'], m['comment_count']) for m in movies], [(4, 2), (2, 2), (1, 2), (3, 1)])
+        self.assertEqual(movies[2]['last_comment_at'], '2030-01-01T12:00:00Z')
+
+    def test_rebuild_comment_counters_command(self):
+        Movie.objects.filter(pk=4).update(comment_count=7, last_comment_at=None)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_comment_counters', '--check', stdout=StringIO(), stderr=StringIO())
+        out = StringIO()
+        call_command('rebuild_comment_counters', stdout=out)
+        self.assertIn("1 movies repaired", out.getvalue())
+        call_command('rebuild_comment_counters', '--check', stdout=StringIO())
+        self.assertEqual(find_comment_counter_mismatches(), [])
+
+
+class BulkCommentsTest(TestCase):
+    """Tests of the bulk comments endpoint"""
+
+    fixtures = ['movie.json', 'rating.json', 'comment.json']
+
+    def setUp(self):
+        self.client = Client()
+
+    def post_items(self, items):
+        return self.client.post('/api/comments/bulk/', json.dumps(items), content_type='application/json')
+
+    def test_bulk_comments(self):
+        """Valid items are saved with their IDs, invalid ones are reported"""
+
+        top = self.client.get('/api/top/?date_start=2019-07-10&date_end=2019-07-10')
+        items = [{'movie_id': 1, 'comment_body': 'First'},
+                 {'movie_id': 999, 'comment_body': 'Unknown movie'},
+                 {'movie_id': 2, 'comment_body': 'Backdated', 'added': '2019-07-10T12:00:00Z'},
+                 {'movie_id': 2, 'comment_body': 'Bad date', 'added': '2019-13-10'},
+                 {'movie_id': '3', 'comment_body': 'Movie ID as string'},
+                 ['not an object'],
+                 {'movie_id': 3, 'comment_body': 'Local time', 'added': '2019-07-10T23:30:00+02:00'}]
+
+        response = self.post_items(items)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], [201, 400, 201, 400, 400, 400, 201])
+        for item, result in zip(items, results):
+            if result['status'] == 201:
+                self.assertEqual(Comment.objects.get(pk=result['comment_id']).comment_body, item['comment_body'])
+        self.assertEqual(Comment.objects.get(comment_body='Local time').added,
+                         datetime(2019, 7, 10, 21, 30, tzinfo=timezone.utc))
+        self.assertEqual(find_comment_rollup_mismatches(), [])
+
+        # Backdated comments change rankings of past date ranges
+        counts = {m['movie_id']: m['total_comments']
+                  for m in self.client.get('/api/top/?date_start=2019-07-10&date_end=2019-07-10').json()}
+        self.assertEqual(counts, {1: 0, 2: 2, 3: 1, 4: 0})
+        self.assertNotEqual(counts, {m['movie_id']: m['total_comments'] for m in top.json()})
+
+    def test_bulk_comments_queries(self):
+        """Number of queries does not grow with the number of comments"""
+
+        # The first request also creates versions of comments of the movies
+        queries = []
+        for count in [10, 10, 100]:
+            items = [{'movie_id': i % 4 + 1, 'comment_body': 'Bulk',
+                      'added': '2019-07-{0:02d}T12:00:00Z'.format(i % 28 + 1)} for i in range(count)]
+            with CaptureQueriesContext(connection) as captured:
+                response = self.post_items(items)
+            self.assertEqual([r['status'] for r in response.json()['results']], [201] * count)
+            queries.append(len(captured))
+        self.assertEqual(queries[1], queries[2])
+        self.assertEqual(find_comment_rollup_mismatches(), [])
+
+    def test_bulk_comments_invalid(self):
+        for body in ['{"movie_id": 1}', 'not json']:
+            response = self.client.post('/api/comments/bulk/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        with self.settings(DATA_UPLOAD_MAX_MEMORY_SIZE=None):
+            response = self.post_items([{'movie_id': 1, 'comment_body': ''}] * (BULK_COMMENTS_MAX_ITEMS + 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Comment.objects.count(), 5)
+
+
+class TopRankingTest(TestCase):
+    """Tests of ranking and slicing of the top movies"""
+
+    fixtures = ['movie.json', 'rating.json', 'comment.json']
+
+    def setUp(self):
+        self.client = Client()
+        self.url = '/api/top/?date_start=2019-07-10&date_end=2019-07-16'
+
+    def test_dense_rank(self):
+        """Movies with the same number of comments have the same rank"""
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.json(), [{'movie_id': 2, 'total_comments': 2, 'rank': 1},
+                                           {'movie_id': 4, 'total_comments': 2, 'rank': 1},
+                                           {'movie_id': 1, 'total_comments': 1, 'rank': 2},
+                                           {'movie_id': 3, 'total_comments': 0, 'rank': 3}])
+
+    def test_limit_offset(self):
+        """Only the requested slice of the ranking is returned"""
+
+        response = self.client.get(self.url + '&limit=2&offset=1')
+        self.assertEqual([m['movie_id'] for m in response.json()], [4, 1])
+
+    def test_rank_range(self):
+        """Movies are narrowed to the requested ranks"""
+
+        response = self.client.get(self.url + '&min_rank=2')
+        self.assertEqual([(m['movie_id'], m['rank']) for m in response.json()], [(1, 2), (3, 3)])
+        response = self.client.get(self.url + '&max_rank=1&limit=1&offset=1')
+        self.assertEqual([(m['movie_id'], m['rank']) for m in response.json()], [(4, 1)])
+
+    def test_invalid_slice(self):
+        """Invalid slicing parameters are rejected"""
+
+        for params in ['&limit=0', '&offset=-1', '&min_rank=x']:
+            response = self.client.get(self.url + params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertTrue(response.json().get('error'), params)
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is specific to SQLite")
+class QueryPlanTest(TestCase):
+    """
+    Tests running EXPLAIN QUERY PLAN for queries of the endpoints.
+    Full table scans are only allowed for tables listed by the endpoint.
+    """
+
+    fixtures = ['movie.json', 'rating.json', 'comment.json']
+
+    def setUp(self):
+        self.client = Client()
+
+    # Full scan of a table, "SCAN api_movie" (or "SCAN TABLE api_movie" before SQLite 3.36),
+    # but not of results of a subquery ("SCAN (subquery-1)" or "SCAN SUBQUERY 1")
+    SCAN_PATTERN = re.compile(r'^SCAN (?:TABLE )?(?!SUBQUERY |CONSTANT ROW)(\w+)')
+
+    def full_scans(self, sql, params=()):
+        """Tables fully scanned by the query (scans of subquery results are skipped)"""
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            details = [row[-1] for row in cursor.fetchall()]
+        matches = (self.SCAN_PATTERN.match(d) for d in details if 'INDEX' not in d)
+        return {match.group(1) for match in matches if match}
+
+    def assertNoFullScans(self, url, allowed=(), method='get', data=None):
+        with CaptureQueriesContext(connection) as queries:
+            getattr(self.client, method)(url, data)
+        self.assertTrue(queries.captured_queries, url)
+        for query in queries.captured_queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            scans = self.full_scans(query['sql']) - set(allowed)
+            self.assertFalse(scans, "{0}: {1}".format(url, query['sql']))
+
+    def test_movies_queries(self):
+        self.assertNoFullScans('/api/movies/', allowed=['api_movie'])
+        self.assertNoFullScans('/api/movies/?after=2&limit=1')
+
+    def test_movie_lookups(self):
+        for query in [Movie.objects.filter(title='Matango'),
+                      Movie.objects.filter(imdb_id='tt0057181')]:
+            self.assertFalse(self.full_scans(*query.query.sql_with_params()))
+
+    def test_movies_filter_queries(self):
+        self.assertNoFullScans('/api/movies/?genre=horror&actor=John Doe&director=Jane Doe')
+        self.assertNoFullScans('/api/movies/?year_min=1960&year_max=1970')
+        self.assertNoFullScans('/api/movies/?order_by=-imdb_rating&limit=2')
+
+    def test_comments_queries(self):
+        self.assertNoFullScans('/api/comments/', allowed=['api_comment'])
+        self.assertNoFullScans('/api/comments/?movie_id=2')
+        self.assertNoFullScans('/api/comments/?movie_id=2&after=2&limit=1')
+        since = self.client.get('/api/comments/?since=&limit=1').json()['next_since']
+        self.assertNoFullScans('/api/comments/?since={0}'.format(since))
+        self.assertNoFullScans('/api/comments/?movie_id=2&since={0}'.format(since))
+        self.assertNoFullScans('/api/comments/', method='post', data={'movie_id': 1, 'comment_body': 'Text'})
+
+    def test_comments_since_query(self):
+        """Poll for new comments of a movie is a range search of an index of (movie, ID)"""
+        since = Comment.objects.filter(movie=2).order_by('pk').values_list('pk', flat=True).last()
+        sql, params = since_filter(Comment.objects.filter(movie=2), since)[:100].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            details = [row[-1] for row in cursor.fetchall()]
+        self.assertEqual(len(details), 1, details)
+        self.assertRegex(details[0], r'^SEARCH (TABLE )?api_comment USING INDEX \w+ \(movie_id=\? AND rowid>\?\)$')
+
+    def test_top_queries(self):
+        url = '/api/top/?date_start=2019-07-10&date_end=2019-07-16'
+        self.assertNoFullScans(url, allowed=['api_movie'])
+        self.assertNoFullScans(url + '&min_rank=2', allowed=['api_movie', 'ranked'])
+
+
+class SQLitePragmasTest(TestCase):
+    """Tests of tuning of new sqlite connections with SQLITE_PRAGMAS setting"""
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA ' + name)
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied(self):
+        cache_size = self.pragma('cache_size')
+        try:
+            with override_settings(SQLITE_PRAGMAS={'cache_size': -1234, 'temp_store': 'memory'}):
+                apply_sqlite_pragmas(sender=type(connection), connection=connection)
+            self.assertEqual(self.pragma('cache_size'), -1234)
+            self.assertEqual(self.pragma('temp_store'), 2)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA cache_size = {0}'.format(cache_size))
+                cursor.execute('PRAGMA temp_store = default')
+
+    def test_production_pragmas(self):
+        """PRAGMA statements of the production profile are valid (sqlite ignores unknown ones)"""
+        from moviesdb import settings_production
+        pragmas = settings_production.SQLITE_PRAGMAS
+        db_name = os.path.join(tempfile.mkdtemp(), 'production.sqlite3')
+        self.addCleanup(shutil.rmtree, os.path.dirname(db_name))
+        db = sqlite3.connect(db_name)
+        try:
+            for name, value in pragmas.items():
+                db.execute('PRAGMA {0} = {1}'.format(name, value))
+            self.assertEqual(db.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(db.execute('PRAGMA synchronous').fetchone()[0], 1)
+            self.assertEqual(db.execute('PRAGMA busy_timeout').fetchone()[0], pragmas['busy_timeout'])
+            self.assertEqual(db.execute('PRAGMA cache_size').fetchone()[0], pragmas['cache_size'])
+        finally:
+            db.close()
+        # The profile does not change the settings it is based on
+        self.assertEqual(settings.DATABASES['default']['CONN_MAX_AGE'], 0)
+
+
+class MovieFiltersTest(TestCase):
+    """Tests of typed and normalized movie fields and filtering of movies by them"""
+
+    def setUp(self):
+        self.client = Client()
+        self.movies = {}
+        for title, year, genre, actors, rating in [('Alpha', '1960', 'Horror, Comedy', 'John Doe, Jane Roe', '6.1'),
+                                                   ('Beta', '1975–1980', 'horror', 'Jane Roe', '7.5'),
+                                                   ('Gamma', '1984', 'Drama', 'John Doe', 'N/A'),
+                                                   ('Delta', '1990', 'Horror', 'John  Doe', '7.5')]:
+            omdb_dict = dict(omdb_movie(title, 'tt' + title), Year=year, Genre=genre, Actors=actors,
+                             imdbRating=rating)
+            movie = Movie.create_from_omdb_dict(omdb_dict)
+            movie.save()
+            self.movies[title] = movie.pk
+
+    def titles(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        if response.streaming:
+            return [m['title'] for m in json.loads(b''.join(response.streaming_content))]
+        return [m['title'] for m in response.json()]
+
+    def test_normalized_fields(self):
+        """Typed fields, genres and people are set when the movie is saved"""
+
+        movie = Movie.objects.get(title='Beta')
+        self.assertEqual((movie.release_year, movie.runtime_minutes), (1975, 90))
+        self.assertEqual(list(movie.genres.values_list('name', flat=True)), ['Horror'])
+        self.assertEqual(list(movie.directors.values_list('name', flat=True)), ['Jane Doe'])
+        self.assertEqual(Rating.create_from_rating_dict(movie, {'Value': '7.5/10'}).score, 75)
+        self.assertEqual(Rating.create_from_rating_dict(movie, {'Value': '85%'}).score, 85)
+        self.assertIsNone(Rating.create_from_rating_dict(movie, {'Value': 'N/A'}).score)
+
+        # Changed names replace the previous ones
+        movie.actors = 'John Doe'
+        movie.save()
+        self.assertEqual(list(movie.cast.values_list('key', flat=True)), ['john doe'])
+
+    def test_filters(self):
+        self.assertEqual(self.titles('/api/movies/?genre=HORROR'), ['Alpha', 'Beta', 'Delta'])
+        self.assertEqual(self.titles('/api/movies/?genre=horror&actor=john doe'), ['Alpha', 'Delta'])
+        self.assertEqual(self.titles('/api/movies/?year_min=1975&year_max=1984'), ['Beta', 'Gamma'])
+        self.assertEqual(self.titles('/api/movies/?order_by=-imdb_rating'), ['Delta', 'Beta', 'Alpha', 'Gamma'])
+        self.assertEqual(self.titles('/api/movies/?order_by=year&genre=horror&stream=1'),
+                         ['Alpha', 'Beta', 'Delta'])
+        for url in ['/api/movies/?year_min=new', '/api/movies/?order_by=plot',
+                    '/api/movies/?order_by=title&after=1&limit=1']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400, url)
+            self.assertTrue(response.json().get('error'), url)
+
+    def test_sorted_pages(self):
+        """Pages of sorted movies follow each other, including ties and null values"""
+
+        for order_by, expected in [('-imdb_rating', ['Delta', 'Beta', 'Alpha', 'Gamma']),
+                                   ('imdb_rating', ['Gamma', 'Alpha', 'Beta', 'Delta'])]:
+            titles, after = [], ''
+            while after is not None:
+                page = self.client.get('/api/movies/', {'order_by': order_by, 'limit': 1, 'after': after}).json()
+                titles += [m['title'] for m in page['results']]
+                after = page['next_after']
+            self.assertEqual(titles, expected, order_by)
+
+
+class SearchTest(TestCase):
+    """Tests of full-text search of movies"""
+
+    fixtures = ['movie.json', 'rating.json', 'comment.json']
+
+    def setUp(self):
+        self.client = Client()
+
+    def movie_ids(self, q, **params):
+        response = self.client.get('/api/search/', dict(params, q=q))
+        self.assertEqual(response.status_code, 200, q)
+        return [m['movie_id'] for m in response.json()['results']]
+
+    def test_search(self):
+        """Words are matched as prefixes in titles, plots and credits, diacritics are ignored"""
+
+        self.assertEqual(self.movie_ids('mushroom'), [4])
+        self.assertEqual(self.movie_ids('outer spa'), [2])
+        self.assertEqual(self.movie_ids('cetin inanc'), [3])
+        self.assertEqual(self.movie_ids('steckler'), [1])
+        self.assertEqual(self.movie_ids('"plan" -outer* (9)'), [2])
+        self.assertEqual(self.movie_ids('zombies werewolves'), [])
+
+    def test_ranking_and_pages(self):
+        """Title matches are ranked first, results are paginated with limit and offset"""
+
+        Movie.objects.create(title='Evil Space Wizard')
+        wizard = Movie.objects.get(title='Evil Space Wizard').pk
+        self.assertEqual(self.movie_ids('evil'), [wizard, 2, 3])
+        page = self.client.get('/api/search/', {'q': 'evil', 'limit': 2}).json()
+        self.assertEqual(page['next_offset'], 2)
+        self.assertEqual(self.movie_ids('evil', limit=2, offset=2), [3])
+        self.assertEqual(page['results'][1]['ratings'][0]['source'], 'Internet Movie Database')
+
+    def test_index_follows_changes(self):
+        movie = Movie.objects.get(pk=4)
+        movie.plot = 'Survivors turn into fungi.'
+        movie.save()
+        self.assertEqual(self.movie_ids('mushrooms'), [])
+        self.assertEqual(self.movie_ids('fungi'), [4])
+        Movie.objects.filter(pk=4).delete()
+        self.assertEqual(self.movie_ids('fungi'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        call_command('rebuild_search_index', '--check', stdout=StringIO())
+        self.assertEqual(self.movie_ids('plan'), [2, 3])
+
+    def test_search_invalid(self):
+        for params in [{}, {'q': '*'}, {'q': 'plan', 'limit': 0}, {'q': 'plan', 'offset': 'x'}]:
+            response = self.client.get('/api/search/', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertTrue(response.json().get('error'), params)
+
+
+class ConditionalGetTest(TestCase):
+    """Tests of ETag and Last-Modified validators of the list endpoints"""
+
+    fixtures = ['movie.json', 'rating.json', 'comment.json']
+
+    def setUp(self):
+        self.client = Client()
+
+    def assertNotModified(self, url, **headers):
+        """Request with validators of the current version gets 304 in a single query"""
+        with self.assertNumQueries(1):
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 304, url)
+        self.assertEqual(response.content, b'')
+
+    def test_not_modified(self):
+        for url in ['/api/movies/', '/api/movies/?genre=horror&limit=2', '/api/comments/',
+                    '/api/comments/?movie_id=1', '/api/top/?date_start=2019-07-10&date_end=2019-07-16']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotModified(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertNotModified(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+
+    def test_writes_change_versions(self):
+        """Writes to a resource change its ETag, writes to other resources do not"""
+
+        def etag(url):
+            return self.client.get(url)['ETag']
+
+        movies, comments, movie_1, movie_2 = [etag(u) for u in ['/api/movies/', '/api/comments/',
+                                                                '/api/comments/?movie_id=1',
+                                                                '/api/comments/?movie_id=2']]
+        titles = etag('/api/movies/?fields=title')
+        by_comments = etag('/api/movies/?fields=title&order_by=comment_count')
+        self.client.post('/api/comments/', {'movie_id': 1, 'comment_body': 'Text'})
+        self.assertNotEqual(etag('/api/comments/'), comments)
+        self.assertNotEqual(etag('/api/comments/?movie_id=1'), movie_1)
+        self.assertEqual(etag('/api/comments/?movie_id=2'), movie_2)
+
+        # Movies are listed with counters of their comments, unless only other fields are listed
+        self.assertNotEqual(etag('/api/movies/'), movies)
+        self.assertNotEqual(etag('/api/movies/?fields=title&order_by=comment_count'), by_comments)
+        self.assertEqual(etag('/api/movies/?fields=title'), titles)
+        movies = etag('/api/movies/')
+
+        Rating.objects.create(movie_id=1, source='Metacritic', value='10/100')
+        self.assertNotEqual(etag('/api/movies/'), movies)
+        movies = etag('/api/movies/')
+        save_movies_chunk([({'title': 'Bulk'}, omdb_movie('Bulk', 'tt0000001'))])
+        self.assertNotEqual(etag('/api/movies/'), movies)
+
+        # Validators of outdated versions do not match
+        response = self.client.get('/api/comments/?movie_id=1', HTTP_IF_NONE_MATCH=movie_1)
+        self.assertEqual(response.status_code, 200)
+
+    def test_top_versioned_by_movies(self):
+        """Rankings list movies without comments, so creating a movie changes their ETag"""
+        url = '/api/top/?date_start=2019-07-10&date_end=2019-07-16'
+        etag = self.client.get(url)['ETag']
+        Movie.objects.create(title='Not commented on')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ResponseCacheTest(TestCase):
+    """Tests of the server-side cache of responses of the list endpoints"""
+
+    fixtures = ['movie.json', 'rating.json', 'comment.json']
+
+    def setUp(self):
+        self.client = Client()
+        get_response_cache().clear()
+        response_cache_stats.reset()
+
+    def assertCached(self, url, content):
+        """Cached response is served with the version lookup as the only query"""
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        self.assertEqual(response.content, content, url)
+
+    def test_cached_responses(self):
+        contents = []
+        for url in ['/api/movies/', '/api/comments/?movie_id=1',
+                    '/api/top/?date_start=2019-07-10&date_end=2019-07-16&limit=2']:
+            contents.append(self.client.get(url).content)
+            self.assertCached(url, contents[-1])
+
+        # Order of query parameters does not matter
+        contents.append(self.client.get('/api/movies/?genre=horror&limit=2').content)
+        self.assertCached('/api/movies/?limit=2&genre=horror', contents[-1])
+
+        # Errors and streamed responses are not cached
+        self.client.get('/api/comments/?movie_id=999')
+        self.client.get('/api/movies/?stream=1')
+        stats = self.client.get('/api/_stats/').json()['response_cache']
+        self.assertEqual((stats['hits'], stats['misses'], stats['stores']), (4, 6, 4))
+        self.assertEqual(stats['hit_ratio'], 0.4)
+        self.assertEqual(stats['bytes_stored'], sum(len(c) for c in contents))
+        self.assertEqual(stats['bytes_served'], stats['bytes_stored'])
+
+    def test_writes_invalidate_responses(self):
+        """Writes make responses listing the written resources stale, and only them"""
+        urls = ['/api/movies/', '/api/comments/', '/api/comments/?movie_id=1', '/api/comments/?movie_id=2']
+        movies, comments, movie_1, movie_2 = [self.client.get(url).content for url in urls]
+        self.client.post('/api/comments/', {'movie_id': 1, 'comment_body': 'Cached?'})
+        self.assertIn(b'Cached?', self.client.get('/api/comments/').content)
+        self.assertIn(b'Cached?', self.client.get('/api/comments/?movie_id=1').content)
+        self.assertCached('/api/comments/?movie_id=2', movie_2)
+        counts = {m['movie_id']: m['comment_count'] for m in self.client.get('/api/movies/').json()}
+        self.assertEqual(counts, {m['movie_id']: m['comment_count'] + (m['movie_id'] == 1)
+                                  for m in json.loads(movies.decode('utf-8'))})
+
+        Movie.objects.create(title='Cached movie')
+        self.assertIn(b'Cached movie', self.client.get('/api/movies/').content)
+
+    def test_past_top_ranges(self):
+        """Rankings of past date ranges change only with comments counted in past days"""
+        past = '/api/top/?date_start=2019-07-10&date_end=2019-07-16'
+        today = timezone.localtime(timezone.now(), RANKING_TIMEZONE).date().isoformat()
+        current = '/api/top/?date_start=2019-07-10&date_end={0}'.format(today)
+        past_content, current_content = self.client.get(past).content, self.client.get(current).content
+
+        self.client.post('/api/comments/', {'movie_id': 3, 'comment_body': 'Today'})
+        self.assertCached(past, past_content)
+        self.assertNotEqual(self.client.get(current).content, current_content)
+
+        Comment.objects.create(movie_id=3, comment_body='Backdated',
+                               added=datetime(2019, 7, 12, 12, tzinfo=RANKING_TIMEZONE))
+        self.assertNotEqual(self.client.get(past).content, past_content)
+
+    def test_file_based_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir}
+        with override_settings(CACHES=dict(settings.CACHES, responses=cache)):
+            content = self.client.get('/api/movies/').content
+            self.assertCached('/api/movies/', content)
+            self.assertTrue(os.listdir(cache_dir))
+
+    def test_oversized_responses(self):
+        with override_settings(RESPONSE_CACHE=dict(settings.RESPONSE_CACHE, MAX_ITEM_SIZE=100)):
+            self.client.get('/api/movies/')
+            with self.assertNumQueries(2):
+                self.client.get('/api/movies/')
+        self.assertEqual(response_cache_stats.as_dict()['oversized'], 2)
+
+
+class PerformanceMiddlewareTest(TestCase):
+    """Tests of query counts and timings of requests"""
+
+    fixtures = ['movie.json', 'rating.json', 'comment.json']
+
+    def setUp(self):
+        self.client = Client()
+        get_response_cache().clear()
+        latency_stats.reset()
+
+    def server_timing(self, response):
+        """Map of names of Server-Timing metrics to their parameters"""
+        timings = {}
+        for metric in response['Server-Timing'].split(', '):
+            name, *params = metric.split(';')
+            timings[name] = dict(param.split('=', 1) for param in params)
+        return timings
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/comments/?movie_id=1')
+        timings = self.server_timing(response)
+        self.assertEqual(timings['db']['desc'], '"{0} queries"'.format(len(queries.captured_queries)))
+        self.assertEqual(set(timings), {'db', 'serialization', 'omdb', 'total'})
+        self.assertGreater(float(timings['serialization']['dur']), 0)
+        self.assertGreaterEqual(float(timings['total']['dur']), float(timings['db']['dur']))
+
+    def test_log_line(self):
+        with self.assertLogs('api.performance', 'INFO') as logs:
+            response = self.client.get('/api/movies/?stream=1')
+            self.assertEqual(logs.output, [])
+            content = b''.join(response.streaming_content)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line['view'], line['status'], line['response_bytes']),
+                         ('api.views.movies', 200, len(content)))
+        self.assertGreater(line['queries'], 0)
+
+    def test_endpoint_latencies(self):
+        for _ in range(3):
+            self.client.get('/api/movies/')
+        self.client.get('/api/top/?date_start=2019-07-10&date_end=2019-07-16')
+        endpoints = self.client.get('/api/_stats/').json()['endpoints']
+        self.assertEqual(endpoints['api.views.movies']['count'], 3)
+        self.assertEqual(endpoints['api.views.top']['count'], 1)
+        movies = endpoints['api.views.movies']
+        self.assertTrue(0 < movies['p50_ms'] <= movies['p95_ms'] <= movies['p99_ms'])
+
+
+class ReplicaRoutingTest(TransactionTestCase):
+    """Tests of reads sent to replicas of the database, copied from the primary with sync_replicas"""
+
+    fixtures = ['movie.json', 'rating.json', 'comment.json']
+
+    aliases = ['replica1', 'replica2']
+
+    def setUp(self):
+        self.client = Client()
+        get_response_cache().clear()
+        replicas.reset()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for alias in self.aliases:
+            connections.databases[alias] = dict(connections.databases['default'],
+                                                NAME=os.path.join(directory, alias + '.sqlite3'))
+            self.addCleanup(self.remove_alias, alias)
+        replica_settings = override_settings(DATABASE_REPLICAS=self.aliases)
+        replica_settings.enable()
+        self.addCleanup(replica_settings.disable)
+        call_command('sync_replicas', stdout=StringIO())
+
+    @staticmethod
+    def remove_alias(alias):
+        connections[alias].close()
+        del connections[alias]
+        del connections.databases[alias]
+
+    def comment_count(self, client, movie_id=1):
+        response = client.get('/api/comments/?movie_id={0}'.format(movie_id))
+        self.assertEqual(response.status_code, 200)
+        return len(response.json())
+
+    def test_read_your_writes(self):
+        count = self.comment_count(self.client)
+        Comment.objects.create(movie_id=1, comment_body="Written to the primary")
+
+        # The replica has not been synced yet
+        self.assertEqual(self.comment_count(self.client), count)
+
+        response = self.client.post('/api/comments/', {'movie_id': 1, 'comment_body': "Posted"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]['max-age'], settings.READ_YOUR_WRITES_SECONDS)
+        self.assertGreater(settings.READ_YOUR_WRITES_SECONDS, settings.REPLICA_MAX_LAG + settings.REPLICA_CHECK_INTERVAL)
+        self.assertEqual(self.comment_count(self.client), count + 2)
+        self.assertEqual(self.comment_count(Client()), count)
+
+        # Streamed content is read from the replica when it is sent
+        streamed = Client().get('/api/comments/?movie_id=1&stream=1')
+        self.assertEqual(len(json.loads(b''.join(streamed.streaming_content))), count)
+
+        call_command('sync_replicas', stdout=StringIO())
+        self.assertEqual(self.comment_count(Client()), count + 2)
+
+    def test_slow_health_check(self):
+        """Requests do not wait for a health check of a replica, they skip it until it is done"""
+        pool = ReplicaPool()
+        started, finish = threading.Event(), threading.Event()
+
+        def check(alias):
+            if alias == 'replica2':
+                started.set()
+                finish.wait(5)
+            return 0.0
+
+        pool.check = check
+        checking = threading.Thread(target=pool.healthy)
+        checking.start()
+        self.assertTrue(started.wait(5))
+        try:
+            self.assertEqual([pool.choose() for _ in range(2)], ['replica1', 'replica1'])
+        finally:
+            finish.set()
+            checking.join()
+        self.assertEqual(sorted(pool.healthy()), ['replica1', 'replica2'])
+
+    @override_settings(READ_YOUR_WRITES_SECONDS=10, REPLICA_MAX_LAG=60, REPLICA_CHECK_INTERVAL=5)
+    def test_read_your_writes_outlasts_lag(self):
+        """Clients read from the primary until replicas missing their writes are found lagging"""
+        response = self.client.post('/api/comments/', {'movie_id': 1, 'comment_body': "Posted"})
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]['max-age'], 66)
+
+    def test_round_robin_and_health(self):
+        self.assertEqual([replicas.choose() for _ in range(4)], ['replica2', 'replica1', 'replica2', 'replica1'])
+        self.assertFalse(router.allow_migrate('replica1', 'api'))
+
+        # Replicas which cannot be queried are skipped until they are checked again
+        connections['replica2'].close()
+        connections['replica2'].settings_dict['NAME'] = os.path.join(tempfile.gettempdir(), 'missing', 'db')
+        replicas.reset()
+        self.assertEqual({replicas.choose() for _ in range(4)}, {'replica1'})
+        self.assertEqual(self.client.get('/api/_stats/').json()['replicas'],
+                         {'replica1': {'healthy': True, 'lag_seconds': 0.0},
+                          'replica2': {'healthy': False, 'lag_seconds': None}})
+
+        # Replicas missing writes older than REPLICA_MAX_LAG are not used, reads go to the primary
+        Comment.objects.create(movie_id=1, comment_body="Written to the primary")
+        time.sleep(0.01)
+        replicas.reset()
+        with override_settings(REPLICA_MAX_LAG=0.005):
+            self.assertIsNone(replicas.choose())
+            self.assertEqual(self.comment_count(self.client), Comment.objects.filter(movie_id=1).count())
+        self.assertGreater(replicas.as_dict()['replica1']['lag_seconds'], 0.005)
+
+
+class ExportTest(TestCase):
+    """Tests of exports of whole tables"""
+
+    fixtures = ['movie.json', 'rating.json', 'comment.json']
+
+    def setUp(self):
+        self.client = Client()
+
+    def test_ndjson_export(self):
+        """Exported rows are payloads of the API (with null values)"""
+        response = self.client.get('/api/export/comments/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.client.get('/api/comments/').json())
+
+        movies = [json.loads(line) for line in ''.join(export_stream('movies', 'ndjson')).splitlines()]
+        self.assertEqual([{k: v for k, v in m.items() if v is not None} for m in movies],
+                         [{k: v for k, v in m.items() if k != 'ratings'} for m in self.client.get('/api/movies/').json()])
+
+    def test_csv_export(self):
+        response = self.client.get('/api/export/ratings/?format=csv', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        rows = list(csv.reader(StringIO(gzip.decompress(b''.join(response.streaming_content)).decode('utf-8'))))
+        self.assertEqual(rows[0], ['rating_id', 'movie', 'source', 'value', 'score'])
+        self.assertEqual(len(rows), Rating.objects.count() + 1)
+
+        # Tables are read in chunks
+        chunks = list(export_chunks('ratings', chunk_size=2))
+        self.assertEqual(len(chunks), (Rating.objects.count() + 1) // 2)
+        self.assertEqual([row[0] for chunk in chunks for row in chunk], [int(row[0]) for row in rows[1:]])
+
+        for url, status in [('/api/export/genres/', 404), ('/api/export/movies/?format=xml', 400)]:
+            self.assertEqual(self.client.get(url).status_code, status, url)
+
+    def test_export_command(self):
+        path = os.path.join(tempfile.mkdtemp(), 'comments.csv.gz')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        err = StringIO()
+        call_command('export', 'comments', '--format', 'csv', '--gzip', '--output', path, stderr=err)
+        self.assertIn('Exported {0} comments'.format(Comment.objects.count()), err.getvalue())
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as export_file:
+            content = export_file.read()
+        self.assertEqual(content, ''.join(export_stream('comments', 'csv')))
+
+
+class TrendingTest(TransactionTestCase):
+    """Tests of the ranking of movies by comments counted in memory"""
+
+    fixtures = ['movie.json', 'rating.json', 'comment.json']
+
+    def setUp(self):
+        self.client = Client()
+        trending._counter = None
+        self.addCleanup(setattr, trending, '_counter', None)
+
+    def ranking(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return [(m['movie_id'], m['total_comments'], m['rank']) for m in response.json()]
+
+    def test_trending_counter(self):
+        clock = [3600.0 * 24 + 45]
+        counter = trending.TrendingCounter(60, clock=lambda: clock[0])
+
+        def comment(movie_id, seconds_ago, pk=None):
+            added = datetime.fromtimestamp(clock[0] - seconds_ago, timezone.utc)
+            return Comment(pk=pk, movie_id=movie_id, added=added)
+
+        counter.warm_up([(1, 1, comment(1, 30).added), (2, 2, comment(2, 600).added)])
+        counter.add([comment(1, 30, pk=1), comment(3, 0, pk=3), comment(3, 90, pk=4), comment(2, 3600, pk=5)])
+        self.assertEqual(counter.top(60, 10), [(3, 2), (1, 1), (2, 1)])
+        self.assertEqual(counter.top(1, 10), [(1, 1), (3, 1)])
+        self.assertEqual(counter.top(60, 1), [(3, 2)])
+        counter.add([comment(3, 0, pk=3)], sign=-1)
+        self.assertEqual(counter.top(1, 10), [(1, 1)])
+
+        # Buckets of minutes out of the window are reused
+        clock[0] += 30 * 60
+        counter.add([comment(4, 0, pk=6)])
+        self.assertEqual(counter.top(60, 10), [(1, 1), (2, 1), (3, 1), (4, 1)])
+        clock[0] += 60 * 60
+        self.assertEqual(counter.top(60, 10), [])
+
+        # Comments dated in the future are not counted and do not reset buckets of the window
+        counter.add([comment(5, 0, pk=pk) for pk in range(7, 12)])
+        counter.add([comment(6, -60 * 60, pk=12)])
+        clock[0] += 60
+        self.assertEqual(counter.top(60, 10), [(5, 5)])
+        clock[0] += 59 * 60
+        self.assertEqual(counter.top(60, 10), [])
+
+        # Comments recorded while the counter is warmed up are counted once,
+        # the ones deleted before warm up reads them are not counted
+        counter = trending.TrendingCounter(60, clock=lambda: clock[0])
+        counter.begin_warm_up()
+        counter.add([comment(1, 0, pk=1), comment(2, 0, pk=2)])
+        counter.add([comment(2, 0, pk=2), comment(3, 0, pk=3)], sign=-1)
+        counter.warm_up([(pk, pk, comment(pk, 0).added) for pk in range(1, 5)])
+        counter.add([comment(4, 0, pk=4), comment(5, 0, pk=5)])
+        self.assertEqual(counter.top(60, 10), [(1, 1), (4, 1), (5, 1)])
+
+    def test_trending_endpoint(self):
+        Comment.objects.create(movie_id=2, comment_body='Before first use',
+                               added=timezone.now() - timedelta(minutes=90))
+        Comment.objects.create(movie_id=4, comment_body='Before first use')
+        self.assertEqual(self.ranking('/api/trending/'), [(4, 1, 1)])
+        for movie_id in [1, 1, 2]:
+            self.client.post('/api/comments/', {'movie_id': movie_id, 'comment_body': 'Trending'})
+        self.client.post('/api/comments/bulk/', json.dumps([{'movie_id': 3, 'comment_body': 'Old',
+                                                             'added': '2019-07-10T12:00:00Z'}]),
+                         content_type='application/json')
+        self.assertEqual(self.ranking('/api/trending/?window=1h'), [(1, 2, 1), (2, 1, 2), (4, 1, 2)])
+        self.assertEqual(self.ranking('/api/trending/?window=2h&limit=2'), [(1, 2, 1), (2, 2, 1)])
+        Comment.objects.filter(movie_id=4).latest('added').delete()
+        self.assertEqual(self.ranking('/api/trending/?window=30m'), [(1, 2, 1), (2, 1, 2)])
+
+        for url in ['/api/trending/?window=1d', '/api/trending/?window=0m', '/api/trending/?window=25h',
+                    '/api/trending/?limit=0']:
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+
+    def test_warm_up_on_first_request(self):
+        Comment.objects.create(movie_id=4, comment_body='Before first request')
+        warm_up_trending_on_first_request(sender=None)
+        self.assertEqual(trending._counter.top(60, 10), [(4, 1)])
+
+
+class StubOMDBServer:
+    """
+    Local HTTP server answering like OMDB API for the known titles
+    and counting the requests it has received
+    """
+
+    def __init__(self, movies, delay=0):
+        self.movies = movies
+        self.delay = delay
+        self.status = 200
+        self.requests = []
+        self.connections = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                params = dict(parse_qsl(urlparse(self.path).query))
+                stub.requests.append(params)
+                stub.connections.add(self.client_address)
+                time.sleep(stub.delay)
+                body = json.dumps(stub.lookup(params)).encode()
+                self.send_response(stub.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                if stub.status != 200:
+                    self.send_header('Connection', 'close')
+                    self.close_connection = True
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{0}/'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def lookup(self, params):
+        for movie in self.movies:
+            if params.get('t', '').strip().lower() == movie['Title'].lower() or params.get('i') == movie['imdbID']:
+                return movie
+        return {'Response': "False", 'Error': "Movie not found!"}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def omdb_movie(title, imdb_id):
+    """Minimal OMDB response of a movie"""
+    return {'Title': title, 'Year': '1990', 'Released': '01 Jul 1990', 'Runtime': '90 min',
+            'Genre': 'Horror, Comedy', 'Director': 'Jane Doe', 'Actors': 'John Doe, Jane Roe',
+            'imdbRating': '5.5', 'imdbVotes': '1,234', 'imdbID': imdb_id, 'BoxOffice': 'N/A',
+            'Ratings': [{'Source': 'Internet Movie Database', 'Value': '5.5/10'},
+                        {'Source': 'Rotten Tomatoes', 'Value': '40%'}],
+            'Response': "True"}
+
+
+class StubOMDBTestMixin:
+    """Runs the stub OMDB server and a fresh OMDB cache for each test"""
+
+    stub_movies = [omdb_movie('Robot Monster', 'tt0046248'),
+                   omdb_movie('The Creeping Terror', 'tt0057569')]
+    stub_delay = 0
+
+    def setUp(self):
+        super().setUp()
+        self.stub = StubOMDBServer(self.stub_movies, delay=self.stub_delay)
+        self.cache_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            OMDB_API_URL=self.stub.url,
+            OMDB_CACHE={'PATH': os.path.join(self.cache_dir, 'omdb.sqlite3'),
+                        'TTL': 60, 'NEGATIVE_TTL': 60, 'MAX_ENTRIES': 100})
+        self.settings_override.enable()
+        self.client = Client()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.stub.close()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        super().tearDown()
+
+
+class OMDBCacheTest(StubOMDBTestMixin, TestCase):
+    """Tests of the cache of OMDB responses"""
+
+    def test_repeated_title_hits_cache(self):
+        """Title looked up again is not fetched from OMDB"""
+
+        response = self.client.post('/api/movies/', {'title': 'Robot Monster'})
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/movies/', {'title': '  robot   MONSTER'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertEqual(fetch_by_imdb_id('tt0046248')['Title'], 'Robot Monster')
+        self.assertEqual(len(self.stub.requests), 1)
+        stats = get_cache().stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+
+    def test_not_found_is_cached(self):
+        """Not found responses are cached too, with their own time to live"""
+
+        for _ in range(2):
+            response = self.client.post('/api/movies/', {'title': 'Horsenado'})
+            self.assertEqual(response.status_code, 404)
+        self.assertEqual(len(self.stub.requests), 1)
+        with override_settings(OMDB_CACHE=dict(settings.OMDB_CACHE, NEGATIVE_TTL=0)):
+            fetch_by_title('The Shroom')
+            fetch_by_title('The Shroom')
+        self.assertEqual(len(self.stub.requests), 3)
+
+    def test_expiry(self):
+        """Entries expire after TTL"""
+
+        with override_settings(OMDB_CACHE=dict(settings.OMDB_CACHE, TTL=0.5)):
+            fetch_by_title('Robot Monster')
+            fetch_by_title('Robot Monster')
+            self.assertEqual(len(self.stub.requests), 1)
+            time.sleep(0.6)
+            fetch_by_title('Robot Monster')
+        self.assertEqual(len(self.stub.requests), 2)
+
+    def test_persistence(self):
+        """Entries survive reopening of the cache file"""
+
+        path = os.path.join(self.cache_dir, 'persistent.sqlite3')
+        cache = OMDBCache(path, ttl=60, negative_ttl=60, max_entries=100)
+        cache.store(omdb_movie('Robot Monster', 'tt0046248'), keys=['title:robot monster'])
+        cache.close()
+        cache = OMDBCache(path, ttl=60, negative_ttl=60, max_entries=100)
+        self.assertEqual(cache.get('imdb:tt0046248')['Title'], 'Robot Monster')
+        cache.close()
+
+    def test_lru_eviction(self):
+        """Least recently used entries are evicted above the size limit"""
+
+        cache = OMDBCache(os.path.join(self.cache_dir, 'lru.sqlite3'), ttl=60, negative_ttl=60, max_entries=3,
+                          access_update_interval=0)
+        for i in range(3):
+            cache.store({'Response': "False", 'Error': "Movie not found!"}, keys=['title:{0}'.format(i)])
+        cache.get('title:0')
+        cache.store({'Response': "False", 'Error': "Movie not found!"}, keys=['title:3'])
+        self.assertIsNone(cache.get('title:1'))
+        self.assertIsNotNone(cache.get('title:0'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        cache.close()
+
+    def test_hits_do_not_write(self):
+        """Last access and counters of recently accessed entries are not written on hits"""
+
+        path = os.path.join(self.cache_dir, 'hits.sqlite3')
+        cache = OMDBCache(path, ttl=60, negative_ttl=60, max_entries=100)
+        cache.store(omdb_movie('Robot Monster', 'tt0046248'), keys=['title:robot monster'])
+        changes = cache.db.total_changes
+        for _ in range(3):
+            self.assertEqual(cache.get('title:robot monster')['Title'], 'Robot Monster')
+        self.assertIsNone(cache.get('title:the creeping terror'))
+        self.assertEqual(cache.db.total_changes, changes)
+
+        # Counters kept in memory are written when the cache is closed
+        cache.close()
+        cache = OMDBCache(path, ttl=60, negative_ttl=60, max_entries=100)
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (3, 1))
+        cache.close()
+
+
+class ImportJobsTest(StubOMDBTestMixin, TransactionTestCase):
+    """Tests of asynchronous movie imports"""
+
+    def wait_for_job(self, job_id, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = self.client.get('/api/jobs/{0}/'.format(job_id)).json()
+            if job['status'] in (ImportJob.SUCCEEDED, ImportJob.FAILED):
+                return job
+            time.sleep(0.02)
+        self.fail("Job {0} did not finish in time".format(job_id))
+
+    def test_async_import(self):
+        """Async post returns job which ends with the created movie"""
+
+        response = self.client.post('/api/movies/', {'title': 'Robot Monster', 'async': '1'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Location'], '/api/jobs/{0}/'.format(response.json()['job_id']))
+        job = self.wait_for_job(response.json()['job_id'])
+        self.assertEqual(job['status'], ImportJob.SUCCEEDED)
+        self.assertEqual(Movie.objects.get(pk=job['movie_id']).title, 'Robot Monster')
+        self.assertEqual(Rating.objects.filter(movie_id=job['movie_id']).count(), 2)
+
+    def test_async_import_not_found(self):
+        """Job of movie not found in OMDB fails with the error"""
+
+        response = self.client.post('/api/movies/', {'title': 'Horsenado', 'async': '1'})
+        job = self.wait_for_job(response.json()['job_id'])
+        self.assertEqual(job['status'], ImportJob.FAILED)
+        self.assertEqual(job['result_status'], 404)
+        self.assertTrue(job['error'])
+
+    def test_resume_jobs(self):
+        """Pending and stale running jobs from before a restart are picked up"""
+
+        pending = ImportJob.objects.create(title='Robot Monster')
+        stale = ImportJob.objects.create(title='The Creeping Terror', status=ImportJob.RUNNING,
+                                         updated=timezone.now() - timedelta(hours=1))
+        running = ImportJob.objects.create(title='Nukie', status=ImportJob.RUNNING)
+        self.assertEqual(resume_import_jobs(), 2)
+        self.assertEqual(self.wait_for_job(pending.pk)['status'], ImportJob.SUCCEEDED)
+        self.assertEqual(self.wait_for_job(stale.pk)['status'], ImportJob.SUCCEEDED)
+        self.assertEqual(ImportJob.objects.get(pk=running.pk).status, ImportJob.RUNNING)
+
+    def test_job_not_found(self):
+        response = self.client.get('/api/jobs/12345/')
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(response.json().get('error'))
+
+
+class ImportCoalescingTest(StubOMDBTestMixin, TransactionTestCase):
+    """Tests of coalescing of concurrent imports of the same title"""
+
+    stub_delay = 0.2
+
+    def test_concurrent_posts(self):
+        """Concurrent posts of one title make one upstream call and one movie"""
+
+        threads_count = 200
+        barrier = threading.Barrier(threads_count)
+        statuses = []
+
+        def post(title):
+            barrier.wait()
+            try:
+                statuses.append(Client().post('/api/movies/', {'title': title}).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=post, args=(['Robot Monster', 'robot monster '][i % 2],))
+                   for i in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertEqual(Movie.objects.filter(title='Robot Monster').count(), 1)
+        self.assertEqual(sorted(statuses), [201] + [409] * (threads_count - 1))
+
+    def test_shared_errors(self):
+        """Requests joining a failed import get the same error"""
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(import_movie('Horsenado')['status']))
+                   for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [404] * 10)
+        self.assertEqual(len(self.stub.requests), 1)
+
+
+class BulkImportTest(StubOMDBTestMixin, TestCase):
+    """Tests of bulk movie imports"""
+
+    stub_movies = [omdb_movie('Bulk Movie {0}'.format(i), 'tt{0:07d}'.format(i)) for i in range(120)]
+
+    def test_bulk_endpoint(self):
+        """Each title gets its own outcome in the report"""
+
+        Movie.objects.create(title='Bulk Movie 1')
+        titles = ['Bulk Movie 0', 'Bulk Movie 1', 'Horsenado', 'bulk movie 0', 'Bulk Movie 2']
+        response = self.client.post('/api/movies/bulk/', json.dumps({'titles': titles}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        report = response.json()['results']
+        self.assertEqual([(r['title'], r['status']) for r in report],
+                         [('Bulk Movie 0', 201), ('Bulk Movie 1', 409), ('Horsenado', 404),
+                          ('bulk movie 0', 409), ('Bulk Movie 2', 201)])
+        movie = Movie.objects.get(pk=report[0]['movie_id'])
+        self.assertEqual((movie.title, movie.imdb_votes), ('Bulk Movie 0', 1234))
+        self.assertEqual(Rating.objects.filter(movie=movie).count(), 2)
+        self.assertEqual(len(self.stub.requests), 4)
+
+    def test_bulk_endpoint_invalid(self):
+        for body in ['{"titles": "Bulk Movie 0"}', '[1, 2]', '{"titles": [], "parallelism": 0}', 'x']:
+            response = self.client.post('/api/movies/bulk/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+            self.assertTrue(response.json().get('error'), body)
+
+    def test_import_titles_command(self):
+        """Command imports titles concurrently over keep-alive connections"""
+
+        # Number of queries does not grow with the number of titles (apart from inserts
+        # of ratings, 2 per movie in batches of BULK_BATCH_SIZE rows), the first import
+        # also creates genres, people and version of movies
+        queries = []
+        for start, count in [(0, 10), (10, 10), (20, 100)]:
+            titles_path = os.path.join(self.cache_dir, 'titles.txt')
+            with open(titles_path, 'w') as titles_file:
+                titles_file.write('\n'.join(m['Title'] for m in self.stub_movies[start:start + count]))
+            out = StringIO()
+            self.stub.connections.clear()
+            with CaptureQueriesContext(connection) as captured:
+                call_command('import_titles', titles_path, '--parallelism', '4', '--rate-limit', '0',
+                             '--chunk-size', '100', stdout=out)
+            queries.append(len([q for q in captured if not q['sql'].startswith('INSERT INTO "api_rating"')]))
+            self.assertIn('{0} created'.format(count), out.getvalue())
+            self.assertTrue(len(self.stub.connections) <= 4)
+        self.assertEqual(queries[1], queries[2])
+        self.assertEqual(Movie.objects.count(), 120)
+        self.assertEqual(Rating.objects.count(), 240)
+        self.assertEqual(len(self.stub.requests), 120)
+
+    def test_rate_limit(self):
+        """Requests to OMDB are spread according to the rate limit"""
+
+        started = time.perf_counter()
+        bulk_import_movies(['Bulk Movie {0}'.format(i) for i in range(6)], parallelism=6, rate_limit=20)
+        self.assertTrue(time.perf_counter() - started >= 0.25)
+
+    def test_error_response_discards_connection(self):
+        """Connection closed by OMDB after an error response is not reused"""
+
+        title = self.stub.movies[0]['Title']
+        self.stub.status = 503
+        with self.assertRaises(OMDBError):
+            request_omdb(t=title)
+        self.assertIsNone(omdb._connections.connection)
+        self.stub.status = 200
+        self.assertEqual(request_omdb(t=title)['Title'], title)
+        self.assertEqual(len(self.stub.requests), 2)
+
+
+class LoadOMDBDumpTest(TestCase):
+    """Tests of loading movies from offline OMDB dumps"""
+
+    def setUp(self):
+        self.dump_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dump_dir, ignore_errors=True)
+
+    def write_dump(self, name, records, compress=False):
+        path = os.path.join(self.dump_dir, name)
+        lines = ''.join((json.dumps(r) if isinstance(r, dict) else r) + '\n' for r in records).encode('utf-8')
+        with (gzip.open if compress else open)(path, 'wb') as dump_file:
+            dump_file.write(lines)
+        return path
+
+    def test_load_gzipped_dump(self):
+        """Records are decoded like OMDB responses and upserted on IMDb ID"""
+
+        Movie.objects.create(title='Old Title', imdb_id='tt0000002', plot='Old plot')
+        records = [dict(omdb_movie('Dump Movie 1', 'tt0000001'), BoxOffice='$1,500,000', Rated='N/A'),
+                   omdb_movie('Dump Movie 2', 'tt0000002'),
+                   '{"Title": "Broken',
+                   {'Response': 'False', 'Error': 'Movie not found!'},
+                   dict(omdb_movie('Dump Movie 3', 'tt0000003'), Metascore='high'),
+                   omdb_movie('Dump Movie 1', 'tt0000004'),
+                   dict(omdb_movie('Dump Movie 5', 'tt0000005'),
+                        Ratings=[{'Source': 'Metacritic'}, {'Value': '50/100'},
+                                 {'Source': 'Metacritic', 'Value': None}])]
+        path = self.write_dump('dump.jsonl.gz', records, compress=True)
+        out = StringIO()
+        call_command('load_omdb_dump', path, '--batch-size', '2', stdout=out)
+
+        self.assertIn('7 records', out.getvalue())
+        self.assertIn('2 created, 1 updated, 3 invalid, 1 conflicts', out.getvalue())
+        self.assertIn('Peak RSS', out.getvalue())
+        movie = Movie.objects.get(imdb_id='tt0000001')
+        self.assertEqual((movie.title, movie.box_office, movie.rated, movie.imdb_votes, movie.released),
+                         ('Dump Movie 1', 1500000, None, 1234, date(1990, 7, 1)))
+        self.assertEqual(Rating.objects.filter(movie=movie).count(), 2)
+        updated = Movie.objects.get(imdb_id='tt0000002')
+        self.assertEqual((updated.title, updated.plot), ('Dump Movie 2', None))
+        # Ratings without a source or value are skipped
+        self.assertFalse(Rating.objects.filter(movie__imdb_id='tt0000005').exists())
+        self.assertEqual(Movie.objects.count(), 3)
+
+        # Loading the dump again replaces ratings instead of adding them,
+        # payloads of the batch are rendered once
+        with CaptureQueriesContext(connection) as queries:
+            call_command('load_omdb_dump', path, stdout=StringIO())
+        self.assertEqual(Movie.objects.count(), 3)
+        self.assertEqual(Rating.objects.count(), 4)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('DELETE FROM "api_moviepayload"')]), 1)
+
+    def test_resume_from_checkpoint(self):
+        """Loading resumes after the last written batch"""
+
+        path = self.write_dump('dump.jsonl', [omdb_movie('Dump Movie {0}'.format(i), 'tt{0:07d}'.format(i))
+                                              for i in range(5)])
+        checkpoint = os.path.join(self.dump_dir, 'checkpoint')
+        with open(path, 'rb') as dump_file:
+            second_line = len(dump_file.readline())
+        call_command('load_omdb_dump', path, '--offset', str(second_line), '--batch-size', '2',
+                     '--checkpoint', checkpoint, stdout=StringIO())
+        self.assertEqual(sorted(Movie.objects.values_list('imdb_id', flat=True)),
+                         ['tt0000001', 'tt0000002', 'tt0000003', 'tt0000004'])
+        with open(checkpoint) as checkpoint_file:
+            self.assertEqual(int(checkpoint_file.read()), os.path.getsize(path))
+
+        # Nothing is left to load past the checkpoint
+        out = StringIO()
+        call_command('load_omdb_dump', path, '--checkpoint', checkpoint, stdout=out)
+        self.assertIn('Loaded 0 records', out.getvalue())
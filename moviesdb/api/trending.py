@@ -0,0 +1,208 @@
+import heapq
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Comment
+
+# Window of trending movies in minutes or hours, e.g. 30m or 1h
+WINDOW_PATTERN = re.compile(r'^(\d+)([mh])$')
+DEFAULT_TRENDING_WINDOW = '1h'
+
+# Number of trending movies listed when the limit parameter is not provided
+DEFAULT_TRENDING_LIMIT = 10
+
+# Number of (window, limit) rankings kept between writes
+MAX_CACHED_RANKINGS = 100
+
+# Number of comments counted by warm up at a time
+WARM_UP_CHUNK_SIZE = 1000
+
+
+class TrendingError(ValueError):
+    pass
+
+
+def parse_window(window, max_window):
+    """Number of minutes of the window parameter (e.g. 30m or 1h)"""
+    match = WINDOW_PATTERN.match(window or '')
+    minutes = int(match.group(1)) * (60 if match.group(2) == 'h' else 1) if match else 0
+    if not 0 < minutes <= max_window:
+        raise TrendingError("The window parameter should be a number of minutes or hours (e.g. 30m or 1h) "
+                            "of at most {0} minutes.".format(max_window))
+    return minutes
+
+
+class TrendingCounter:
+    """
+    Numbers of comments of movies in the last max_window minutes kept
+    in a ring buffer of per-minute buckets, each counting comments of movies
+    commented on in that minute. Buckets of minutes which have passed out
+    of the window are reused, so memory is bounded by the window
+    and the number of movies commented on within it.
+    """
+
+    def __init__(self, max_window, clock=time.time):
+        self.max_window = max_window
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.minutes = [None] * max_window
+        self.buckets = [Counter() for _ in range(max_window)]
+
+        # Sums of buckets of windows ending in the current minute (updated
+        # by writes) and rankings of windows (kept until the next write)
+        self.totals = {}
+        self.rankings = {}
+        self.totals_minute = None
+
+        # IDs of comments counted by warm up (kept until they have passed
+        # out of the window) and of comments recorded while it runs
+        self.warming = False
+        self.warmed = set()
+        self.warmed_minute = None
+        self.recorded = set()
+
+    def now(self):
+        return int(self.clock() // 60)
+
+    def begin_warm_up(self):
+        """Keep IDs of recorded comments, so the warm up does not count them again"""
+        with self.lock:
+            self.warming = True
+
+    def warm_up(self, comment_rows):
+        """
+        Count comments from an iterable of (comment ID, movie ID, added) rows,
+        except the ones recorded since begin_warm_up(). Rows are counted
+        in chunks, so recording is not held up until all of them are read.
+        """
+        self.begin_warm_up()
+        comment_rows = iter(comment_rows)
+        while True:
+            chunk = list(islice(comment_rows, WARM_UP_CHUNK_SIZE))
+            with self.lock:
+                for pk, movie_id, added in chunk:
+                    if pk not in self.recorded:
+                        self._add(movie_id, added, 1)
+                        self.warmed.add(pk)
+                if not chunk:
+                    self.warming, self.recorded, self.warmed_minute = False, set(), self.now()
+                    return
+
+    def add(self, comments, sign=1):
+        """Count created (sign=1) or deleted (sign=-1) comments"""
+        with self.lock:
+            if self.warmed and self.now() - self.warmed_minute >= self.max_window:
+                # Comments counted by warm up have passed out of the window
+                self.warmed = set()
+            for comment in comments:
+                if comment.pk in self.warmed:
+                    # Creation of the comment was counted by warm up
+                    if sign > 0:
+                        continue
+                    self.warmed.discard(comment.pk)
+                elif self.warming:
+                    # Comment deleted before warm up has read it is not counted at all
+                    created = comment.pk in self.recorded
+                    self.recorded.add(comment.pk)
+                    if sign < 0 and not created:
+                        continue
+                self._add(comment.movie_id, comment.added, sign)
+
+    def _add(self, movie_id, added, count):
+        minute = int(added.timestamp() // 60)
+        now = self.now()
+        # Comments dated in the future (e.g. created in bulk with their time)
+        # would take the bucket of a minute within the window
+        if minute <= now - self.max_window or minute > now:
+            return
+        slot = minute % self.max_window
+        if self.minutes[slot] != minute:
+            # Bucket of a minute which passed out of the window is reused,
+            # comments of the minute before the bucket's one have expired
+            if self.minutes[slot] is not None and self.minutes[slot] > minute:
+                return
+            self.minutes[slot] = minute
+            self.buckets[slot] = Counter()
+        self.buckets[slot][movie_id] += count
+        for window, totals in self.totals.items():
+            if self.totals_minute - window < minute <= self.totals_minute:
+                totals[movie_id] += count
+        self.rankings.clear()
+
+    def top(self, window, limit):
+        """
+        List of (movie ID, number of comments) pairs of movies
+        with the most comments in the last window minutes
+        """
+        now = self.now()
+        with self.lock:
+            if self.totals_minute != now or len(self.rankings) > MAX_CACHED_RANKINGS:
+                self.totals, self.rankings, self.totals_minute = {}, {}, now
+            ranking = self.rankings.get((window, limit))
+            if ranking is None:
+                totals = self.totals.get(window)
+                if totals is None:
+                    totals = Counter()
+                    for minute, bucket in zip(self.minutes, self.buckets):
+                        if minute is not None and now - window < minute <= now:
+                            totals.update(bucket)
+                    self.totals[window] = totals
+                ranking = heapq.nlargest(limit, ((m, c) for m, c in totals.items() if c > 0),
+                                         key=lambda item: (item[1], -item[0]))
+                self.rankings[(window, limit)] = ranking
+            return ranking
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_trending_counter():
+    """
+    Counter of comments of trending movies of this process, warmed up
+    from the comments table on first use (see api.signals, it is used
+    on the first request). Comments are recorded by the counter while
+    it is warmed up, so the ones committed meanwhile are not missed.
+    """
+    global _counter
+    with _counter_lock:
+        if _counter is None:
+            counter = TrendingCounter(settings.TRENDING_MAX_WINDOW)
+            counter.begin_warm_up()
+            _counter = counter
+            since = datetime.fromtimestamp((counter.now() - counter.max_window + 1) * 60, timezone.utc)
+            counter.warm_up(Comment.objects.filter(added__gte=since)
+                                           .values_list('pk', 'movie_id', 'added').iterator())
+        return _counter
+
+
+def record_comments(comments, sign=1):
+    """
+    Count created (sign=1) or deleted (sign=-1) comments once their
+    transaction is committed, unless the counter has not been used yet
+    (it is then warmed up with the committed comments)
+    """
+    def record():
+        if _counter is not None:
+            _counter.add(comments, sign)
+    transaction.on_commit(record)
+
+
+def trending_movies(window, limit):
+    """
+    List of dictionaries each containing movie ID, number of comments
+    in the last window minutes and dense rank of the movie by that number
+    """
+    ranking, rank, previous = [], 0, None
+    for movie_id, count in get_trending_counter().top(window, limit):
+        if count != previous:
+            rank, previous = rank + 1, count
+        ranking.append({'movie_id': movie_id, 'total_comments': count, 'rank': rank})
+    return ranking
@@ -3,6 +3,13 @@ from . import views
 
 urlpatterns = [
     path('movies/', views.movies),
+    path('movies/bulk/', views.movies_bulk),
     path('comments/', views.comments),
-    path('top/', views.top)
+    path('comments/bulk/', views.comments_bulk),
+    path('jobs/<int:job_id>/', views.jobs),
+    path('top/', views.top),
+    path('trending/', views.trending),
+    path('search/', views.search),
+    path('export/<str:name>/', views.export),
+    path('_stats/', views.stats)
 ]
@@ -0,0 +1,97 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.timezone import now
+from django.views.decorators.http import condition
+
+from .models import ResourceVersion, comment_day
+
+# Keys of versioned resources
+MOVIES = 'movies'
+COMMENTS = 'comments'
+
+# Comments counted in days which have passed (e.g. added with a past date
+# or deleted), the only comments changing rankings of past date ranges
+PAST_COMMENTS = 'comments:past'
+
+
+def movie_comments_key(movie_id):
+    """Key of the resource of comments of the movie"""
+    return '{0}:{1}'.format(COMMENTS, movie_id)
+
+
+def comments_version_keys(comments):
+    """Keys of the resources changed by writes of the comments"""
+    today = comment_day(now())
+    keys = [COMMENTS] + [movie_comments_key(c.movie_id) for c in comments]
+    if any(comment_day(c.added) < today for c in comments):
+        keys.append(PAST_COMMENTS)
+    return keys
+
+
+def bump_versions(keys):
+    """
+    Increment versions of the resources, to be called
+    in the same transaction as the writes to them
+    """
+    updated = now()
+    with transaction.atomic():
+        for key in sorted(set(keys)):
+            versions = ResourceVersion.objects.filter(key=key)
+            if versions.update(version=F('version') + 1, updated=updated):
+                continue
+
+            # The first write to the resource creates its version,
+            # unless a concurrent transaction has just created it
+            try:
+                with transaction.atomic():
+                    ResourceVersion.objects.create(key=key, version=1, updated=updated)
+            except IntegrityError:
+                versions.update(version=F('version') + 1, updated=updated)
+
+
+def get_versions(request, keys):
+    """
+    List of (version, last update) of the resources, fetched once per request
+    in a single query. Resources never written to have version 0 and no last update.
+    """
+    cache = request.__dict__.setdefault('_resource_versions', {})
+    missing = [key for key in keys if key not in cache]
+    if missing:
+        cache.update({key: (0, None) for key in missing})
+        cache.update((key, (version, updated)) for key, version, updated
+                     in ResourceVersion.objects.filter(key__in=missing).values_list('key', 'version', 'updated'))
+    return [cache[key] for key in keys]
+
+
+def version_token(request, keys):
+    """
+    String identifying the current versions of the resources.
+    Time of the last update tells apart versions with the same number
+    (e.g. after the database has been recreated).
+    """
+    return '-'.join('{0}.{1}.{2}'.format(key, version, int(updated.timestamp() * 1e6) if updated else 0)
+                    for key, (version, updated) in zip(keys, get_versions(request, keys)))
+
+
+def versioned(keys_func):
+    """
+    Decorator of views answering GET requests with ETag and Last-Modified
+    of the resources named by keys_func(request) and 304 Not Modified
+    if the client has their current version, in a single query.
+    keys_func returns None for requests not answered conditionally.
+    """
+    def get_keys(request):
+        return keys_func(request) if request.method in ('GET', 'HEAD') else None
+
+    def etag(request, *args, **kwargs):
+        keys = get_keys(request)
+        return '"{0}"'.format(version_token(request, keys)) if keys is not None else None
+
+    def last_modified(request, *args, **kwargs):
+        keys = get_keys(request)
+        if keys is None:
+            return None
+        updates = [updated for _, updated in get_versions(request, keys) if updated is not None]
+        return max(updates) if updates else None
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
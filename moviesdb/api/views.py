@@ -1,92 +1,198 @@
 import json
-from datetime import datetime, timedelta
-from urllib.error import URLError
-from urllib.parse import quote_plus
-from urllib.request import urlopen
-
-from django.core.serializers import serialize
-from django.db.models import Count, Q
-from django.http.response import JsonResponse
-from django.utils import timezone
-from moviesdb.secret_keys import OMDB_API_KEY
-
-from .models import Movie, Rating, Comment
-
-
+from functools import partial
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+from django.http.response import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.timezone import now
+
+from .comments import BULK_COMMENTS_MAX_ITEMS, bulk_create_comments
+from .exports import EXPORT_FORMATS, EXPORTS, export_stream, gzip_stream
+from .filters import FilterError, MOVIE_ORDERINGS, filter_movies, get_fields, get_ordering
+from .imports import BULK_IMPORT_MAX_TITLES, bulk_import_movies, import_movie
+from .instrumentation import latency_stats
+from .jobs import enqueue_import, serialize_job
+from .models import COMMENT_COUNTER_FIELDS, Movie, Comment, ImportJob, RANKING_TIMEZONE, comment_day
+from .omdb import get_cache
+from .pagination import (DEFAULT_PAGE_LIMIT, MAX_PAGE_LIMIT, PaginationError, STREAM_CHUNK_SIZE,
+                         get_page_params, get_since_params, is_streamed, keyset_filter, keyset_page, since_page,
+                         streaming_json_response)
+from .payloads import iter_movie_payloads, movie_payloads_array, movie_payloads_page
+from .ranking import rank_movies
+from .response_cache import cached_response, stats as response_cache_stats
+from .routers import replica_reads, replicas
+from .search import SearchError, search_movies
+from .serializers import (comment_field_names, iter_serialized_comments, iter_serialized_movies, movie_field_names,
+                          serialize_comment, serialize_comments, serialize_movies)
+from .trending import DEFAULT_TRENDING_LIMIT, DEFAULT_TRENDING_WINDOW, TrendingError, parse_window, trending_movies
+from .versions import COMMENTS, MOVIES, PAST_COMMENTS, movie_comments_key, versioned
+
+
+def movies_version_keys(request):
+    """
+    Movies are listed with counters of their comments, which change with every
+    comment, unless only other fields are listed and movies are not sorted by them
+    """
+    try:
+        fields = get_fields(request.GET, movie_field_names())
+    except FilterError:
+        fields = None
+    if (fields is None or fields & set(COMMENT_COUNTER_FIELDS)
+            or request.GET.get('order_by', '').lstrip('-') in COMMENT_COUNTER_FIELDS):
+        return [MOVIES, COMMENTS]
+    return [MOVIES]
+
+
+@replica_reads
+@versioned(movies_version_keys)
+@cached_response(movies_version_keys)
 def movies(request):
     """Movies API endpoint - listing and creating movie records"""
 
     # Get list of all movies in the database
+    # (optionally filtered and sorted with query parameters,
+    # paginated with after and limit parameters or streamed,
+    # with only the fields listed by fields parameter)
     if request.method == 'GET':
-        query = Movie.objects.all()
-        response = {'content': [serialize_movie(m) for m in query],
-                    'status': 200}
+        try:
+            query = filter_movies(Movie.objects.all(), request.GET)
+            ordering = get_ordering(request.GET, MOVIE_ORDERINGS)
+            page_params = get_page_params(request, ordering)
+            fields = get_fields(request.GET, movie_field_names())
+        except (FilterError, PaginationError) as e:
+            response = {'content': {'error': str(e)},
+                        'status': 400}
+        else:
+            # Payloads of movies are rendered when the movies are written
+            # and are sent as they are stored
+            if fields is None:
+                if is_streamed(request):
+                    query = paged_query(query, page_params, ordering)
+                    return streaming_json_response(iter_movie_payloads(query, chunk_size=STREAM_CHUNK_SIZE),
+                                                   encoded=True)
+                elif page_params is not None:
+                    return HttpResponse(movie_payloads_page(query, *page_params, ordering=ordering),
+                                        content_type='application/json')
+                else:
+                    return HttpResponse(movie_payloads_array(paged_query(query, None, ordering)),
+                                        content_type='application/json')
+
+            # Only the listed columns are read (and ratings only if listed),
+            # along with the field movies are sorted by, which cursors are made of
+            if ordering is not None:
+                fields.add(ordering[0])
+            if is_streamed(request):
+                query = paged_query(query, page_params, ordering)
+                return streaming_json_response(iter_serialized_movies(query, chunk_size=STREAM_CHUNK_SIZE,
+                                                                      fields=fields))
+            elif page_params is not None:
+                response = {'content': keyset_page(query, partial(serialize_movies, fields=fields), *page_params,
+                                                   id_key='movie_id', ordering=ordering),
+                            'status': 200}
+            else:
+                response = {'content': serialize_movies(paged_query(query, None, ordering), fields=fields),
+                            'status': 200}
         return JsonResponse(response['content'], safe=False, status=response['status'])
 
     # Create new movie record in the database
     # based on the provided title with data fetched from OMDB.
+    # With async parameter the movie is imported in the background.
     if request.method == 'POST':
         title = request.POST.get('title')
+        if title and request.POST.get('async', '').lower() in ('1', 'true', 'yes'):
+            job = enqueue_import(title)
+            response = JsonResponse(serialize_job(job), status=202)
+            response['Location'] = '/api/jobs/{0}/'.format(job.pk)
+            return response
         if title:
-            url = 'http://www.omdbapi.com/?t={title}&r=json&apikey={api_key}'
-            url = url.format(api_key=OMDB_API_KEY, title=quote_plus(title))
-            try:
-                omdb_response_dict = json.load(urlopen(url, timeout=10))
-            except URLError:
-                response = {'content': {'error': "Could not connect to OMDB API."},
-                            'status': 400}
-            else:
-                if omdb_response_dict.get('Response') == "True":
-                    try:
-                        movie = Movie.objects.get(title=omdb_response_dict.get('Title'))
-                    except Movie.DoesNotExist:
-                        movie = None
-                    if movie is None:
-                        new_movie = Movie.create_from_omdb_dict(omdb_response_dict)
-                        new_movie.save()
-
-                        # Along with the movie record create related rating records
-                        for rating_dict in omdb_response_dict.get('Ratings', []):
-                            new_rating = Rating.create_from_rating_dict(new_movie, rating_dict)
-                            new_rating.save()
-
-                        response = {'content': serialize_movie(movie=new_movie),
-                                    'status': 201}
-
-                    else:
-                        response = {'content': {'error': "The movie with this title is in the database."},
-                                    'status': 409}
-                else:
-                    response = {'content': {'error': "The movie with this title was not found."},
-                                'status': 404}
+            response = import_movie(title)
         else:
             response = {'content': {'error': "The title of the movie was not provided."},
                         'status': 400}
         return JsonResponse(response['content'], safe=False, status=response['status'])
 
 
+def movies_bulk(request):
+    """
+    Bulk movies API endpoint - creating movie records for a list of titles
+    with data fetched from OMDB concurrently
+    """
+
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+            titles = data.get('titles') if isinstance(data, dict) else data
+            parallelism = data.get('parallelism') if isinstance(data, dict) else None
+            if not isinstance(titles, list) or not all(isinstance(t, str) and t for t in titles):
+                raise ValueError
+            if parallelism is not None and not (isinstance(parallelism, int) and 0 < parallelism <= 32):
+                raise ValueError
+        except ValueError:
+            response = {'content': {'error': "The request body should be a json list of titles "
+                                             "or an object with titles list (and optional parallelism "
+                                             "between 1 and 32)."},
+                        'status': 400}
+        else:
+            if len(titles) > BULK_IMPORT_MAX_TITLES:
+                response = {'content': {'error': "At most {0} titles can be imported "
+                                                 "in a single request.".format(BULK_IMPORT_MAX_TITLES)},
+                            'status': 400}
+            else:
+                response = {'content': {'results': bulk_import_movies(titles, parallelism=parallelism)},
+                            'status': 200}
+        return JsonResponse(response['content'], safe=False, status=response['status'])
+
+
+def comments_version_keys(request):
+    """Comments are listed either all or of a single movie"""
+    movie_id = request.GET.get('movie_id')
+    if movie_id is None:
+        return [COMMENTS]
+    return [movie_comments_key(int(movie_id))] if movie_id.isdigit() else None
+
+
+@replica_reads
+@versioned(comments_version_keys)
+@cached_response(comments_version_keys)
 def comments(request):
     """Comments API endpoint - listing and creating comments records"""
 
     # Get all comments in the database
-    # (optionally filtered by movie_id parameter)
+    # (optionally filtered by movie_id parameter,
+    # paginated with after and limit parameters or streamed,
+    # or only the ones added since the previous request)
     if request.method == 'GET':
         movie_id = request.GET.get('movie_id')
+        query = Comment.objects.all()
         if movie_id is not None:
-            query = Comment.objects.all().filter(movie=movie_id)
-            if len(query) > 0:
-                response = {'content': [serialize_comment(comment=c) for c in query],
+            query = query.filter(movie=movie_id)
+        try:
+            since_params = get_since_params(request)
+            page_params = get_page_params(request) if since_params is None else None
+            fields = get_fields(request.GET, comment_field_names())
+        except (FilterError, PaginationError) as e:
+            response = {'content': {'error': str(e)},
+                        'status': 400}
+        else:
+            # Polls for new comments run a single query, even if there are none
+            if since_params is not None:
+                response = {'content': since_page(query, partial(serialize_comments, fields=fields), *since_params,
+                                                  id_key='comment_id'),
                             'status': 200}
-            else:
+            elif movie_id is not None and not query.exists():
                 response = {'content': {'error': "No comments for movie with this id were found."},
                             'status': 404}
-        else:
-            query = Comment.objects.all()
-            if len(query) > 0:
-                response = {'content': [serialize_comment(comment=c) for c in query],
+            elif is_streamed(request):
+                return streaming_json_response(iter_serialized_comments(paged_query(query, page_params),
+                                                                        chunk_size=STREAM_CHUNK_SIZE, fields=fields))
+            elif page_params is not None:
+                response = {'content': keyset_page(query, partial(serialize_comments, fields=fields), *page_params,
+                                                   id_key='comment_id'),
                             'status': 200}
             else:
-                response = {'content': [],
+                response = {'content': serialize_comments(query.order_by('pk'), fields=fields),
                             'status': 200}
         return JsonResponse(response['content'], safe=False, status=response['status'])
 
@@ -98,7 +204,10 @@ def comments(request):
         if movie_id is not None and comment_body is not None:
             try:
                 movie = Movie.objects.get(pk=movie_id)
-                comment = Comment.objects.create(movie=movie, comment_body=comment_body)
+
+                # Comment and daily counts of comments are saved together
+                with transaction.atomic():
+                    comment = Comment.objects.create(movie=movie, comment_body=comment_body)
                 response = {'content': serialize_comment(comment),
                             'status': 201}
             except Movie.DoesNotExist:
@@ -110,6 +219,92 @@ def comments(request):
         return JsonResponse(response['content'], safe=False, status=response['status'])
 
 
+def comments_bulk(request):
+    """
+    Bulk comments API endpoint - creating comments for a json list
+    of objects with movie_id, comment_body and optional added time
+    """
+
+    if request.method == 'POST':
+        try:
+            items = json.loads(request.body.decode('utf-8'))
+            if not isinstance(items, list):
+                raise ValueError
+        except ValueError:
+            response = {'content': {'error': "The request body should be a json list of objects "
+                                             "with movie_id, comment_body and optional added time."},
+                        'status': 400}
+        else:
+            if len(items) > BULK_COMMENTS_MAX_ITEMS:
+                response = {'content': {'error': "At most {0} comments can be created "
+                                                 "in a single request.".format(BULK_COMMENTS_MAX_ITEMS)},
+                            'status': 400}
+            else:
+                response = {'content': {'results': bulk_create_comments(items)},
+                            'status': 200}
+        return JsonResponse(response['content'], safe=False, status=response['status'])
+
+
+def jobs(request, job_id):
+    """Jobs API endpoint - status of asynchronous movie import"""
+
+    if request.method == 'GET':
+        try:
+            response = {'content': serialize_job(ImportJob.objects.get(pk=job_id)),
+                        'status': 200}
+        except ImportJob.DoesNotExist:
+            response = {'content': {'error': "The job with this id was not found."},
+                        'status': 404}
+        return JsonResponse(response['content'], safe=False, status=response['status'])
+
+
+def export(request, name):
+    """
+    Export API endpoint - the whole table of movies, comments or ratings
+    streamed as json lines or csv, compressed if the client accepts gzip
+    """
+
+    if request.method == 'GET':
+        export_format = request.GET.get('format', 'ndjson')
+        if name not in EXPORTS:
+            response = {'content': {'error': "The export should be one of: {0}.".format(', '.join(EXPORTS))},
+                        'status': 404}
+        elif export_format not in EXPORT_FORMATS:
+            response = {'content': {'error': "The format parameter should be one of: {0}."
+                                             .format(', '.join(EXPORT_FORMATS))},
+                        'status': 400}
+        else:
+            content = export_stream(name, export_format)
+            gzipped = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+            response = StreamingHttpResponse(gzip_stream(content) if gzipped else content,
+                                             content_type=EXPORT_FORMATS[export_format])
+            response['Content-Disposition'] = 'attachment; filename="{0}.{1}"'.format(name, export_format)
+            response['Vary'] = 'Accept-Encoding'
+            if gzipped:
+                response['Content-Encoding'] = 'gzip'
+            return response
+        return JsonResponse(response['content'], safe=False, status=response['status'])
+
+
+def is_past_range(request):
+    """Whether the date range of the ranking ends before today"""
+    try:
+        return from_iso(request.GET.get('date_end', '')).date() < comment_day(now())
+    except (ValueError, IndexError):
+        return False
+
+
+def top_version_keys(request):
+    """
+    Rankings list movies, including ones without comments.
+    Rankings of past date ranges change only with comments counted in past days.
+    """
+    return [MOVIES, PAST_COMMENTS if is_past_range(request) else COMMENTS]
+
+
+@replica_reads
+@versioned(top_version_keys)
+@cached_response(top_version_keys, lambda request: None if is_past_range(request) else DEFAULT_TIMEOUT)
 def top(request):
     """
     Top API endpoint
@@ -122,41 +317,27 @@ def top(request):
         if date_start and date_end:
             try:
                 date_start = from_iso(date_start)
-                date_end = from_iso(date_end) + timedelta(days=1)
+                date_end = from_iso(date_end)
             except (ValueError, IndexError):
                 response = {'content': {'error': "The date_start and date_end parameters "
                                                  "should be in ISO format "
                                                  "(yyyy-mm-dd, ie. 2019-12-31)."},
                             'status': 400}
             else:
-                if date_start is not None and date_end is not None:
-
-                    # Prepare aggregation only counting comments
-                    # added within specified date range
-                    com_count = Count('comment',
-                                      filter=Q(comment__added__gte=date_start,
-                                               comment__added__lt=date_end))
-                    movies_qs = Movie.objects.annotate(com_count=com_count)
-
-                    # Create list of dictionaries each containing
-                    # movie ID and number of comments
-                    movies_list = [{"movie_id": m.id, "total_comments": m.com_count} for m in movies_qs]
-                    movies_list = sorted(movies_list, key=lambda d: d['total_comments'], reverse=True)
-
-                    # Assign rank to each movie based on number of comments
-                    # Movies with the most number of comments are rated highest
-                    # Movies with the same number of comments have the same rank
-                    min_count = None
-                    current_rank = 0
-                    for movie in movies_list:
-                        if not current_rank:
-                            min_count = movie['total_comments']
-                            current_rank = 1
-                        else:
-                            if movie['total_comments'] < min_count:
-                                current_rank += 1
-                        movie['rank'] = current_rank
-                    response = {'content': movies_list,
+                try:
+                    slice_params = {name: get_int_param(request, name, minimum)
+                                    for name, minimum in (('limit', 1), ('offset', 0),
+                                                          ('min_rank', 1), ('max_rank', 1))}
+                except ValueError:
+                    response = {'content': {'error': "The limit, min_rank and max_rank parameters "
+                                                     "should be positive integers "
+                                                     "and the offset parameter a non-negative integer."},
+                                'status': 400}
+                else:
+                    # Ranking and slicing of the ranked movies
+                    # is computed entirely by the database
+                    slice_params['offset'] = slice_params['offset'] or 0
+                    response = {'content': rank_movies(date_start.date(), date_end.date(), **slice_params),
                                 'status': 200}
         else:
             response = {'content': {'error': "The date_start and date_end parameters must be provided."},
@@ -164,45 +345,98 @@ def top(request):
     return JsonResponse(response['content'], safe=False, status=response['status'])
 
 
-def serialize_movie(movie):
+def trending(request):
     """
-    Custom function to create json response payload
-    consisting of movie details and related ratings
+    Trending API endpoint
+    Getting movie IDs ranked by number of comments in the last minutes or hours
     """
 
-    # Get query sets to be used with django serializer
-    movie_query = Movie.objects.filter(pk=movie.pk)
-    rating_query = Rating.objects.filter(movie=movie)
+    if request.method == 'GET':
+        try:
+            window = parse_window(request.GET.get('window', DEFAULT_TRENDING_WINDOW), settings.TRENDING_MAX_WINDOW)
+        except TrendingError as e:
+            response = {'content': {'error': str(e)},
+                        'status': 400}
+        else:
+            try:
+                limit = get_int_param(request, 'limit', 1) or DEFAULT_TRENDING_LIMIT
+                if limit > MAX_PAGE_LIMIT:
+                    raise ValueError
+            except ValueError:
+                response = {'content': {'error': "The limit parameter should be between 1 and {0}."
+                                                 .format(MAX_PAGE_LIMIT)},
+                            'status': 400}
+            else:
+                # Ranking is computed from comments counted in memory
+                response = {'content': trending_movies(window, limit),
+                            'status': 200}
+        return JsonResponse(response['content'], safe=False, status=response['status'])
 
-    # Movie dict consists of serialized movie's fields and movie_id
-    movie_dict = json.loads(serialize('json', movie_query))[0]['fields']
-    movie_dict.update({'movie_id': json.loads(serialize('json', movie_query))[0]['pk']})
 
-    # Movie ratings is a list of related ratings
-    ratings_list = [q['fields'] for q in json.loads(serialize('json', rating_query))]
-    ratings_list = [{'source': r['source'], 'value': r['value']} for r in ratings_list]
+def search(request):
+    """
+    Search API endpoint
+    Full-text search of movies by title, plot, actors, director and writer
+    """
+
+    if request.method == 'GET':
+        query = request.GET.get('q', '')
+        try:
+            limit = get_int_param(request, 'limit', 1) or DEFAULT_PAGE_LIMIT
+            offset = get_int_param(request, 'offset', 0) or 0
+            if limit > MAX_PAGE_LIMIT:
+                raise ValueError
+        except ValueError:
+            response = {'content': {'error': "The limit parameter should be between 1 and {0} "
+                                             "and the offset parameter a non-negative integer."
+                                             .format(MAX_PAGE_LIMIT)},
+                        'status': 400}
+        else:
+            try:
+                response = {'content': search_movies(query, limit, offset),
+                            'status': 200}
+            except SearchError as e:
+                response = {'content': {'error': str(e)},
+                            'status': 400}
+        return JsonResponse(response['content'], safe=False, status=response['status'])
 
-    # Rating field does not appear if no ratings are related to the movie
-    if ratings_list:
-        movie_dict.update({'ratings': ratings_list})
 
-    # Remove null values
-    movie_dict = {k: v for (k, v) in movie_dict.items() if v is not None}
-    return movie_dict
+def stats(request):
+    """
+    Stats API endpoint
+    Counters of the response cache of this process and of the OMDB cache,
+    percentiles of latencies of endpoints handled by this process
+    and health of replicas of the database, as last checked by it
+    """
+
+    if request.method == 'GET':
+        omdb_cache = get_cache()
+        response = {'content': {'response_cache': response_cache_stats.as_dict(),
+                                'omdb_cache': omdb_cache.stats() if omdb_cache is not None else None,
+                                'endpoints': latency_stats.as_dict(),
+                                'replicas': replicas.as_dict()},
+                    'status': 200}
+        return JsonResponse(response['content'], safe=False, status=response['status'])
 
 
-def serialize_comment(comment):
-    """Custom function to create json response payload for a comment"""
+def get_int_param(request, name, minimum):
+    """Integer value of the optional query parameter not lower than minimum"""
+    value = request.GET.get(name)
+    if not value:
+        return None
+    value = int(value)
+    if value < minimum:
+        raise ValueError("The {0} parameter should not be lower than {1}.".format(name, minimum))
+    return value
 
-    # Get query set to be used with django serializer
-    # and create comment dict from comment's fields
-    comment_query = Comment.objects.filter(pk=comment.pk)
-    comment_dict = json.loads(serialize('json', comment_query))[0]['fields']
-    comment_dict.update({'comment_id': json.loads(serialize('json', comment_query))[0]['pk']})
 
-    # Remove null values
-    comment_dict = {k: v for (k, v) in comment_dict.items() if v is not None}
-    return comment_dict
+def paged_query(query, page_params, ordering=None):
+    """Query set narrowed with the after and limit parameters, if provided"""
+    if page_params is None:
+        return keyset_filter(query, None, ordering) if ordering is not None else query
+    after, limit = page_params
+    query = keyset_filter(query, after, ordering)
+    return query[:limit] if limit else query
 
 
 def from_iso(date_string):
@@ -211,6 +445,6 @@ def from_iso(date_string):
         return datetime(day=int(date_string.split('-')[2]),
                         month=int(date_string.split('-')[1]),
                         year=int(date_string.split('-')[0]),
-                        tzinfo=timezone.get_fixed_timezone(timedelta(hours=2)))
+                        tzinfo=RANKING_TIMEZONE)
     except Exception as e:
         raise e
@@ -0,0 +1,41 @@
+"""
+Benchmarks of the API run against a separate, temporary database.
+Run them from the directory containing manage.py, e.g.:
+
+    python -m benchmarks.bench_top --movies 100000
+"""
+import os
+import tempfile
+import time
+
+
+def setup_django(db_name=None, migrate=True):
+    """
+    Configure django to use a fresh sqlite database
+    (a temporary file unless db_name is provided) and migrate it
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'moviesdb.settings')
+    from django.conf import settings
+    if db_name is None:
+        db_name = os.path.join(tempfile.mkdtemp(prefix='moviesdb-bench-'), 'bench.sqlite3')
+    settings.DATABASES['default']['NAME'] = db_name
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['testserver']
+
+    import django
+    django.setup()
+    if migrate:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+    return db_name
+
+
+def timed(func, repeat=5):
+    """Best wall clock time of repeated function calls in seconds and the last result"""
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
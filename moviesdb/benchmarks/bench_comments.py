@@ -0,0 +1,66 @@
+"""
+Benchmark of comment creation: comments per second created
+by /api/comments/bulk/ requests compared with single comment
+POST requests to /api/comments/.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks import setup_django
+
+
+def populate(movies):
+    from api.models import Movie
+
+    Movie.objects.bulk_create((Movie(title='Movie {0}'.format(i)) for i in range(movies)), batch_size=500)
+    return list(Movie.objects.values_list('pk', flat=True))
+
+
+def comment_items(movie_ids, count, days):
+    """Comments of random movies added within the last days"""
+    latest = datetime.utcnow()
+    return [{'movie_id': random.choice(movie_ids), 'comment_body': 'Comment {0}'.format(i),
+             'added': (latest - timedelta(seconds=random.randrange(days * 24 * 3600))).isoformat() + 'Z'}
+            for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--movies', type=int, default=1000)
+    parser.add_argument('--comments', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=10000, help="Comments per bulk request")
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--single', type=int, default=500, help="Comments created by single requests")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import Client
+    from api.rollups import find_comment_rollup_mismatches
+
+    random.seed(0)
+    movie_ids = populate(args.movies)
+    client = Client()
+
+    items = comment_items(movie_ids, args.comments, args.days)
+    started = time.perf_counter()
+    for start in range(0, len(items), args.batch):
+        response = client.post('/api/comments/bulk/', json.dumps(items[start:start + args.batch]),
+                               content_type='application/json')
+        assert response.status_code == 200, response.content
+    elapsed = time.perf_counter() - started
+    print("bulk requests of {0} comments: {1:.0f} comments/s ({2} comments in {3:.2f} s)".format(
+        args.batch, args.comments / elapsed, args.comments, elapsed))
+
+    started = time.perf_counter()
+    for _ in range(args.single):
+        client.post('/api/comments/', {'movie_id': random.choice(movie_ids), 'comment_body': 'Comment'})
+    elapsed = time.perf_counter() - started
+    print("single requests: {0:.0f} comments/s".format(args.single / elapsed))
+    print("rollup mismatches: {0}".format(len(find_comment_rollup_mismatches())))
+
+
+if __name__ == '__main__':
+    main()
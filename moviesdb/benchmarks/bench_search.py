@@ -0,0 +1,87 @@
+"""
+Benchmark of /api/search/ full-text search: latency of BM25-ranked
+queries over the FTS5 index compared with the former approach
+of filtering the whole list of movies on the client.
+"""
+import argparse
+import itertools
+import random
+
+from benchmarks import setup_django, timed
+
+# Vocabulary of synthetic titles and plots with Zipf distributed frequencies,
+# the first words are the most frequent ones
+WORDS = ['the', 'of', 'love', 'night', 'dead', 'space', 'robot', 'monster', 'city', 'girl', 'war', 'house',
+         'planet', 'zombie', 'island', 'wizard', 'desert', 'vampire', 'detective', 'ocean', 'train', 'dragon']
+WORDS += ['word{0}'.format(i) for i in range(20000)] + ['mushroom', 'carnival', 'stripper']
+CUM_WEIGHTS = list(itertools.accumulate(1 / (i + 1) for i in range(len(WORDS))))
+NAMES = ['John', 'Jane', 'Akira', 'Kumi', 'Ray', 'Mona', 'Tom', 'Edward', 'Cetin', 'Sharon', 'Brett', 'Kenji']
+SURNAMES = ['Doe', 'Roe', 'Kubo', 'Mizuno', 'Steckler', 'McKinnon', 'Keene', 'Wood', 'Inanc', 'Walsh']
+
+QUERIES = ['mushroom', 'word1234', 'robot monster', 'zom', 'steckler carnival', 'the', 'the dead']
+
+
+def zipf_words(count):
+    return ' '.join(random.choices(WORDS, cum_weights=CUM_WEIGHTS, k=count))
+
+
+def names(count):
+    return ', '.join('{0} {1}'.format(random.choice(NAMES), random.choice(SURNAMES)) for _ in range(count))
+
+
+def populate(movies):
+    from django.db import transaction
+    from api.models import Movie
+    from api.search import rebuild_search_index
+
+    with transaction.atomic():
+        Movie.objects.bulk_create((Movie(title='{0} movie {1}'.format(zipf_words(3), i),
+                                         plot=zipf_words(30),
+                                         actors=names(4), director=names(1), writer=names(2))
+                                   for i in range(movies)),
+                                  batch_size=500)
+    rebuild_search_index()
+
+
+def client_filter(query):
+    """Former approach: the whole list is fetched and filtered by the client"""
+    from api.models import Movie
+    from api.serializers import serialize_movies
+
+    words = query.lower().split()
+    return [m for m in serialize_movies(Movie.objects.all())
+            if all(any(w in m.get(f, '').lower() for f in ('title', 'plot', 'actors', 'director', 'writer'))
+                   for w in words)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--movies', type=int, default=1000000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--compare', action='store_true',
+                        help="Also time filtering of the whole list (slow for many movies)")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import Client
+    from api.search import search_movies
+
+    random.seed(0)
+    populate(args.movies)
+    client = Client()
+
+    print("{0} movies, {1} results per page".format(args.movies, args.limit))
+    for query in QUERIES:
+        search_time, result = timed(lambda: search_movies(query, args.limit), args.repeat)
+        http_time, _ = timed(lambda: client.get('/api/search/', {'q': query, 'limit': args.limit}), args.repeat)
+        print("{0:20} search: {1:7.2f} ms, GET /api/search/: {2:7.2f} ms ({3} results{4})".format(
+            repr(query), search_time * 1000, http_time * 1000, len(result['results']),
+            ', more' if result['next_offset'] else ''))
+    if args.compare:
+        filter_time, _ = timed(lambda: client_filter(QUERIES[0]), 1)
+        print("whole list filtered on the client: {0:.1f} ms".format(filter_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
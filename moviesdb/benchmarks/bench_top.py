@@ -0,0 +1,95 @@
+"""
+Benchmark of /api/top/ ranking: the baseline Python sorting and ranking
+of movies annotated with a count over the comments table
+compared with the DENSE_RANK() window over daily counts of comments.
+"""
+import argparse
+import random
+from datetime import date, datetime, timedelta
+
+from benchmarks import setup_django, timed
+
+
+def populate(movies, comments, days):
+    from django.db import transaction
+    from api.models import Movie, Comment, RANKING_TIMEZONE
+    from api.rollups import rebuild_comment_rollup
+
+    first_day = datetime(2019, 7, 1, tzinfo=RANKING_TIMEZONE)
+    with transaction.atomic():
+        Movie.objects.bulk_create((Movie(title='Movie {0}'.format(i)) for i in range(movies)), batch_size=500)
+        movie_ids = list(Movie.objects.values_list('pk', flat=True))
+        Comment.objects.bulk_create(
+            (Comment(movie_id=random.choice(movie_ids), comment_body='Comment',
+                     added=first_day + timedelta(seconds=random.randrange(days * 24 * 3600)))
+             for _ in range(comments)),
+            batch_size=300)
+    rebuild_comment_rollup()
+
+
+def old_top(date_start, date_end):
+    """
+    Ranking of the baseline top() view, copied as it was before the ranking
+    was moved to the database (including its ranking loop, which ranks every
+    movie with fewer comments than the first one below the previous movie,
+    as min_count is never lowered, instead of ranking equal counts together)
+    """
+    from django.db.models import Count, Q
+    from api.models import Movie
+
+    com_count = Count('comment',
+                      filter=Q(comment__added__gte=date_start,
+                               comment__added__lt=date_end))
+    movies_qs = Movie.objects.annotate(com_count=com_count)
+    movies_list = [{"movie_id": m.id, "total_comments": m.com_count} for m in movies_qs]
+    movies_list = sorted(movies_list, key=lambda d: d['total_comments'], reverse=True)
+    min_count = None
+    current_rank = 0
+    for movie in movies_list:
+        if not current_rank:
+            min_count = movie['total_comments']
+            current_rank = 1
+        else:
+            if movie['total_comments'] < min_count:
+                current_rank += 1
+        movie['rank'] = current_rank
+    return movies_list
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--movies', type=int, default=100000)
+    parser.add_argument('--comments', type=int, default=300000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from api.models import RANKING_TIMEZONE
+    from api.ranking import rank_movies
+
+    random.seed(0)
+    populate(args.movies, args.comments, args.days)
+    day_start, day_end = date(2019, 7, 1), date(2019, 7, 7)
+    date_start = datetime(2019, 7, 1, tzinfo=RANKING_TIMEZONE)
+    date_end = datetime(2019, 7, 8, tzinfo=RANKING_TIMEZONE)
+
+    old_time, old_result = timed(lambda: old_top(date_start, date_end), args.repeat)
+    new_time, new_result = timed(lambda: rank_movies(day_start, day_end), args.repeat)
+    top_time, top_result = timed(lambda: rank_movies(day_start, day_end, limit=10), args.repeat)
+
+    # Numbers of comments of movies are compared regardless of the order of ties
+    # (ranks differ, as the baseline does not rank equal counts together)
+    def counts(result):
+        return sorted((m['movie_id'], m['total_comments']) for m in result)
+    assert counts(old_result) == counts(new_result)
+    assert top_result == new_result[:10]
+
+    print("{0} movies, {1} comments".format(args.movies, args.comments))
+    print("baseline (Count over comments, ranking in Python): {0:8.1f} ms".format(old_time * 1000))
+    print("new (DENSE_RANK over daily counts):                {0:8.1f} ms".format(new_time * 1000))
+    print("new, top 10 only:                                  {0:8.1f} ms".format(top_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark of concurrent writes: comments per second created by processes
+POSTing to /api/comments/ while other processes list movies, and the number
+of requests failed with "database is locked", with the default settings
+and with the production sqlite profile (moviesdb/settings_production.py).
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from benchmarks import setup_django
+
+CONFIGURATIONS = [
+    ('default', 'moviesdb.settings'),
+    ('production', 'moviesdb.settings_production'),
+]
+
+
+def prepare(settings_module, db_name, movies):
+    """Migrate the database and create movies to comment on"""
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    setup_django(db_name)
+    from api.models import Movie
+
+    Movie.objects.bulk_create((Movie(title='Movie {0}'.format(i)) for i in range(movies)), batch_size=500)
+
+
+def work(settings_module, db_name, role, seconds, seed):
+    """
+    Send requests of the role (writer or reader) for the number of seconds.
+    Returns the numbers of successful and locked requests.
+    """
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    setup_django(db_name, migrate=False)
+    from django.db import OperationalError
+    from django.test import Client
+    from api.models import Movie
+
+    random.seed(seed)
+    movie_ids = list(Movie.objects.values_list('pk', flat=True))
+    client = Client()
+    done = locked = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            if role == 'writer':
+                response = client.post('/api/comments/', {'movie_id': random.choice(movie_ids),
+                                                          'comment_body': 'Comment'})
+                assert response.status_code == 201, response.content
+            else:
+                response = client.get('/api/movies/', {'limit': 50, 'ordering': '-comment_count'})
+                assert response.status_code == 200, response.content
+            done += 1
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            locked += 1
+    return role, done, locked
+
+
+def run(name, settings_module, args):
+    db_name = os.path.join(tempfile.mkdtemp(prefix='moviesdb-bench-'), 'bench.sqlite3')
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        pool.apply(prepare, (settings_module, db_name, args.movies))
+
+    roles = ['writer'] * args.writers + ['reader'] * args.readers
+    with context.Pool(len(roles)) as pool:
+        results = pool.starmap(work, [(settings_module, db_name, role, args.seconds, seed)
+                                      for seed, role in enumerate(roles)])
+
+    for role in ('writer', 'reader'):
+        done = sum(r[1] for r in results if r[0] == role)
+        locked = sum(r[2] for r in results if r[0] == role)
+        print("{0}: {1} {2}s {3:.0f} requests/s, {4} locked ({5:.1%})".format(
+            name, len([r for r in results if r[0] == role]), role, done / args.seconds,
+            locked, locked / (done + locked) if done + locked else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--movies', type=int, default=1000)
+    parser.add_argument('--writers', type=int, default=4, help="Processes creating comments")
+    parser.add_argument('--readers', type=int, default=4, help="Processes listing movies")
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--config', choices=[name for name, _ in CONFIGURATIONS],
+                        help="Run only one configuration")
+    args = parser.parse_args()
+
+    for name, settings_module in CONFIGURATIONS:
+        if args.config in (None, name):
+            run(name, settings_module, args)
+
+
+if __name__ == '__main__':
+    main()
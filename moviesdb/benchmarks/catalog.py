@@ -0,0 +1,99 @@
+"""
+Synthetic catalogs of movies with Zipf-distributed comments,
+generated reproducibly from a seed. Movies are loaded the same way
+as OMDB dumps, so genres, people, ratings, payloads and the search index
+are written as for real movies.
+"""
+import io
+import itertools
+import json
+import random
+from datetime import timedelta
+
+# Scales of catalogs (numbers of movies and comments)
+SCALES = {
+    'tiny': (1000, 10000),
+    'small': (10000, 100000),
+    'medium': (100000, 1000000),
+    'large': (1000000, 3000000),
+}
+
+GENRES = ['Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Family',
+          'Fantasy', 'Horror', 'Musical', 'Mystery', 'Romance', 'Sci-Fi', 'Thriller', 'War', 'Western']
+
+WORDS = ['night', 'house', 'return', 'monster', 'city', 'love', 'dead', 'island', 'lost', 'robot',
+         'shadow', 'secret', 'planet', 'river', 'king', 'curse', 'summer', 'ghost', 'storm', 'blood']
+
+# Number of distinct actors and directors of the catalog
+PEOPLE = 5000
+
+# Number of comments inserted in a single transaction
+COMMENTS_BATCH_SIZE = 10000
+
+
+def omdb_record(index, rng):
+    """OMDB record of the synthetic movie with the index"""
+    words = rng.sample(WORDS, 3)
+    rating = round(rng.uniform(1, 10), 1)
+    return {
+        'Title': 'Movie {0} {1}'.format(index, ' '.join(words).title()),
+        'Year': str(rng.randint(1920, 2019)),
+        'Released': '01 Jan 2000',
+        'Runtime': '{0} min'.format(rng.randint(60, 200)),
+        'Genre': ', '.join(rng.sample(GENRES, rng.randint(1, 3))),
+        'Director': 'Director {0}'.format(rng.randrange(PEOPLE)),
+        'Actors': ', '.join('Actor {0}'.format(rng.randrange(PEOPLE)) for _ in range(3)),
+        'Plot': 'A story of the {0} and the {1} in the {2}.'.format(*words),
+        'imdbRating': str(rating),
+        'imdbVotes': '{0:,}'.format(rng.randrange(100000)),
+        'imdbID': 'tt{0:08d}'.format(index),
+        'Ratings': [{'Source': 'Internet Movie Database', 'Value': '{0}/10'.format(rating)},
+                    {'Source': 'Rotten Tomatoes', 'Value': '{0}%'.format(rng.randrange(101))}],
+        'Response': 'True',
+    }
+
+
+def zipf_weights(count, exponent):
+    """Cumulative weights of ranks 1..count of Zipf distribution"""
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def generate_catalog(movies, comments, days=30, zipf=1.1, seed=0, now=None):
+    """
+    Create movies and comments added within the last days, the number
+    of comments of the n-th most popular movie proportional to 1/n^zipf.
+    Popularity of movies is shuffled, so it does not follow their IDs.
+    Returns the description of the catalog with IDs of movies by popularity.
+    """
+    from django.db import transaction
+    from django.utils import timezone
+    from api.dumps import load_omdb_dump
+    from api.models import Comment, Movie
+    from api.rollups import rebuild_comment_counters, rebuild_comment_rollup
+
+    rng = random.Random(seed)
+    dump = io.BytesIO(b''.join(json.dumps(omdb_record(i, rng)).encode('utf-8') + b'\n'
+                               for i in range(movies)))
+    load_omdb_dump(dump)
+    del dump
+
+    movie_ids = list(Movie.objects.order_by('pk').values_list('pk', flat=True))
+    rng.shuffle(movie_ids)
+    weights = zipf_weights(len(movie_ids), zipf)
+    now = now or timezone.now()
+    span = days * 24 * 3600
+    for start in range(0, comments, COMMENTS_BATCH_SIZE):
+        count = min(COMMENTS_BATCH_SIZE, comments - start)
+        picks = rng.choices(movie_ids, cum_weights=weights, k=count)
+        with transaction.atomic():
+            Comment.objects.bulk_create(
+                (Comment(movie_id=movie_id, comment_body='Comment {0}'.format(start + i),
+                         added=now - timedelta(seconds=rng.randrange(span)))
+                 for i, movie_id in enumerate(picks)),
+                batch_size=300)
+
+    # Bulk inserts of comments do not update derived data
+    rebuild_comment_rollup()
+    rebuild_comment_counters()
+    return {'movies': len(movie_ids), 'comments': comments, 'days': days, 'zipf': zipf, 'seed': seed,
+            'movie_ids': movie_ids}
@@ -0,0 +1,46 @@
+"""Local HTTP server answering like OMDB API with a movie for any title"""
+import itertools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+
+class StubOMDBServer:
+    """OMDB API stub run in a thread, each title is a new movie"""
+
+    def __init__(self):
+        ids = itertools.count(90000000)
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            # Headers and body are written separately, which would be delayed
+            # on kept-alive connections by Nagle's algorithm
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                params = dict(parse_qsl(urlparse(self.path).query))
+                body = json.dumps({
+                    'Title': params.get('t', ''), 'Year': '2000', 'Runtime': '90 min', 'Genre': 'Drama',
+                    'Director': 'Stub Director', 'Actors': 'Stub Actor', 'imdbRating': '5.0',
+                    'imdbVotes': '1,000', 'imdbID': 'tt{0}'.format(next(ids)),
+                    'Ratings': [{'Source': 'Internet Movie Database', 'Value': '5.0/10'}],
+                    'Response': 'True'}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{0}/'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
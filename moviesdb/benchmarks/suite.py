@@ -0,0 +1,336 @@
+"""
+Benchmark suite of the API endpoints: timed scenarios of requests
+against a synthetic catalog, sent through the Django test client
+and to a WSGI server. Latency percentiles, query counts (read from
+Server-Timing headers) and peak memory of requests are written to a json
+results file, which can be compared with a baseline of an earlier run:
+
+    python -m benchmarks.suite --scale small --output baseline.json
+    python -m benchmarks.suite --scale small --output results.json --baseline baseline.json
+
+The comparison exits with status 1 if any scenario has regressed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import timedelta
+from http.client import HTTPConnection
+from socketserver import ThreadingMixIn
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from benchmarks import setup_django
+from benchmarks.catalog import SCALES, generate_catalog
+from benchmarks.stub_omdb import StubOMDBServer
+
+TRANSPORTS = ('client', 'wsgi')
+
+# Requests of each scenario measured with tracemalloc (which slows them down)
+MEMORY_SAMPLES = 5
+
+# Metrics compared with the baseline: allowed relative increase is the tolerance,
+# except for query counts, which should not increase at all
+LATENCY_METRICS = ('p50_ms', 'p95_ms')
+MEMORY_METRIC = 'peak_memory_bytes'
+QUERY_METRIC = 'queries_max'
+
+
+class Scenarios:
+    """Requests of the scenarios, drawn reproducibly for the catalog"""
+
+    def __init__(self, catalog, rng, prefix):
+        from django.utils import timezone
+        from api.models import Genre, RANKING_TIMEZONE
+        from benchmarks.catalog import WORDS, zipf_weights
+
+        self.rng = rng
+        self.movie_ids = catalog['movie_ids']
+        self.weights = zipf_weights(len(self.movie_ids), catalog['zipf'])
+        self.genres = list(Genre.objects.values_list('key', flat=True))
+        self.words = WORDS
+        self.today = timezone.localtime(timezone.now(), RANKING_TIMEZONE).date()
+        self.prefix = prefix
+        self.posted = 0
+
+    def popular_movie(self):
+        return self.rng.choices(self.movie_ids, cum_weights=self.weights)[0]
+
+    def top(self, days):
+        start = self.today - timedelta(days=days - 1)
+        return 'GET', '/api/top/', {'date_start': start.isoformat(), 'date_end': self.today.isoformat()}
+
+    def all(self):
+        """Map of scenario names to functions returning (method, path, params) of a request"""
+        return {
+            'movies_page': lambda: ('GET', '/api/movies/', {'after': self.rng.choice(self.movie_ids),
+                                                            'limit': 100}),
+            'movies_filtered': lambda: ('GET', '/api/movies/', {'genre': self.rng.choice(self.genres),
+                                                                'order_by': '-imdb_rating', 'limit': 50}),
+            'movies_popular': lambda: ('GET', '/api/movies/', {'order_by': '-comment_count', 'limit': 50}),
+            'comments_by_movie': lambda: ('GET', '/api/comments/', {'movie_id': self.popular_movie(),
+                                                                    'limit': 100}),
+            'top_day': lambda: self.top(1),
+            'top_week': lambda: self.top(7),
+            'top_month': lambda: self.top(30),
+            'trending': lambda: ('GET', '/api/trending/', {'window': self.rng.choice(['15m', '1h', '24h'])}),
+            'search': lambda: ('GET', '/api/search/', {'q': self.rng.choice(self.words), 'limit': 20}),
+            'comments_post': lambda: ('POST', '/api/comments/', {'movie_id': self.popular_movie(),
+                                                                 'comment_body': 'Benchmark comment'}),
+            'movies_post': self.movie_post,
+        }
+
+    def movie_post(self):
+        # Titles are new (also in databases of earlier runs),
+        # so each request fetches a movie from the stub OMDB server
+        self.posted += 1
+        return 'POST', '/api/movies/', {'title': 'Benchmark {0} Movie {1} {2}'.format(
+            self.prefix, uuid.uuid4().hex, self.posted)}
+
+
+class ClientTransport:
+    """Requests sent through the Django test client"""
+
+    name = 'client'
+
+    def __init__(self):
+        from django.test import Client
+        self.client = Client()
+
+    def request(self, method, path, params):
+        if method == 'GET':
+            response = self.client.get(path, params)
+        else:
+            response = self.client.post(path, params)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code, response.get('Server-Timing', '')
+
+    def close(self):
+        pass
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class WSGITransport:
+    """Requests sent over HTTP to a WSGI server of the application run in a thread"""
+
+    name = 'wsgi'
+
+    def __init__(self):
+        from django.core.wsgi import get_wsgi_application
+        self.server = make_server('127.0.0.1', 0, get_wsgi_application(),
+                                  server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def request(self, method, path, params):
+        # wsgiref servers close the connection after each response
+        connection = HTTPConnection('127.0.0.1', self.server.server_port, timeout=60)
+        try:
+            if method == 'GET':
+                connection.request('GET', path + '?' + urlencode(params))
+            else:
+                connection.request('POST', path, urlencode(params),
+                                   {'Content-Type': 'application/x-www-form-urlencoded'})
+            response = connection.getresponse()
+            response.read()
+            return response.status, response.getheader('Server-Timing', '')
+        finally:
+            connection.close()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def query_count(server_timing):
+    """Number of SQL queries of the request from its Server-Timing header"""
+    for metric in server_timing.split(', '):
+        name, *params = metric.split(';')
+        if name == 'db':
+            desc = dict(param.split('=', 1) for param in params).get('desc', '"0 queries"')
+            return int(desc.strip('"').split()[0])
+    return None
+
+
+def run_scenario(transport, make_request, requests, warmup):
+    """Latency percentiles, query counts and peak memory of the scenario's requests"""
+    from api.instrumentation import LATENCY_PERCENTILES, percentile
+
+    for _ in range(warmup):
+        transport.request(*make_request())
+
+    # Client errors are valid responses (e.g. 404 for movies without comments)
+    latencies, queries, client_errors, errors = [], [], 0, 0
+    for _ in range(requests):
+        method, path, params = make_request()
+        started = time.perf_counter()
+        status, server_timing = transport.request(method, path, params)
+        latencies.append(time.perf_counter() - started)
+        queries.append(query_count(server_timing))
+        client_errors += 400 <= status < 500
+        errors += status >= 500
+
+    # Peak of memory allocated by Python during a request
+    # (of the whole process, including the server thread).
+    # Tracing starts anew for each request, so the peak is that of the request
+    # (tracemalloc.reset_peak() is not available before Python 3.9).
+    peak_memory = 0
+    for _ in range(MEMORY_SAMPLES):
+        tracemalloc.start()
+        try:
+            transport.request(*make_request())
+            peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    latencies.sort()
+    counted = [q for q in queries if q is not None]
+    result = {'requests': requests, 'client_errors': client_errors, 'errors': errors,
+              'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+              'queries_mean': round(sum(counted) / len(counted), 2) if counted else None,
+              'queries_max': max(counted) if counted else None,
+              'peak_memory_bytes': peak_memory}
+    for p in LATENCY_PERCENTILES:
+        result['p{0}_ms'.format(p)] = round(percentile(latencies, p) * 1000, 3)
+    return result
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """
+    List of regressions of the results against the baseline:
+    latencies and peak memory higher by more than the tolerance
+    (and latencies by more than min_delta_ms), more queries or server errors
+    """
+    regressions = []
+    for name, result in sorted(results['scenarios'].items()):
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            continue
+        for metric in LATENCY_METRICS:
+            if (result[metric] > base[metric] * (1 + tolerance)
+                    and result[metric] - base[metric] > min_delta_ms):
+                regressions.append((name, metric, base[metric], result[metric]))
+        if result[MEMORY_METRIC] > base[MEMORY_METRIC] * (1 + tolerance):
+            regressions.append((name, MEMORY_METRIC, base[MEMORY_METRIC], result[MEMORY_METRIC]))
+        if None not in (result[QUERY_METRIC], base[QUERY_METRIC]) and result[QUERY_METRIC] > base[QUERY_METRIC]:
+            regressions.append((name, QUERY_METRIC, base[QUERY_METRIC], result[QUERY_METRIC]))
+        if result['errors'] > base['errors']:
+            regressions.append((name, 'errors', base['errors'], result['errors']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--movies', type=int, help="Number of movies (overrides the scale)")
+    parser.add_argument('--comments', type=int, help="Number of comments (overrides the scale)")
+    parser.add_argument('--days', type=int, default=30, help="Comments are added within the last days")
+    parser.add_argument('--zipf', type=float, default=1.1, help="Exponent of Zipf distribution of comments")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', help="Database file, the catalog is generated only if it does not exist "
+                                     "(comments are added relative to the time it was generated)")
+    parser.add_argument('--requests', type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument('--warmup', type=int, default=20, help="Unmeasured requests per scenario")
+    parser.add_argument('--scenario', action='append', help="Run only the scenario (repeatable)")
+    parser.add_argument('--transport', action='append', choices=TRANSPORTS, help="Only this transport")
+    parser.add_argument('--response-cache', action='store_true',
+                        help="Keep the response cache enabled (disabled to measure the endpoints)")
+    parser.add_argument('--output', help="Json file the results are written to")
+    parser.add_argument('--baseline', help="Json results file of an earlier run to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed relative increase of latencies and memory")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help="Latency increases below this number of milliseconds are not regressions")
+    args = parser.parse_args()
+
+    movies, comments = SCALES[args.scale]
+    movies, comments = args.movies or movies, args.comments or comments
+    existing = args.db is not None and os.path.exists(args.db)
+    db_name = setup_django(args.db)
+
+    import django
+    from django.conf import settings
+    from django.utils import timezone
+
+    settings.ALLOWED_HOSTS = ['testserver', '127.0.0.1']
+    if not args.response_cache:
+        settings.RESPONSE_CACHE = None
+
+    # Description of a generated catalog is kept next to its database file
+    started = time.perf_counter()
+    if existing:
+        with open(args.db + '.catalog.json', encoding='utf-8') as catalog_file:
+            catalog = json.load(catalog_file)
+    else:
+        catalog = generate_catalog(movies, comments, args.days, args.zipf, args.seed)
+        if args.db is not None:
+            with open(args.db + '.catalog.json', 'w', encoding='utf-8') as catalog_file:
+                json.dump(catalog, catalog_file)
+    print("catalog of {0} movies ready in {1:.1f} s ({2})".format(catalog['movies'], time.perf_counter() - started,
+                                                                  db_name))
+
+    stub = StubOMDBServer()
+    settings.OMDB_API_URL = stub.url
+    settings.OMDB_CACHE = dict(settings.OMDB_CACHE, PATH=None)
+
+    results = {
+        'meta': {'catalog': {k: v for k, v in catalog.items() if k != 'movie_ids'},
+                 'requests': args.requests, 'response_cache': args.response_cache,
+                 'python': platform.python_version(), 'django': django.get_version(),
+                 'sqlite': sqlite3.sqlite_version, 'started': timezone.now().isoformat()},
+        'scenarios': {},
+    }
+    try:
+        for transport_class in (ClientTransport, WSGITransport):
+            if args.transport and transport_class.name not in args.transport:
+                continue
+            transport = transport_class()
+            scenarios = Scenarios(catalog, random.Random(args.seed), transport.name)
+            try:
+                for name, make_request in scenarios.all().items():
+                    if args.scenario and name not in args.scenario:
+                        continue
+                    key = '{0}:{1}'.format(transport.name, name)
+                    result = run_scenario(transport, make_request, args.requests, args.warmup)
+                    results['scenarios'][key] = result
+                    print("{0:30} p50 {1:8.2f} ms  p95 {2:8.2f} ms  p99 {3:8.2f} ms  queries {4}  "
+                          "memory {5:.0f} kB  4xx {6}  5xx {7}".format(
+                              key, result['p50_ms'], result['p95_ms'], result['p99_ms'], result['queries_max'],
+                              result['peak_memory_bytes'] / 1024, result['client_errors'], result['errors']))
+            finally:
+                transport.close()
+    finally:
+        stub.close()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        for name, metric, before, after in regressions:
+            print("REGRESSION {0} {1}: {2} -> {3}".format(name, metric, before, after))
+        if regressions:
+            sys.exit(1)
+        print("no regressions against {0}".format(args.baseline))
+
+
+if __name__ == '__main__':
+    main()
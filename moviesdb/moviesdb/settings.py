@@ -43,6 +43,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Query counts and timings of requests (Server-Timing header, api/_stats/)
+    'api.middleware.PerformanceMiddleware',
+    # Reads of clients which have just written are not sent to replicas
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,9 +84,35 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': 'mydatabase',
+        # Tests use a database file rather than shared in-memory database,
+        # which does not wait for locks held by other threads
+        'TEST': {
+            'NAME': 'test_mydatabase',
+        },
     }
 }
 
+# Aliases of DATABASES holding read-only copies of the default (primary) database.
+# Reads of api/movies/, api/comments/ and api/top/ are sent to them round-robin,
+# e.g. with 'replica1': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'mydatabase.replica1'}
+# added to DATABASES and copied from the primary with sync_replicas command
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+
+# Seconds between health checks of each replica and the greatest lag (in seconds)
+# of a healthy replica behind the primary
+REPLICA_CHECK_INTERVAL = 5
+REPLICA_MAX_LAG = 30
+
+# Seconds after a write during which reads of the client are sent to the primary.
+# A replica missing the write may be considered healthy until it is older than
+# REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL, so shorter values are raised to that.
+READ_YOUR_WRITES_SECONDS = 36
+
+# PRAGMA statements run on every new sqlite connection, e.g. {'journal_mode': 'wal'}
+# (see moviesdb/settings_production.py for the production profile)
+SQLITE_PRAGMAS = {}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -115,6 +145,67 @@ USE_L10N = True
 
 USE_TZ = True
 
+# Open Movie Database API
+# http://www.omdbapi.com/
+
+OMDB_API_URL = 'http://www.omdbapi.com/'
+
+OMDB_TIMEOUT = 10
+
+# Disk-backed cache of OMDB responses (set PATH to None to disable it)
+# TTL and NEGATIVE_TTL (of "not found" responses) are in seconds
+OMDB_CACHE = {
+    'PATH': os.path.join(BASE_DIR, 'omdb_cache.sqlite3'),
+    'TTL': 7 * 24 * 3600,
+    'NEGATIVE_TTL': 3600,
+    'MAX_ENTRIES': 10000,
+}
+
+# Size of request bodies read at once (bulk comments requests
+# with thousands of comments are larger than the default 2.5 MB)
+DATA_UPLOAD_MAX_MEMORY_SIZE = 16 * 1024 * 1024
+
+# Caches, the responses cache keeps responses of movies, comments
+# and top endpoints (TIMEOUT in seconds, responses of top for past date ranges
+# are kept until evicted). File-based cache (BACKEND
+# 'django.core.cache.backends.filebased.FileBasedCache' with a directory
+# as LOCATION) is shared by processes of the server.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'moviesdb-responses',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
+# Cache of API responses (set ALIAS to None to disable it),
+# responses larger than MAX_ITEM_SIZE bytes are not cached
+RESPONSE_CACHE = {
+    'ALIAS': 'responses',
+    'MAX_ITEM_SIZE': 1024 * 1024,
+}
+
+# Longest window of trending movies in minutes, comments of this many
+# last minutes are counted in memory of each server process
+TRENDING_MAX_WINDOW = 24 * 60
+
+# Number of concurrent OMDB requests of bulk imports
+# and the limit of their rate (requests per second, None for no limit)
+OMDB_BULK_PARALLELISM = 8
+
+OMDB_RATE_LIMIT = 20
+
+# Number of threads importing movies from OMDB asynchronously
+MOVIE_IMPORT_WORKERS = 4
+
+# Import jobs running longer than this number of seconds
+# (e.g. interrupted by a restart) are picked up again
+MOVIE_IMPORT_STALE_AFTER = 60
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
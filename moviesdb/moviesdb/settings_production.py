@@ -0,0 +1,57 @@
+"""
+Production settings of moviesdb: the development settings with debugging
+disabled and sqlite tuned for concurrent requests. Select them with:
+
+    DJANGO_SETTINGS_MODULE=moviesdb.settings_production
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+DEBUG = False
+
+ALLOWED_HOSTS = os.environ.get('MOVIESDB_ALLOWED_HOSTS', '0.0.0.0,localhost').split(',')
+
+# The same tuning applies to the primary database and its replicas
+DATABASES = {
+    alias: dict(
+        database,
+        # Connections are kept open between requests for this number of seconds,
+        # so the PRAGMA statements below run once per connection, not per request
+        CONN_MAX_AGE=600,
+        # Seconds a connection waits for locks held by other connections
+        # before failing with "database is locked" (5 by default)
+        OPTIONS={'timeout': 20},
+    )
+    for alias, database in DATABASES.items()
+}
+
+SQLITE_PRAGMAS = {
+    # Readers do not block the writer and the writer does not block readers,
+    # the mode is stored in the database file
+    'journal_mode': 'wal',
+    # In WAL mode the database stays consistent after a power loss,
+    # only the last transactions may be rolled back
+    'synchronous': 'normal',
+    # Milliseconds, the same as the timeout above
+    'busy_timeout': 20000,
+    # Read the database through memory-mapped I/O (256 MB)
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative values are in KiB (64 MB of page cache per connection)
+    'cache_size': -64 * 1024,
+    'temp_store': 'memory',
+}
+
+# Json lines with query counts and timings of requests
+# logged by api.middleware.PerformanceMiddleware
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.performance': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}